@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*-coding:utf-8 -*-
+'''
+@File    :   benchmark.py
+@Author  :   Gilbert Loiseau
+@Version :   1.0
+@Contact :   loiseau@wisc.edu
+@License :   (C)Copyright 2023, Gilbert Loiseau
+@Desc    :   Timing and memory benchmarks of each stage of the analysis on synthetic exports
+
+Usage: python3 benchmark.py <data_file> <answer_file> [--sizes N ...] [--data-dir DIR] [--baseline FILE] [--save-baseline]
+                            [--legacy-max-rows N] [--bootstrap-max-rows N] [--render-groups N]
+
+This script makes synthetic exports of each size from the real survey csv file (with synthesizeSurvey.py; they are kept in
+the data directory and reused), then times each stage of the analysis on them and measures the peak memory the stage
+allocates. The results are printed as a table next to the saved baseline, if there is one, with the ratio to the baseline.
+Run with --save-baseline to record the results as the new baseline (e.g. before a performance change).
+
+Notes:
+    - Memory is measured in a separate run of each stage with tracemalloc, so that tracing doesn't slow down the timings.
+    - The legacy stage is the old counting path (a dataframe per group, countAnswers and getAnswerCountDf per question), kept
+      to compare against; it and the bootstrap are skipped above their row limits because they get slow (or big) there.
+    - The compact encode stage reads the cache as memory-mapped int8 columns (readCompactSurvey) and encodes them, to compare with
+      cache read plus encode on the dataframe.
+    - The weights stage rakes the respondents to an even population of every role of Q58 (see weights.py); the weighted cube stage
+      then counts with those weights, to compare with the count cube stage.
+    - Rendering doesn't depend on the number of respondents, so it only draws the graphs of the first --render-groups groups.
+'''
+
+import os, json, time, shutil, argparse, platform, tempfile, tracemalloc
+import numpy as np, pandas as pd
+from functions import countAnswers, getAnswerCountDf, getCompareQuestions, plotComparisonGraphs
+from bootstrap import bootstrapIntervals
+from countCube import default_chunk_size, encodeSurvey, buildCountCube
+from groups import default_group_file, readGroupFile, compileGroups
+from ingest import getCacheDir, readSurvey, readSurveyCsv, readCompactSurvey
+from schema import readAnswerKey
+from significance import testGroupDifferences
+from stream import streamSurvey
+from synthesizeSurvey import writeSyntheticSurvey
+from weights import getSurveyWeights
+
+# the number of respondents of each synthetic export
+default_sizes = [1000, 100000, 1000000]
+# the baseline kept next to the answer file
+default_baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmark_baseline.json')
+group_compare_question = ['Q4', 'Q5', 'Q8', 'Q9', 'Q10', 'Q11', 'Q20.0', 'Q21', 'Q30', 'Q56', 'Q39']
+# the question the respondents are raked on in the weights stages, to an even population of every answer
+weight_question = 'Q58'
+
+# HELPER FUNCTIONS FOR BENCHMARKING
+# time a stage, then run it again with tracemalloc to get the peak memory it allocates; returns the result of the timed run
+def measureStage(results, stage, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results[stage] = {'seconds': seconds, 'peak_mb': peak / 2**20}
+    print(f'    {stage:<16} {seconds:10.3f} s {peak / 2**20:10.1f} MB', flush=True)
+    return result
+
+# the old counting path: slice a dataframe for each group and count each compared question with countAnswers
+def countLegacy(df_data, group_masks, schema, questions):
+    for mask in group_masks:
+        df_group = df_data[mask]
+        for question in questions:
+            if question.kind == 'single':
+                getAnswerCountDf(countAnswers(df_group, question.question, question.labels), question.labels, question.offset)
+
+# read the survey through the cache from scratch (parse the csv and write the cache)
+def readSurveyCold(data_file):
+    shutil.rmtree(getCacheDir(data_file), ignore_errors=True)
+    return readSurvey(data_file)
+
+# read the survey as compact columns and encode it, without ever building the float64 dataframe
+def encodeCompactSurvey(data_file, schema):
+    return encodeSurvey(readCompactSurvey(data_file), schema)
+
+# get margins with the same population for every answer of a question, to rake the synthetic exports to
+def getEvenMargins(schema, q):
+    return pd.DataFrame({'Question': q, 'Answer': schema[q].labels, 'Population': 1})
+
+# get the synthetic export with n_rows respondents, making it the first time it is needed
+def getSyntheticSurvey(df_template, schema, n_rows, data_dir):
+    data_file = os.path.join(data_dir, f'survey_{n_rows}.csv')
+    if not os.path.exists(data_file):
+        os.makedirs(data_dir, exist_ok=True)
+        writeSyntheticSurvey(df_template, schema, data_file, n_rows)
+    return data_file
+
+# run every stage on one export
+def benchmarkSurvey(data_file, schema, df_groups, args):
+    results = {}
+    df_data = measureStage(results, 'parse csv', readSurveyCsv, data_file)
+    measureStage(results, 'cache write', readSurveyCold, data_file)
+    df_data = measureStage(results, 'cache read', readSurvey, data_file)
+    group_index = measureStage(results, 'compile groups', compileGroups, df_data, df_groups)
+    group_names = group_index.getNames()
+    group_masks = [np.ones(len(df_data), dtype=bool)] + [group_index.getMask(group) for group in group_names]
+    questions = getCompareQuestions(schema, group_compare_question)
+    if len(df_data) <= args.legacy_max_rows:
+        measureStage(results, 'legacy counts', countLegacy, df_data, group_masks, schema, questions)
+    encoded = measureStage(results, 'encode', encodeSurvey, df_data, schema)
+    measureStage(results, 'compact encode', encodeCompactSurvey, data_file, schema)
+    cube = measureStage(results, 'count cube', buildCountCube, encoded, group_masks, ['All'] + group_names)
+    weights = measureStage(results, 'weights', getSurveyWeights, df_data, schema, getEvenMargins(schema, weight_question))
+    measureStage(results, 'weighted cube', buildCountCube, encoded, group_masks, ['All'] + group_names, default_chunk_size, weights)
+    measureStage(results, 'stream', streamSurvey, data_file, schema, df_groups, group_names)
+    measureStage(results, 'significance', testGroupDifferences, cube, list(schema), [(group, 'Rest') for group in group_names])
+    if len(df_data) <= args.bootstrap_max_rows:
+        measureStage(results, 'bootstrap', bootstrapIntervals, encoded, group_masks, ['All'] + group_names, 1000)
+    with tempfile.TemporaryDirectory() as output_dir:
+        measureStage(results, 'render', plotComparisonGraphs, cube, schema, group_compare_question, group_names[:args.render_groups], output_dir, 1, False)
+    return results
+
+# print the results of each size next to the baseline
+def printComparison(results, baseline):
+    print(f'{"rows":>9} {"stage":<16} {"seconds":>10} {"baseline":>10} {"ratio":>7} {"peak MB":>9} {"baseline":>9}')
+    for size, stages in results.items():
+        for stage, result in stages.items():
+            base = baseline.get(size, {}).get(stage)
+            base_seconds = f'{base["seconds"]:10.3f}' if base else f'{"-":>10}'
+            ratio = f'{result["seconds"] / base["seconds"]:7.2f}' if base and base['seconds'] > 0 else f'{"-":>7}'
+            base_peak = f'{base["peak_mb"]:9.1f}' if base else f'{"-":>9}'
+            print(f'{size:>9} {stage:<16} {result["seconds"]:10.3f} {base_seconds} {ratio} {result["peak_mb"]:9.1f} {base_peak}')
+
+# Start main
+if __name__ == '__main__':
+    # read in the command line options
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data_file') # real survey data file, the template for the synthetic exports
+    parser.add_argument('answer_file') # answer file
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes) # numbers of respondents to benchmark
+    parser.add_argument('--data-dir', default='synthetic') # directory of the synthetic exports
+    parser.add_argument('--group-file', default=default_group_file) # csv file with the groups of respondents
+    parser.add_argument('--baseline', default=default_baseline_file) # json file with the baseline results
+    parser.add_argument('--save-baseline', action='store_true') # record these results as the new baseline
+    parser.add_argument('--legacy-max-rows', type=int, default=100000) # largest export to run the old counting path on
+    parser.add_argument('--bootstrap-max-rows', type=int, default=100000) # largest export to bootstrap
+    parser.add_argument('--render-groups', type=int, default=1) # number of groups to draw the comparison graphs of
+    args = parser.parse_args()
+
+    schema = readAnswerKey(args.answer_file)
+    df_groups = readGroupFile(args.group_file)
+    df_template = pd.read_csv(args.data_file, sep=',', header=0)
+
+    results = {}
+    for n_rows in args.sizes:
+        print(f'{n_rows} respondents', flush=True)
+        data_file = getSyntheticSurvey(df_template, schema, n_rows, args.data_dir)
+        results[str(n_rows)] = benchmarkSurvey(data_file, schema, df_groups, args)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    printComparison(results, baseline)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__, 'cpus': os.cpu_count(),
+                       'results': results}, f, indent=1)
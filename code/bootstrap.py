@@ -0,0 +1,125 @@
+import numpy as np, pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# number of bootstrap replicates when none is given
+default_replicates = 10000
+# upper limit on (replicates x respondents) resampled at once, which bounds the memory of each batch
+max_batch_size = 1 << 22
+
+# HELPER CLASSES FOR BOOTSTRAP INTERVALS
+# the lower and upper bounds of the percentage of every answer slot of a count cube, for each group and for the rest of each group
+class PercentIntervals:
+    def __init__(self, lower, upper, groups, items, confidence):
+        self.lower = lower
+        self.upper = upper
+        self.groups = list(groups)
+        self.items = items
+        self.confidence = confidence
+
+    # get the (lower, upper) percentage bounds of each answer of an item for a group (or for everyone not in the group if rest is true)
+    def getIntervals(self, group, item, rest=False):
+        start, stop = self.items[item]
+        g = self.groups.index(f'{group} Rest' if rest else group)
+        return self.lower[g, start:stop], self.upper[g, start:stop]
+
+# HELPER FUNCTIONS FOR BOOTSTRAPPING
+# get the (respondent x answer slot) indicator matrix of the given rows of the encoded data
+def getOneHot(encoded, rows):
+    slots = encoded.getSlotMatrix(rows)
+    one_hot = np.zeros((slots.shape[0], encoded.n_slots), dtype=np.float32)
+    row_idx, col_idx = np.nonzero(slots >= 0)
+    np.add.at(one_hot, (row_idx, slots[row_idx, col_idx]), 1)
+    return one_hot
+
+# get the first slot and number of slots of every item, in slot order
+def getItemRanges(items):
+    ranges = sorted(items.values())
+    return np.array([start for start, _ in ranges]), np.array([stop - start for start, stop in ranges])
+
+# resample the respondents of one group n_replicates times and get the percentage of every answer slot within its item for each replicate
+def getBootstrapPercents(one_hot, item_starts, item_lengths, n_replicates, seed):
+    rng = np.random.default_rng(seed)
+    n_rows = one_hot.shape[0]
+    # one row of resampled respondent indices per replicate, turned into how many times each respondent was drawn
+    idx = rng.integers(0, n_rows, size=(n_replicates, n_rows))
+    flat = (np.arange(n_replicates)[:, None] * n_rows + idx).ravel()
+    weights = np.bincount(flat, minlength=n_replicates * n_rows).reshape(n_replicates, n_rows).astype(np.float32)
+    # the answer counts of every replicate in one matrix product, then the percentage of each answer within its item
+    counts = weights @ one_hot
+    totals = np.repeat(np.add.reduceat(counts, item_starts, axis=1), item_lengths, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return counts / totals * 100
+
+# get the q quantile of every column of the replicates, leaving out replicates where the item had no answers (NaN);
+# sorting once and interpolating is much faster than np.nanpercentile, which goes column by column when there are NaNs
+def getQuantiles(percents, q):
+    percents = np.sort(percents, axis=0)
+    n_valid = (~np.isnan(percents)).sum(axis=0)
+    position = q * np.maximum(n_valid - 1, 0)
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, np.maximum(n_valid - 1, 0))
+    low = np.take_along_axis(percents, below[None, :], axis=0)[0]
+    high = np.take_along_axis(percents, above[None, :], axis=0)[0]
+    return np.where(n_valid > 0, low + (high - low) * (position - below), np.nan)
+
+# split the replicates of a group into batches that each resample at most max_batch_size respondents
+def getBatchSizes(n_replicates, n_rows):
+    batch = max(1, min(n_replicates, max_batch_size // max(n_rows, 1)))
+    return [min(batch, n_replicates - start) for start in range(0, n_replicates, batch)]
+
+# DRIVER FUNCTIONS FOR BOOTSTRAPPING
+# get bootstrap percentage intervals for every answer of every item for each group and for the rest of each group;
+# respondents are resampled within each group, and the batches of replicates are spread across a pool of jobs processes;
+# with the weight of every respondent, each resampled respondent counts its weight
+def bootstrapIntervals(encoded, group_masks, group_names, n_replicates=default_replicates, confidence=0.95, jobs=1, seed=0, weights=None):
+    masks = [np.asarray(mask, dtype=bool) for mask in group_masks] + [~np.asarray(mask, dtype=bool) for mask in group_masks]
+    names = list(group_names) + [f'{group} Rest' for group in group_names]
+    item_starts, item_lengths = getItemRanges(encoded.items)
+    # every batch of every group gets its own seed so the results are the same for any number of jobs
+    tasks, task_groups = [], []
+    for g, mask in enumerate(masks):
+        # a group with no respondents (e.g. the rest of 'All') has no interval
+        if not mask.any():
+            continue
+        one_hot = getOneHot(encoded, mask)
+        if weights is not None:
+            one_hot *= weights[mask, None].astype(np.float32)
+        batch_sizes = getBatchSizes(n_replicates, len(one_hot))
+        seeds = np.random.SeedSequence([seed, g]).spawn(len(batch_sizes))
+        for batch_size, batch_seed in zip(batch_sizes, seeds):
+            tasks.append((one_hot, item_starts, item_lengths, batch_size, batch_seed))
+            task_groups.append(g)
+    if jobs <= 1:
+        results = [getBootstrapPercents(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(getBootstrapPercents, *zip(*tasks)))
+    # the interval of each answer is the middle confidence share of its replicate percentages
+    alpha = (1 - confidence) / 2
+    lower = np.full((len(masks), encoded.n_slots), np.nan)
+    upper = np.full((len(masks), encoded.n_slots), np.nan)
+    task_groups = np.array(task_groups)
+    for g in np.unique(task_groups):
+        percents = np.vstack([results[i] for i in np.nonzero(task_groups == g)[0]])
+        lower[g], upper[g] = getQuantiles(percents, alpha), getQuantiles(percents, 1 - alpha)
+    return PercentIntervals(lower, upper, names, encoded.items, confidence)
+
+# write the counts, percentages and bootstrap intervals of every compared question for each group into a csv file,
+# and for the rest of each group if the cube has an 'All' group
+def writeIntervalTable(cube, intervals, questions, group_names, output_file):
+    rows = []
+    for group in group_names:
+        for rest in ([False, True] if 'All' in cube.groups else [False]):
+            for question in questions:
+                items = cube.getMatrixItems(question.question) if question.kind == 'matrix' else [question.question]
+                answers = question.scale if question.kind == 'matrix' else question.labels
+                for item in items:
+                    counts = cube.getRestCounts(group, item) if rest else cube.getCounts(group, item)
+                    lower, upper = intervals.getIntervals(group, item, rest)
+                    n = counts.sum()
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        percents = counts / n * 100
+                    for answer, count, percent, low, high in zip(answers, counts, percents, lower, upper):
+                        rows.append({'Group': f'{group} Rest' if rest else group, 'Question': item, 'Answer': answer, 'Count': count,
+                                     'N': n, 'Percent': percent, 'Lower': low, 'Upper': high})
+    pd.DataFrame(rows).to_csv(output_file, index=False)
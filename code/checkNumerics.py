@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*-coding:utf-8 -*-
+'''
+@File    :   checkNumerics.py
+@Author  :   Gilbert Loiseau
+@Version :   1.0
+@Contact :   loiseau@wisc.edu
+@License :   (C)Copyright 2023, Gilbert Loiseau
+@Desc    :   Regression checks of the statistics (and chart rendering) against fixed examples with known answers
+
+Usage: python3 checkNumerics.py
+
+This script runs the statistics of the analysis on small fixed examples whose answers are known (from statistical tables,
+or worked out exactly), and prints every check that is off. It exits with an error if any check fails, so run it after
+changing any of the statistics:
+    - getChiSquareTail: the 5% and 1% critical values of the chi-square distribution for 1 to 10 degrees of freedom
+    - fisherExactTests: two-sided p-values of 2 x 2 tables with small cells (exact fractions of the hypergeometric distribution)
+    - adjustFalseDiscoveryRate: a worked Benjamini-Hochberg example, with an untested (NaN) p-value
+    - SliderStats.merge: slider answers added in chunks and merged give the same statistics as all of them added at once
+      (and the same counts, means and variances as numpy), with and without weights (and the respondents of weighted answers)
+    - rakeWeights: the weights raked to the margins of two questions reproduce every margin, and average 1
+    - renderBuffers: comparison graphs drawn with one job, with render_jobs jobs and in reverse order are the same bytes, so no chart
+      depends on which chart its process drew first
+'''
+
+import sys
+import numpy as np, pandas as pd
+import render
+from functions import plotComparisonBarGraph, group_comparison_color, other_color
+from significance import getChiSquareTail, fisherExactTests, adjustFalseDiscoveryRate
+from sliderStats import SliderStats
+from weights import rake_tolerance, rakeWeights
+
+# relative tolerance of every check
+tolerance = 1e-9
+# (degrees of freedom, critical value, upper tail probability) from chi-square tables
+chi_square_examples = [(1, 3.841458820694124, 0.05), (2, 5.991464547107979, 0.05), (3, 7.814727903251178, 0.05), (4, 9.487729036781154, 0.05),
+                       (5, 11.070497693516351, 0.05), (6, 12.591587243743977, 0.05), (7, 14.067140449340169, 0.05), (8, 15.50731305586545, 0.05),
+                       (9, 16.918977604620448, 0.05), (10, 18.307038053275146, 0.05), (1, 6.6348966010212145, 0.01), (2, 9.210340371976182, 0.01),
+                       (3, 11.344866730144373, 0.01), (4, 13.276704135987622, 0.01), (5, 15.08627246938899, 0.01)]
+# ([[a, b], [c, d]], two-sided p-value) of Fisher's exact test
+fisher_examples = [([[8, 2], [1, 5]], 5 / 143), ([[3, 1], [1, 3]], 17 / 35), ([[0, 5], [5, 0]], 1 / 126), ([[1, 9], [11, 3]], 41 / 14858),
+                   ([[2, 7], [8, 2]], 1063 / 46189), ([[0, 0], [3, 4]], 1.0)]
+# (p-values, Benjamini-Hochberg q-values)
+fdr_examples = [([0.01, 0.04, np.nan, 0.03, 0.005], [0.02, 0.04, np.nan, 0.04, 0.02]), ([0.5, 0.9, 0.01], [0.75, 0.9, 0.03])]
+# the slider answers are random (with blanks), split into uneven chunks by these row offsets
+slider_seed = 0
+slider_rows = 1000
+slider_splits = [1, 250, 600]
+# target shares of the answers of each raked question (the answer codes of the respondents are random, with blanks)
+rake_margins = [np.array([0.5, 0.3, 0.2]), np.array([0.1, 0.2, 0.3, 0.4])]
+# the comparison graphs drawn by the render check: one answer scale, with titles and group names of very different lengths
+render_answers = ['Strongly disagree', 'Disagree', 'Neither agree nor disagree', 'Somewhat agree', 'Strongly agree', 'I do not know']
+render_titles = ['Q4', 'Individuals from financially disadvantaged backgrounds', 'Women']
+render_groups = ['Male', 'First Generation College', 'LGBTQ+']
+render_jobs = 2
+
+# HELPER FUNCTIONS FOR THE CHECKS
+# get a failure message for every value that is off from its expected value (NaN only matches NaN)
+def getFailures(name, values, expected):
+    values, expected = np.asarray(values, dtype=float), np.asarray(expected, dtype=float)
+    off = ~(np.isclose(values, expected, rtol=tolerance, atol=0) | (np.isnan(values) & np.isnan(expected)))
+    return [f'{name}: got {values[i]!r}, expected {expected[i]!r}' for i in np.nonzero(off.ravel())[0]]
+
+# check the chi-square tail probabilities at the critical values, as one batch and one at a time
+def checkChiSquareTail():
+    df, x, p = (np.array(column) for column in zip(*chi_square_examples))
+    failures = getFailures('getChiSquareTail', getChiSquareTail(x, df), p)
+    for example_df, example_x, example_p in chi_square_examples:
+        failures += getFailures(f'getChiSquareTail({example_x}, {example_df})', [getChiSquareTail(example_x, example_df)], [example_p])
+    return failures
+
+# check Fisher's exact test on the example tables, as one batch
+def checkFisherExactTests():
+    tables = np.array([table for table, _ in fisher_examples], dtype=float)
+    return getFailures('fisherExactTests', fisherExactTests(tables), [p for _, p in fisher_examples])
+
+# check the false discovery rate adjustment of every example
+def checkFalseDiscoveryRate():
+    return [failure for p, q in fdr_examples for failure in getFailures(f'adjustFalseDiscoveryRate({p})', adjustFalseDiscoveryRate(p), q)]
+
+# check that slider statistics added in chunks and merged equal the statistics of all of the answers added at once (pooled), for two
+# overlapping groups; a chunk that leaves a group or a column without answers is merged too
+def checkSliderMerge():
+    rng = np.random.default_rng(slider_seed)
+    block = np.round(rng.uniform(0, 100, (slider_rows, 3)))
+    block[rng.random(block.shape) < 0.2] = np.nan
+    block[:slider_splits[1], 2] = np.nan
+    masks = [np.ones(slider_rows, dtype=bool), rng.random(slider_rows) < 0.3]
+    columns, groups = ['Q13_1', 'Q13_2', 'Q13_3'], ['All', 'Group']
+    failures = []
+    for weights in [None, rng.uniform(0.5, 2, slider_rows)]:
+        pooled = SliderStats(columns, groups)
+        pooled.add(block, masks, weights)
+        merged = SliderStats(columns, groups)
+        for start, stop in zip([0] + slider_splits, slider_splits + [slider_rows]):
+            chunk = SliderStats(columns, groups)
+            chunk.add(block[start:stop], [mask[start:stop] for mask in masks], None if weights is None else weights[start:stop])
+            merged.merge(chunk)
+        weighted = '' if weights is None else ' (weighted)'
+        for name, get in [('n', lambda stats: stats.n), ('means', lambda stats: stats.means), ('variances', lambda stats: stats.getVariances()),
+                          ('histograms', lambda stats: stats.histograms), ('medians', lambda stats: stats.getQuantiles(0.5)),
+                          ('respondents', lambda stats: stats.n if stats.respondents is None else stats.respondents)]:
+            failures += getFailures(f'SliderStats.merge {name}{weighted}', get(merged), get(pooled))
+        # and the pooled statistics themselves against numpy
+        for g, mask in enumerate(masks):
+            answered = ~np.isnan(block[mask])
+            row_weights = np.ones(mask.sum()) if weights is None else weights[mask]
+            n = (answered * row_weights[:, None]).sum(axis=0)
+            failures += getFailures(f'SliderStats n{weighted}', pooled.n[g], n)
+            failures += getFailures(f'SliderStats means{weighted}', pooled.means[g], (np.nan_to_num(block[mask]) * row_weights[:, None]).sum(axis=0) / n)
+            if weights is not None:
+                failures += getFailures('SliderStats respondents (weighted)', pooled.respondents[g], answered.sum(axis=0))
+            if weights is None:
+                failures += getFailures('SliderStats variances', pooled.getVariances()[g], np.nanvar(block[mask], axis=0, ddof=1))
+    return failures
+
+# check that the weights raked to the margins of two questions reproduce both margins among the respondents who answered each
+# (raking only stops within rake_tolerance of them), and that they average 1
+def checkRakeWeights():
+    rng = np.random.default_rng(slider_seed)
+    codes = np.stack([rng.choice(len(targets), slider_rows, p=rng.dirichlet(np.ones(len(targets)))) for targets in rake_margins], axis=1)
+    codes[rng.random(codes.shape) < 0.1] = -1
+    weights = rakeWeights(codes, list(enumerate(rake_margins)))
+    failures = []
+    for column, targets in enumerate(rake_margins):
+        answered = codes[:, column] >= 0
+        shares = np.bincount(codes[answered, column], weights[answered], minlength=len(targets)) / weights[answered].sum()
+        off = np.abs(shares - targets).max()
+        if off > rake_tolerance:
+            failures.append(f'rakeWeights: the shares of question {column} are {shares.tolist()}, expected {targets.tolist()}')
+    return failures + getFailures('rakeWeights mean', [weights.mean()], [1])
+
+# check that the comparison graphs come out the same with one job, with render_jobs jobs and drawn in reverse order (each run starts
+# without chart templates, like a new process), since charts drawn on a template must not depend on the first chart it was built for
+def checkRenderJobs():
+    rng = np.random.default_rng(slider_seed)
+    charts = []
+    for title in render_titles:
+        for group in render_groups:
+            df_count, df_other_count = (pd.DataFrame({'answer': render_answers, 'count': rng.integers(0, 40, len(render_answers))}) for _ in range(2))
+            charts.append((plotComparisonBarGraph, (df_count, df_other_count, title, group, 'Rest', group_comparison_color, other_color, '')))
+    render.process_templates.clear()
+    single = render.renderBuffers(charts)
+    render.process_templates.clear()
+    reverse = render.renderBuffers(charts[::-1])[::-1]
+    pooled = render.renderBuffers(charts, render_jobs)
+    failures = []
+    for name, buffers in [('in reverse order', reverse), (f'with {render_jobs} jobs', pooled)]:
+        failures += [f'renderBuffers: the chart {chart[1][2]}, {chart[1][3]} is different {name}'
+                     for chart, buffer, expected in zip(charts, buffers, single) if buffer != expected]
+    return failures
+
+# every check, in the order they are run
+checks = [checkChiSquareTail, checkFisherExactTests, checkFalseDiscoveryRate, checkSliderMerge, checkRakeWeights, checkRenderJobs]
+
+# Start main
+if __name__ == '__main__':
+    failures = []
+    for check in checks:
+        check_failures = check()
+        print(f'{check.__name__}: {"ok" if len(check_failures) == 0 else f"{len(check_failures)} failed"}')
+        failures += check_failures
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
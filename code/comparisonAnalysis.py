@@ -9,296 +9,121 @@
 @License :   (C)Copyright 2023, Gilbert Loiseau
 @Desc    :   Version of hbarplot for the IPiB survey based on John Ahn's code
 
-Usage: python3 comparisonAnalysis.py <data_file> <answer_file>
+Usage: python3 comparisonAnalysis.py <data_file> <answer_file> [--jobs N] [--group-file FILE] [--groups GROUP ...] [--stream [--chunk-size N]] [--bootstrap N] [--significance [compared|all] | --weights FILE] [--save-wave WAVE [--wave-dir DIR]] [--facet] [--pdf] [--html] [--docx [--outline FILE]] [--profile] [--no-cache]
 
 This script takes in a csv file with the survey data and a csv file with the questions and answers, and
 outputs a bar plot for each question with the answers on the y axis and the count on the x axis.
 The bar plots are saved in a directory called Questions within the current working directory. 
 '''
 
-import sys, os, pandas as pd, numpy as np, matplotlib.pyplot as plt
-
-# define global color palettes
-# bar graph color palette
-default_color = 'teal'
-group_comparison_color = 'navajowhite'
-other_color = 'crimson'
-
-# Functions
-# get the counts for each answer for a given question
-def countAnswers(df, q, answers):
-    # initialize the answer counts output
-    answer_counts = None
-    # check if the question contains a '_'
-    if '_' in q:
-        # get any columns that match the question
-        df_question = df.filter(regex=q)
-        # get the counted data for the question
-        answer_counts = df_question.apply(pd.Series.value_counts).iloc[0]
-        # change the index to the numbered part of the input question
-        answer_counts.index = answer_counts.index.str.split('_').str[1]
-    else:
-        # get the data for the question from the data file
-        df_question = df[q]
-        # get the column values
-        answer_counts = df_question.value_counts()
-    return answer_counts
-
-# make a dataframe with the answers and counts for a given question, replacing index with the respective answer
-def getAnswerCountDf(answer_counts, answers):
-    # sort the answer counts by the index
-    answer_counts = answer_counts.sort_index()
-    # convert the answer count index to a list
-    unique_values = answer_counts.index.tolist()
-    # check the length of the unique values list; if 0, then there are no answers for the question
-    if len(unique_values) == 0:
-        # return an empty dataframe
-        return pd.DataFrame({'answer': [], 'count': []})
-    # get the smallest value in the unique values list; for some reason the survey center defined some answers with higher numbers than others, so this combats that
-    smallest_value = int(min(unique_values))
-    # replace the index of each unique value with its corresponding answer
-    for i, value in enumerate(unique_values):
-        unique_values[i] = answers[int(value)-smallest_value]
-    # check if there are any values that are not in the answers
-    if len(unique_values) != len(answers):
-        # add the missing values to the unique values with a count of 0
-        for i in range(len(answers)):
-            if answers[i] not in unique_values:
-                unique_values.append(answers[i])
-                answer_counts = pd.concat([answer_counts, pd.Series([0], index=[i+1])])
-    # create a new dataframe with the answers and counts
-    output_df = pd.DataFrame({'answer': unique_values, 'count': answer_counts.values})
-    return output_df 
-
-# plot the bar graph for any percentage based questions
-def plotAverageBarGraph(df, question_number, output_dir):
-    plt.title(f'{question_number}', fontsize = 10)
-    plt.xlabel("Average Percent")
-    plt.barh(df['answer'], df['count'], color = default_color)
-    plt.savefig(f'{output_dir}/{question_number}.png', bbox_inches="tight")
-    plt.clf()
-
-# plot the percent bar graph for any total count based questions
-def plotPercentBarGraph(df, question_number, output_dir):
-    s = int(df['count'].sum())
-    df['count'] = df['count'].apply(lambda x: x/s*100)
-    plt.title(f'{question_number}, n={s}', fontsize = 10)
-    plt.xlabel("Percentage")
-    plt.barh(df['answer'], df['count'], color = default_color)
-    plt.xlim(0,100)
-    plt.savefig(f'{output_dir}/{question_number}.png', bbox_inches="tight")
-    plt.clf()
-
-# plot the bar graph for any total count based questions
-def plotBarGraph(df, question_number, output_dir):
-    s = int(df['count'].sum())
-    plt.title(f'{question_number}, n={s}', fontsize = 10)
-    plt.xlabel("Response count")
-    plt.barh(df['answer'], df['count'], color = default_color)
-    plt.savefig(f'{output_dir}/{question_number}.png', bbox_inches="tight")
-    plt.clf()
-
-# gets the average for each answer for a given question; questions 13 and 14 in this version of the survey
-def getAnswerAverage(df):
-    # remove any NAN values
-    df = df.dropna()
-    # get the average for each answer
-    averages = df.mean()
-    # reset the index starting at 1
-    averages = averages.reset_index(drop=True)
-    averages.index = averages.index + 1
-    return averages
-
-# driver function for the analysis
-def analyzeAndPlotGraphs(df_data, df_answers, output_dir):
-    # loop through the questions and answers
-    for q, a in zip(df_answers['Question'], df_answers['Answer']):
-        # separate a (answers column) into a list by the pipe as delimiter
-        answers = a.split('|')
-        # check if the question is question 13 or 14
-        if q == 'Q13_' or q == 'Q14_':
-            df_question = df_data.filter(regex=q)
-            averages = getAnswerAverage(df_question)
-            df_count = getAnswerCountDf(averages, answers)
-            # reverse the dataframe so the answers are in the correct order (the answers are in reverse order in the data file compared to the original survey)
-            df_count = df_count.iloc[::-1]
-            plotAverageBarGraph(df_count, q, output_dir)
-        elif q == 'Q39_':
-            df_question = df_data.filter(regex=q)
-            # hardcoding the list of answers for this question here
-            q39_answers = ['Strongly disagree','Disagree','Neither agree nor disagree','Somewhat agree','Strongly agree','I do not know']
-            # loop through the columns and get the counts for each answer
-            for col in df_question.columns:
-                answer_counts = df_question[col].value_counts()
-                # get the count of the answers
-                df_count = getAnswerCountDf(answer_counts, q39_answers)
-                # get the number after the '_' in the column name
-                col_num = col.split('_')[1]
-                # get the question from the answer file by the column number
-                label = f'Q39_{answers[int(col_num)-1]}'
-                #plotPercentBarGraph(df_count, label, output_dir)
-                plotBarGraph(df_count, label, output_dir)
-        else:
-            # count the answers for the given question
-            answer_counts = countAnswers(df_data, q, answers)
-            df_count = getAnswerCountDf(answer_counts, answers)
-            # reverse the dataframe so the answers are in the correct order (the answers are in reverse order in the data file compared to the original survey)
-            df_count = df_count.iloc[::-1]
-            #plotPercentBarGraph(df_count, q, output_dir)
-            plotBarGraph(df_count, q, output_dir)
-
-def plotComparisonBarGraph(df_count, df_other_count, question_number, label1, label2, color1, color2, output_dir):
-    # plot bar graph vertically of df_count and df_all_count
-    # get the sum of the counts for each dataframe
-    s = int(df_count['count'].sum())
-    s_other = int(df_other_count['count'].sum())
-    # make copies of the dataframes before transforming the counts to percentages
-    df_1 = df_count.copy()
-    df_2 = df_other_count.copy()
-    # get the percentage of each answer for each dataframe
-    df_1['count'] = df_1['count'].apply(lambda x: x/s*100)
-    df_2['count'] = df_2['count'].apply(lambda x: x/s_other*100)
-    plt.ylim(0,100)
-    plt.xticks(rotation=45)
-    plt.title(f'{question_number}, {label1}={s}, {label2}={s_other}', fontsize = 10)
-    plt.ylabel("Percent")
-    bar_width = 0.4
-    plt.bar(df_1['answer'], df_1['count'], color = color1, label=label1, width=-bar_width, align = 'edge')
-    plt.bar(df_2['answer'], df_2['count'], color = color2, label=label2, width=bar_width, align = 'edge')
-    plt.legend()
-    plt.savefig(f'{output_dir}/{label1}_{label2}.png', bbox_inches="tight")
-    plt.clf()
-
-# question 39 is so different that it needs a separate function ... 
-def plotComparisonBarGraph39(df_count, df_other_count, question_number, label1, label2, color1, color2, answer_order, output_dir):
-    # plot bar graph vertically of df_count and df_all_count
-    # get the sum of the counts for each dataframe
-    s = int(df_count['count'].sum())
-    s_other = int(df_other_count['count'].sum())
-    # make copies of the dataframes before transforming the counts to percentages
-    df_1 = df_count.copy()
-    df_2 = df_other_count.copy()
-    # get the percentage of each answer for each dataframe
-    df_1['count'] = df_1['count'].apply(lambda x: x/s*100)
-    df_2['count'] = df_2['count'].apply(lambda x: x/s_other*100)
-
-    # set the index to the answer order (for some reason for a couple categories for question 39 this was not in the correct order, so forcing it here)
-    df_1 = df_1.set_index('answer').reindex(answer_order).reset_index() 
-    plt.ylim(0,100)
-    plt.xticks(rotation=45)
-    plt.title(f'{question_number}, {label1}={s}, {label2}={s_other}', fontsize = 10)
-    plt.ylabel("Percent")
-    bar_width = 0.4
-    plt.bar(df_1['answer'], df_1['count'], color = color1, label=label1, width=-bar_width, align = 'edge')
-    plt.bar(df_2['answer'], df_2['count'], color = color2, label=label2, width=bar_width, align = 'edge')
-    plt.legend()
-    plt.savefig(f'{output_dir}/{label1}_{label2}.png', bbox_inches="tight")
-    plt.clf()
-
-# driver function for the comparison analysis
-def analyzeAndPlotComparisonGraphs(df_allData, df_list, df_answers, question_list, output_list, output_dir):
-    # loop through the questions and answers
-    for df_data, output in zip(df_list, output_list):
-        for q, a in zip(df_answers['Question'], df_answers['Answer']):
-            # separate a (answers column) into a list by the pipe as delimiter
-            answers = a.split('|')
-            if q in question_list:
-                # get the rest of the data that is not in df_data
-                rest_of_data = pd.concat([df_allData, df_data]).drop_duplicates(keep=False)
-                # define the output directory and make it if it doesn't exist
-                out_dir = f'{output_dir}/{q}'
-                os.makedirs(out_dir, exist_ok=True)
-                # count the answers for the given question
-                all_data_counts = countAnswers(df_allData, q, answers)
-                answer_counts = countAnswers(df_data, q, answers)
-                rest_counts = countAnswers(rest_of_data, q, answers)
-                # get the dataframes for the counts
-                df_count = getAnswerCountDf(answer_counts, answers)
-                df_all_count = getAnswerCountDf(all_data_counts, answers)
-                df_rest_count = getAnswerCountDf(rest_counts, answers)
-                # plot the bar graphs
-                plotComparisonBarGraph(df_count, df_all_count, q, output, 'All', group_comparison_color, default_color, out_dir)
-                plotComparisonBarGraph(df_count, df_rest_count, q, output, 'Rest', group_comparison_color, other_color, out_dir)
-            elif q == 'Q39_':
-                # kind of a gross way for how I was able to write this for question 39s many groupings
-                df_question = df_data.filter(regex=q)
-                df_question_all = df_allData.filter(regex=q)
-                df_question_rest = rest_of_data.filter(regex=q)
-                # hardcoding the list of answers for this question here
-                q39_answers = ['Strongly disagree','Disagree','Neutral','Somewhat agree','Strongly agree','I do not know']
-                # loop through the columns and get the counts for each answer
-                for col in df_question.columns:
-                    # count the answers for the given question
-                    all_data_counts = df_question_all[col].value_counts() 
-                    answer_counts = df_question[col].value_counts()
-                    rest_counts = df_question_rest[col].value_counts()
-                    # get the dataframes for the counts
-                    df_count = getAnswerCountDf(answer_counts, q39_answers)
-                    df_all_count = getAnswerCountDf(all_data_counts, q39_answers)
-                    df_rest_count = getAnswerCountDf(rest_counts, q39_answers)
-                    # get the number after the '_' in the column name
-                    col_num = col.split('_')[1]
-                    # get the question from the answer file by the column number
-                    question_label = f'{answers[int(col_num)-1]}'
-                    label = f'Q39_{question_label}'
-                    # define the output directory and make it if it doesn't exist
-                    out_dir = f'{output_dir}/{label}'
-                    os.makedirs(out_dir, exist_ok=True)
-                    # plot the bar graphs
-                    plotComparisonBarGraph39(df_count, df_all_count, question_label, output, 'All', group_comparison_color, default_color, q39_answers, out_dir)
-                    plotComparisonBarGraph39(df_count, df_rest_count, question_label, output, 'Rest', group_comparison_color, other_color, q39_answers, out_dir)
+import os, argparse
+from functions import analyzeAndPlotComparisonGraphs, plotComparisonGraphs, testAndWriteGroupDifferences, getSliderAverages, writeReport
+from docxReport import default_outline_file
+from groups import default_group_file, readGroupFile, compileGroups
+from ingest import readCompactSurvey
+from schema import readAnswerKey
+from stream import default_chunk_size, streamSurvey
+from profiler import startProfiling, profileStage, writeProfileReport
+from waves import default_wave_dir, saveWave
+from weights import readMarginFile, getSurveyWeights
 
 # Start main
 if __name__ == '__main__':
     # read in the command line options
-    data_file = sys.argv[1] # input data file
-    answer_file = sys.argv[2] # answer file (the one in here is self created; in the future, ask for the file of the answers for each question in this format)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data_file') # input data file
+    parser.add_argument('answer_file') # answer file (the one in here is self created; in the future, ask for the file of the answers for each question in this format)
+    parser.add_argument('--jobs', type=int, default=1) # number of processes used to render the graphs
+    parser.add_argument('--group-file', default=default_group_file) # csv file with the Group name and Definition of each group of respondents to compare
+    parser.add_argument('--groups', nargs='+') # groups or combinations of groups to compare (defaults to every group in the group file)
+    parser.add_argument('--stream', action='store_true') # read the data file in chunks instead of all at once (for exports too big for memory)
+    parser.add_argument('--chunk-size', type=int, default=default_chunk_size) # number of respondents per chunk when streaming
+    parser.add_argument('--bootstrap', type=int, default=0) # number of bootstrap replicates for confidence intervals on the comparison graphs (0 for none)
+    parser.add_argument('--significance', nargs='?', const='compared', choices=['compared', 'all']) # test each group for differences on the compared questions (or all questions) and write a ranked table
+    parser.add_argument('--weights') # csv file with the population margins (Question, Answer, Population) to weight the respondents to by raking
+    parser.add_argument('--save-wave') # save the counts of every group as this survey wave (e.g. 2023) for trends across waves
+    parser.add_argument('--wave-dir', default=default_wave_dir) # directory of the stored survey waves
+    parser.add_argument('--facet', action='store_true') # draw one graph per question with a panel per group instead of two graphs per group
+    parser.add_argument('--pdf', dest='pdf', action='store_const', const='comparison.pdf') # draw every graph as a page of comparison.pdf in the output directory
+    parser.add_argument('--html', dest='html', action='store_const', const='comparison.html') # write the counts into comparison.html in the output directory, where the graphs are picked and drawn in the browser, instead of drawing the graphs
+    parser.add_argument('--docx', dest='docx', action='store_const', const='report.docx') # write the charts of the report outline with headings and captions into report.docx in the output directory
+    parser.add_argument('--outline', default=default_outline_file) # csv file with the Section, Question, Title, Group and Other of every chart of the report
+    parser.add_argument('--profile', action='store_true') # time each stage and graph and write a report (<output_dir>_profile.json) with a short summary
+    parser.add_argument('--no-cache', dest='cache', action='store_false') # redraw every graph, even ones unchanged since the last run
+    args = parser.parse_args()
+    if args.stream and args.bootstrap:
+        parser.error('--bootstrap resamples respondents, so it needs the whole data file (not --stream)')
+    if args.stream and args.weights:
+        parser.error('--weights rakes every respondent to the margins, so it needs the whole data file (not --stream)')
+    if args.weights and args.significance:
+        parser.error('--significance tests counts of respondents; weighted counts would make its p-values look more certain than they are, so it can\'t be combined with --weights')
+    if args.html and (args.pdf or args.facet):
+        parser.error('--html writes the counts instead of drawing the graphs, so it can\'t be combined with --pdf or --facet')
+    if args.profile:
+        startProfiling()
+    data_file = args.data_file
+    answer_file = args.answer_file
 
     # define the output directory and make it if it doesn't exist
     output_dir = 'Questions'
     #output_dir = 'Questions_Percent'
     os.makedirs(output_dir, exist_ok=True)
 
-    # read in the data file as a pandas dataframe with all columns as integers
-    df_data = pd.read_csv(data_file, sep=',', header=0)
-    # remove any columns that contain 'TEXT'; this only analyzes the multiple choice questions
-    df_data = df_data.loc[:, ~df_data.columns.str.contains('TEXT')]
-    # read in the answer file as a pandas dataframe
-    df_answers = pd.read_csv(answer_file, sep=',', header=0)
-
-    # analyze and plot the graphs for each individual question of the data
-    #analyzeAndPlotGraphs(df_data, df_answers, output_dir)
-
-    # define the separated groups of answers (hardcoded); if question numbers change in future surveys, will need to change these
-    df_students = df_data[df_data['Q93'] == 1]
-
-    # convert the Q58 column to integers and rid of NaN values
-    df_data['Q58'] = df_data['Q58'].fillna(0)
-    df_data['Q58'] = df_data['Q58'].astype(int)
-
-    # keep only the rows that have a value of 5, 6, 7, 8, or 9 in the Q58 column
-    df_staff = df_data[df_data['Q58'].isin([6,7,9])]
-    df_faculty = df_data[df_data['Q58'].isin([5])]
-    # print the number of staff members
-    df_marginalized = df_data[df_data['Q62'] == 1]
-    df_lgbtq = df_data[df_data['Q61'] == 1]
-    df_first_gen = df_data[df_data['Q63'] == 1]
-    df_international = df_data[df_data['Q64'] == 1]
-    df_male = df_data[df_data['Q60'] == 'Male']
-    df_female = df_data[df_data['Q60'] == 'Female']
-
-    # create a list of the dataframes to loop through
-    df_list = [df_students, df_staff, df_faculty, df_marginalized, df_lgbtq, df_first_gen, df_international, df_male, df_female]
-    # create a list of the output directories to loop through
-    output_list = ['Students', 'Staff', 'Faculty', 'Marginalized', 'LGBTQ+', 'First Generation College', 'International', 'Male', 'Female'] 
+    # read in the answer file and compile it once, and read in the group file as a pandas dataframe
+    with profileStage('read answer key'):
+        schema = readAnswerKey(answer_file)
+        df_groups = readGroupFile(args.group_file)
     group_compare_question = ['Q4', 'Q5', 'Q8', 'Q9', 'Q10', 'Q11', 'Q20.0', 'Q21', 'Q30', 'Q56', 'Q39']
 
-    # analyze and plot the graphs for comparison between above groups
-    analyzeAndPlotComparisonGraphs(df_data, df_list, df_answers, group_compare_question, output_list, output_dir)
-
-    # get the data not found within df_students
-    rest_of_data = df_data[~df_data.isin(df_students)].dropna()
-
+    if args.stream:
+        # count every question for every group chunk by chunk, without reading the whole data file into memory
+        output_list = args.groups or df_groups['Group'].tolist()
+        with profileStage('stream'):
+            cube, averages = streamSurvey(data_file, schema, df_groups, output_list, args.chunk_size)
+        #plotGraphs(cube, averages, schema, output_dir, percent=False, jobs=args.jobs, cache=args.cache)
+        plotComparisonGraphs(cube, schema, group_compare_question, output_list, output_dir, jobs=args.jobs, cache=args.cache, facet=args.facet, pdf=args.pdf, html=args.html)
+        if args.significance:
+            testAndWriteGroupDifferences(cube, schema, group_compare_question, [(output, 'Rest') for output in output_list], args.significance, output_dir)
+    else:
+        # read in the data file as compact columns without the free text columns; the csv is only parsed again if it changed since the last run
+        with profileStage('read data'):
+            df_data = readCompactSurvey(data_file)
+
+        # analyze and plot the graphs for each individual question of the data
+        #analyzeAndPlotGraphs(df_data, schema, output_dir, percent=False, jobs=args.jobs, cache=args.cache)
+
+        # compile the groups of respondents from the group file; if question numbers change in future surveys, change the definitions in there
+        with profileStage('compile groups'):
+            group_index = compileGroups(df_data, df_groups)
+            # create a list of the group names (also the output directories) and their row masks to loop through
+            output_list = args.groups or group_index.getNames()
+            df_list = [group_index.getMask(group, df_data) for group in output_list]
+
+        # weight every respondent to the population margins of the margin file (e.g. the number of people in each role of Q58), so that
+        # groups that answered more often than others don't count for more
+        weights = None
+        if args.weights:
+            with profileStage('weights'):
+                weights = getSurveyWeights(df_data, schema, readMarginFile(args.weights))
+
+        # average the slider questions of every group for the report (the comparison graphs only need the counts)
+        if args.docx:
+            averages = getSliderAverages(df_data, schema, df_list, output_list, weights)
+
+        # analyze and plot the graphs for comparison between above groups
+        cube = analyzeAndPlotComparisonGraphs(df_data, df_list, schema, group_compare_question, output_list, output_dir, jobs=args.jobs, cache=args.cache, bootstrap=args.bootstrap, significance=args.significance, facet=args.facet, pdf=args.pdf, html=args.html, weights=weights)
+
+    # write the report from the counts; its charts are drawn in memory, so only the docx file is written
+    if args.docx:
+        writeReport(cube, averages, schema, args.outline, f'{output_dir}/{args.docx}', jobs=args.jobs)
+
+    # save the counts of this survey as a wave; later waves can then be compared with trendAnalysis.py without reading this data file again
+    if args.save_wave:
+        saveWave(cube, schema, args.save_wave, args.wave_dir)
+
+    # write the profile of the run and print its summary
+    if args.profile:
+        print(writeProfileReport(f'{output_dir}_profile.json'))
     
     # compare the data for the question list
     #for q in df_answers['Question']:
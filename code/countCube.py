@@ -0,0 +1,251 @@
+import numpy as np, pandas as pd
+from ingest import CompactSurvey
+from schema import compileAnswerKey
+
+# number of rows encoded into the cube at once; keeps the (group x row x column) index array bounded for large exports
+default_chunk_size = 65536
+# the names of the count columns of a table of weighted counts, since they aren't numbers of respondents (the respondents are in their own columns)
+weighted_columns = {'Count': 'Weighted Count', 'N': 'Weighted N', 'Other Count': 'Other Weighted Count', 'Other N': 'Other Weighted N'}
+
+# HELPER CLASSES FOR THE COUNT CUBE
+# the survey encoded once into an integer coded matrix: one int8 code per respondent per column (-1 for no answer)
+# every counted item (a question, or a statement of a matrix question) owns a contiguous range of answer slots
+class EncodedSurvey:
+    def __init__(self, codes, columns, column_slots, items, n_slots):
+        self.codes = codes
+        self.columns = columns
+        self.column_slots = column_slots
+        self.items = items
+        self.n_slots = n_slots
+
+    # get the global answer slot for every respondent and column (-1 for no answer)
+    def getSlotMatrix(self, rows=slice(None)):
+        codes = self.codes[rows]
+        return np.where(codes >= 0, codes.astype(np.int64) + self.column_slots, -1)
+
+    # get the items of a matrix question in column order, like CountCube.getMatrixItems
+    def getMatrixItems(self, q):
+        return [item for item in self.items if item.startswith(q) and item != q]
+
+    # get the (respondent x answer) indicator matrix of an item: True where the respondent gave the answer (for a multi-select question,
+    # where they selected the option), set for every column of the item in one assignment
+    def getIndicators(self, item, rows=slice(None)):
+        start, stop = self.items[item]
+        codes = self.codes[rows][:, self.column_slots == start]
+        indicators = np.zeros((codes.shape[0], stop - start), dtype=bool)
+        row_idx, col_idx = np.nonzero(codes >= 0)
+        indicators[row_idx, codes[row_idx, col_idx]] = True
+        return indicators
+
+# the (group x answer slot) counts for every group and every counted item; a weighted cube also keeps the unweighted counts as respondents,
+# so that the real number of respondents can be shown next to weighted percentages (respondents is None when the counts aren't weighted)
+class CountCube:
+    def __init__(self, counts, groups, items, respondents=None):
+        self.counts = counts
+        self.groups = list(groups)
+        self.items = items
+        self.respondents = respondents
+
+    # get the counts for each answer of an item (question or matrix statement) for a given group
+    def getCounts(self, group, item):
+        start, stop = self.items[item]
+        return self.counts[self.groups.index(group), start:stop]
+
+    # get the number of respondents who gave each answer of an item for a given group: the counts themselves unless the cube is weighted
+    def getRespondents(self, group, item):
+        if self.respondents is None:
+            return self.getCounts(group, item)
+        start, stop = self.items[item]
+        return self.respondents[self.groups.index(group), start:stop]
+
+    # get the items of a matrix question (one per statement column, e.g. Q39_1, Q39_2, ...) in column order
+    def getMatrixItems(self, q):
+        return [item for item in self.items if item.startswith(q) and item != q]
+
+    # get the counts for each answer of an item for everyone not in a given group (the complement of the group within all of the data)
+    def getRestCounts(self, group, item, all_group='All'):
+        return self.getCounts(all_group, item) - self.getCounts(group, item)
+
+    # get the number of respondents who gave each answer of an item among everyone not in a given group
+    def getRestRespondents(self, group, item, all_group='All'):
+        return self.getRespondents(all_group, item) - self.getRespondents(group, item)
+
+    # get the (group x statement x answer) counts of a matrix question in one array, with one index into the answer slots of every
+    # statement (all statements share the same answer scale); returns the counts and the statements (items) in column order. With respondents,
+    # the number of respondents instead of the (possibly weighted) counts
+    def getMatrixCounts(self, q, respondents=False):
+        counts = self.respondents if respondents and self.respondents is not None else self.counts
+        items = self.getMatrixItems(q)
+        if len(items) == 0:
+            return np.zeros((len(self.groups), 0, 0), dtype=counts.dtype), items
+        slots = np.array([range(*self.items[item]) for item in items], dtype=np.int64)
+        return counts[:, slots], items
+
+# HELPER FUNCTIONS FOR ENCODING THE DATA
+# get the values of a column to encode: the int8 codes of a code column of a CompactSurvey as they are (missing_code is never a valid
+# answer), without decoding them to floats first; any other column as it is
+def getEncodeValues(df, col):
+    if isinstance(df, CompactSurvey) and df.entries[col]['kind'] == 'code':
+        return df.getValues(col)
+    return df[col]
+
+# encode the data for every counted question in the answer file (or its compiled SurveySchema) into an EncodedSurvey
+def encodeSurvey(df, df_answers):
+    schema = compileAnswerKey(df_answers)
+    code_columns, columns, column_slots, items = [], [], [], {}
+    n_slots = 0
+    for question in schema:
+        q = question.question
+        if question.kind == 'slider':
+            continue
+        if question.kind == 'matrix':
+            # each statement is its own item; all statements share the same answer scale
+            for col in question.getColumns(df.columns):
+                code_columns.append(question.getAnswerIndex(getEncodeValues(df, col)).astype(np.int8))
+                columns.append(col)
+                column_slots.append(n_slots)
+                items[col] = (n_slots, n_slots + question.n_answers)
+                n_slots += question.n_answers
+            continue
+        if question.kind == 'multi':
+            # a selected checkbox counts towards the option numbered after the '_'
+            for col in question.getColumns(df.columns):
+                option = question.getColumnIndex(col)
+                selected = (np.asarray(getEncodeValues(df, col), dtype=float) == 1) & (option < question.n_answers)
+                code_columns.append(np.where(selected, option, -1).astype(np.int8))
+                columns.append(col)
+                column_slots.append(n_slots)
+        else:
+            code_columns.append(question.getAnswerIndex(getEncodeValues(df, q)).astype(np.int8))
+            columns.append(q)
+            column_slots.append(n_slots)
+        items[q] = (n_slots, n_slots + question.n_answers)
+        n_slots += question.n_answers
+    # stack the columns into one int8 matrix with -1 for no answer (each column is made int8 as it is encoded, so no wider matrix is ever built)
+    codes = np.column_stack(code_columns) if code_columns else np.empty((len(df), 0), dtype=np.int8)
+    return EncodedSurvey(codes, columns, np.array(column_slots, dtype=np.int64), items, n_slots)
+
+# get the row mask of each group within the full dataframe; a group is either a boolean row mask (e.g. from a GroupIndex),
+# a dataframe that is a subset of the full data by index, or a view of the full CompactSurvey
+# respondents are matched by row, so the rest of a group is its complement even when two respondents gave identical answers
+def getGroupMask(df_allData, df_data):
+    if isinstance(df_data, pd.DataFrame):
+        return df_allData.index.isin(df_data.index)
+    if isinstance(df_data, CompactSurvey):
+        return df_data.getRowMask()
+    return np.asarray(df_data, dtype=bool)
+
+# get the row mask of each group within the full data (see getGroupMask)
+def getGroupMasks(df_allData, df_list):
+    return [getGroupMask(df_allData, df_data) for df_data in df_list]
+
+# count every answer of every item for every group in one vectorized pass over the encoded data; with the weight of every respondent
+# (e.g. from weights.py), every answer counts its respondent's weight instead of 1 and the counts are weighted sums; the number of
+# respondents is counted alongside them
+def buildCountCube(encoded, group_masks, group_names, chunk_size=default_chunk_size, weights=None):
+    n_groups = len(group_masks)
+    n_rows = encoded.codes.shape[0]
+    membership = np.vstack(group_masks) if n_groups > 0 else np.zeros((0, n_rows), dtype=bool)
+    counts = np.zeros(n_groups * encoded.n_slots, dtype=np.int64 if weights is None else float)
+    respondents = None if weights is None else np.zeros(n_groups * encoded.n_slots, dtype=np.int64)
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        # pair every group with every row it contains, then combine the group and answer slot into one index
+        group_idx, row_idx = np.nonzero(membership[:, start:stop])
+        slots = encoded.getSlotMatrix(slice(start, stop))[row_idx]
+        flat = group_idx[:, None] * encoded.n_slots + slots
+        slot_weights = None if weights is None else np.broadcast_to(weights[start:stop][row_idx, None], slots.shape)[slots >= 0]
+        counts += np.bincount(flat[slots >= 0], slot_weights, minlength=n_groups * encoded.n_slots)
+        if respondents is not None:
+            respondents += np.bincount(flat[slots >= 0], minlength=n_groups * encoded.n_slots)
+    return CountCube(counts.reshape(n_groups, encoded.n_slots), group_names, encoded.items,
+                     None if respondents is None else respondents.reshape(n_groups, encoded.n_slots))
+
+# HELPER FUNCTIONS FOR COUNT TABLES
+# get the items of a question with the title, label (the file or folder name of its graphs) and answers of each: every statement of a
+# matrix question is its own item titled by its statement from the answer file, and any other question is one item
+def getQuestionItems(cube, question):
+    q = question.question
+    if question.kind == 'matrix':
+        items = []
+        for col in cube.getMatrixItems(q):
+            # get the statement from the answer file by the number after the '_' in the column name
+            statement = f'{question.labels[question.getColumnIndex(col)]}'
+            items.append((col, statement, f'{q}{statement}', question.scale))
+        return items
+    return [(q, q, q, question.labels)]
+
+# get the answer slots of the items of the questions in order (every statement of a matrix question is its own item), with the item and
+# answer of each slot and where each item starts and how many answers it has
+def getItemSlots(cube, questions):
+    items, answers, slots, starts, lengths = [], [], [], [], []
+    for question in questions:
+        for item, _, _, question_answers in getQuestionItems(cube, question):
+            if item not in cube.items:
+                continue
+            start, stop = cube.items[item]
+            starts.append(len(slots))
+            lengths.append(stop - start)
+            items += [item] * (stop - start)
+            answers += list(question_answers)
+            slots += range(start, stop)
+    return np.array(items, dtype=object), np.array(answers, dtype=object), np.array(slots, dtype=np.int64), np.array(starts, dtype=np.int64), np.array(lengths, dtype=np.int64)
+
+# get the number of respondents who answered the item of each slot from the (group x slot) counts
+def getItemTotals(counts, starts, lengths):
+    if counts.shape[1] == 0:
+        return counts
+    return np.repeat(np.add.reduceat(counts, starts, axis=1), lengths, axis=1)
+
+# get the counts of a group of the cube for every slot; if rest is true, then the counts are for everyone in 'All' but the group. With
+# respondents, the number of respondents of a weighted cube instead of its weighted counts
+def getGroupSlotCounts(cube, group, slots, rest=False, respondents=False):
+    cube_counts = cube.respondents if respondents and cube.respondents is not None else cube.counts
+    counts = cube_counts[cube.groups.index(group), slots]
+    if rest:
+        return cube_counts[cube.groups.index('All'), slots] - counts
+    return counts
+
+# DRIVER FUNCTIONS FOR COUNT TABLES
+# get the long table of the counts of every answer of the questions for each group: Group, Question (the item), Answer, Count,
+# N (everyone in the group who answered the item) and Percent (NaN if nobody did); a weighted cube gives Weighted Count and Weighted N
+# instead, since they aren't numbers of respondents, and Respondents (the number of respondents in the group who answered the item)
+def getCountTable(cube, questions, groups):
+    items, answers, slots, starts, lengths = getItemSlots(cube, questions)
+    counts = np.vstack([getGroupSlotCounts(cube, group, slots) for group in groups]) if groups else np.zeros((0, len(slots)), dtype=np.int64)
+    n = getItemTotals(counts, starts, lengths)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percents = counts / n * 100
+    df_table = pd.DataFrame({'Group': np.repeat(np.array(groups, dtype=object), len(slots)), 'Question': np.tile(items, len(groups)),
+                             'Answer': np.tile(answers, len(groups)), 'Count': counts.ravel(), 'N': n.ravel(), 'Percent': percents.ravel()})
+    if cube.respondents is None:
+        return df_table
+    respondents = np.vstack([getGroupSlotCounts(cube, group, slots, respondents=True) for group in groups]) if groups else np.zeros((0, len(slots)), dtype=np.int64)
+    df_table.insert(df_table.columns.get_loc('N') + 1, 'Respondents', getItemTotals(respondents, starts, lengths).ravel())
+    return df_table.rename(columns=weighted_columns)
+
+# get the long table comparing every answer of the questions for each (group, other) pair, where other is another group of the cube or
+# 'Rest' for everyone in 'All' but the group: Group, Other, Question, Answer, Count, N, Percent, the same three for the other group,
+# and Difference (the percentage of the group minus the percentage of the other group, in percentage points); a weighted cube gives weighted
+# counts and N (labeled as weighted) with Respondents and Other Respondents, like getCountTable
+def getComparisonTable(cube, questions, pairs):
+    items, answers, slots, starts, lengths = getItemSlots(cube, questions)
+    tables = []
+    for group, other in pairs:
+        counts = np.vstack([getGroupSlotCounts(cube, group, slots), getGroupSlotCounts(cube, group, slots, rest=True) if other == 'Rest' else getGroupSlotCounts(cube, other, slots)])
+        n = getItemTotals(counts, starts, lengths)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            percents = counts / n * 100
+        df_table = pd.DataFrame({'Group': group, 'Other': other, 'Question': items, 'Answer': answers, 'Count': counts[0], 'N': n[0], 'Percent': percents[0],
+                                 'Other Count': counts[1], 'Other N': n[1], 'Other Percent': percents[1], 'Difference': percents[0] - percents[1]})
+        if cube.respondents is not None:
+            respondents = np.vstack([getGroupSlotCounts(cube, group, slots, respondents=True), getGroupSlotCounts(cube, group, slots, rest=True, respondents=True)
+                                     if other == 'Rest' else getGroupSlotCounts(cube, other, slots, respondents=True)])
+            respondents = getItemTotals(respondents, starts, lengths)
+            df_table.insert(df_table.columns.get_loc('N') + 1, 'Respondents', respondents[0])
+            df_table.insert(df_table.columns.get_loc('Other N') + 1, 'Other Respondents', respondents[1])
+        tables.append(df_table)
+    if not tables:
+        return pd.DataFrame()
+    df_tables = pd.concat(tables, ignore_index=True)
+    return df_tables if cube.respondents is None else df_tables.rename(columns=weighted_columns)
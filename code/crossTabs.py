@@ -0,0 +1,131 @@
+import os, json, hashlib
+import numpy as np, pandas as pd
+from countCube import default_chunk_size, encodeSurvey, getGroupMasks, getQuestionItems
+from groups import compileGroups
+from ingest import getCacheDir, getFileHash, readCompactSurvey
+from schema import compileAnswerKey
+from weights import getSurveyWeights
+
+# version of the cross-tab cache layout; increase this whenever the layout changes so that old caches are rebuilt
+crosstab_version = 1
+# question types that are cross-tabulated: every single choice question and every statement of a matrix question (one answer per respondent)
+crosstab_types = ['single', 'matrix']
+
+# HELPER CLASSES FOR CROSS-TABS
+# the contingency tables of every pair of single choice items for every group, as one (group x answer slot x answer slot) array: the count of
+# respondents who gave answer a of one item and answer b of another is counts[g, a, b]. items maps every item to its range of slots
+class CrossTabs:
+    def __init__(self, counts, groups, items, answers):
+        self.counts = counts
+        self.groups = list(groups)
+        self.items = items
+        self.answers = answers
+
+    # get the items of a matrix question in column order, like CountCube.getMatrixItems
+    def getMatrixItems(self, q):
+        return [item for item in self.items if item.startswith(q) and item != q]
+
+    # get the (answer x other answer) contingency table of two items for a group as a dataframe
+    def getTable(self, item, other_item, group='All'):
+        start, stop = self.items[item]
+        other_start, other_stop = self.items[other_item]
+        return pd.DataFrame(self.counts[self.groups.index(group), start:stop, other_start:other_stop], index=self.answers[item], columns=self.answers[other_item])
+
+# HELPER FUNCTIONS FOR CROSS-TABS
+# get the items to cross-tabulate with the answers of each, in answer file order (each statement of a matrix question is its own item)
+def getCrossItems(encoded, schema):
+    return [(item, list(answers)) for question in schema if question.kind in crosstab_types
+            for item, _, _, answers in getQuestionItems(encoded, question) if item in encoded.columns]
+
+# get the (respondent x answer slot) one-hot matrix of the given rows for the items, where item i's answers start at offsets[i]
+def getCrossOneHot(encoded, columns, offsets, n_slots, rows):
+    codes = encoded.codes[rows][:, columns]
+    one_hot = np.zeros((codes.shape[0], n_slots), dtype=np.float32)
+    row_idx, col_idx = np.nonzero(codes >= 0)
+    one_hot[row_idx, offsets[col_idx] + codes[row_idx, col_idx]] = 1
+    return one_hot
+
+# count every pairwise contingency table of the cross-tabulated items for each group: one X^T X product of the one-hot matrix X of each
+# group's respondents per chunk of rows, instead of a crosstab per pair of questions (X^T W X with the weight of every respondent)
+def buildCrossTabs(encoded, schema, group_masks, group_names, chunk_size=default_chunk_size, weights=None):
+    schema = compileAnswerKey(schema)
+    cross_items = getCrossItems(encoded, schema)
+    lengths = np.array([len(answers) for _, answers in cross_items], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    n_slots = int(lengths.sum())
+    columns = [encoded.columns.index(item) for item, _ in cross_items]
+    membership = np.vstack(group_masks)
+    counts = np.zeros((len(group_names), n_slots, n_slots))
+    for start in range(0, membership.shape[1], chunk_size):
+        stop = min(start + chunk_size, membership.shape[1])
+        one_hot = getCrossOneHot(encoded, columns, offsets, n_slots, slice(start, stop))
+        weighted = one_hot if weights is None else one_hot * weights[start:stop, None]
+        for g, mask in enumerate(membership[:, start:stop]):
+            counts[g] += one_hot[mask].T @ weighted[mask]
+    items = {item: (int(offset), int(offset + length)) for (item, _), offset, length in zip(cross_items, offsets, lengths)}
+    return CrossTabs(np.rint(counts).astype(np.int64) if weights is None else counts, group_names, items, {item: answers for item, answers in cross_items})
+
+# get the cache file of the cross-tabs of a data file, keyed by the data file, the answer key, the group definitions and the margins the
+# respondents are weighted to (if any), so that a change to any of them gives a new file; the file is kept in the data file's cache directory.
+# Every definition is in the key (not just those of the groups counted), since a combined group (e.g. Female AND NOT Faculty) is built from others
+def getCrossTabFile(data_file, schema, df_groups, group_names, df_margins=None):
+    definitions = df_groups[['Group', 'Definition']].astype(str).values.tolist()
+    margins = None if df_margins is None else df_margins[['Question', 'Answer', 'Population']].astype(str).values.tolist()
+    key = json.dumps([crosstab_version, getFileHash(data_file), [(question.question, question.kind, question.labels.tolist(), question.scale.tolist(), question.offset) for question in schema],
+                      group_names, definitions, margins])
+    return os.path.join(getCacheDir(data_file), f'crosstabs_{hashlib.sha256(key.encode()).hexdigest()[:16]}.npz')
+
+# save the cross-tabs to a cache file
+def saveCrossTabs(crosstabs, crosstab_file):
+    os.makedirs(os.path.dirname(crosstab_file), exist_ok=True)
+    header = {'groups': crosstabs.groups, 'items': crosstabs.items, 'answers': crosstabs.answers}
+    # write to a temporary file first so that a half written cache is never read
+    with open(f'{crosstab_file}.tmp', 'wb') as f:
+        np.savez_compressed(f, header=json.dumps(header), counts=crosstabs.counts.astype(np.int32) if crosstabs.counts.dtype.kind == 'i' else crosstabs.counts)
+    os.replace(f'{crosstab_file}.tmp', crosstab_file)
+
+# read cross-tabs from a cache file
+def readCrossTabs(crosstab_file):
+    with np.load(crosstab_file) as data:
+        header = json.loads(str(data['header']))
+        counts = data['counts']
+        return CrossTabs(counts.astype(np.int64) if counts.dtype.kind == 'i' else counts, header['groups'], {item: tuple(item_range) for item, item_range in header['items'].items()}, header['answers'])
+
+# DRIVER FUNCTIONS FOR CROSS-TABS
+# get the cross-tabs of every pair of single choice items of a data file for all of the data and each group; they are counted once and cached
+# next to the data file, so every later pair (of any questions) is read from the cache without reading the data again; with a margin file
+# (see weights.py), the respondents are weighted to its population margins
+def getCrossTabs(data_file, df_answers, df_groups, group_names, use_cache=True, df_margins=None):
+    schema = compileAnswerKey(df_answers)
+    group_names = ['All'] + list(group_names)
+    crosstab_file = getCrossTabFile(data_file, schema, df_groups, group_names, df_margins)
+    if use_cache and os.path.exists(crosstab_file):
+        return readCrossTabs(crosstab_file)
+    df_data = readCompactSurvey(data_file)
+    group_index = compileGroups(df_data, df_groups)
+    group_masks = getGroupMasks(df_data, [np.ones(len(df_data), dtype=bool)] + [group_index.getMask(group, df_data) for group in group_names[1:]])
+    weights = None if df_margins is None else getSurveyWeights(df_data, schema, df_margins)
+    crosstabs = buildCrossTabs(encodeSurvey(df_data, schema), schema, group_masks, group_names, weights=weights)
+    if use_cache:
+        saveCrossTabs(crosstabs, crosstab_file)
+    return crosstabs
+
+# get the long table of the contingency tables of every item of a question with every item of another question for each group:
+# Group, Question, Answer, Other Question, Other Answer, Count, N (respondents of the group who gave the answer and answered the other question)
+# and Percent (of N who gave the other answer); weighted cross-tabs have Weighted Count and Weighted N columns instead, since they aren't
+# numbers of respondents
+def getCrossTabTable(crosstabs, items, other_items, groups):
+    tables = []
+    for group in groups:
+        for item in items:
+            for other_item in other_items:
+                df_table = crosstabs.getTable(item, other_item, group)
+                n = df_table.sum(axis=1)
+                df_percent = df_table.div(n.replace(0, np.nan), axis=0) * 100
+                tables.append(pd.DataFrame({'Group': group, 'Question': item, 'Answer': np.repeat(df_table.index, df_table.shape[1]),
+                                            'Other Question': other_item, 'Other Answer': np.tile(df_table.columns, df_table.shape[0]),
+                                            'Count': df_table.to_numpy().ravel(), 'N': np.repeat(n.to_numpy(), df_table.shape[1]), 'Percent': df_percent.to_numpy().ravel()}))
+    if not tables:
+        return pd.DataFrame()
+    df_tables = pd.concat(tables, ignore_index=True)
+    return df_tables.rename(columns={'Count': 'Weighted Count', 'N': 'Weighted N'}) if crosstabs.counts.dtype.kind == 'f' else df_tables
@@ -0,0 +1,110 @@
+import os, zipfile
+from xml.sax.saxutils import escape
+import pandas as pd
+
+# the report outline kept next to the answer file: the section, question and groups of every chart of the report, in order
+default_outline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'report_outline.csv')
+# width of the charts on the page (letter paper with 1 inch margins); charts are never stretched past their drawn size
+page_width_inches = 6.5
+# dpi assumed for pngs that don't say what theirs is
+default_dpi = 96
+emu_per_inch = 914400
+
+# the fixed parts of the docx package (a docx file is a zip of xml files)
+content_types_xml = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Default Extension="png" ContentType="image/png"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>
+</Types>'''
+package_rels_xml = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>'''
+styles_xml = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">
+<w:docDefaults><w:rPrDefault><w:rPr><w:rFonts w:ascii="Arial" w:hAnsi="Arial" w:cs="Arial"/><w:sz w:val="22"/></w:rPr></w:rPrDefault></w:docDefaults>
+<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/></w:style>
+<w:style w:type="paragraph" w:styleId="Heading1"><w:name w:val="heading 1"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/>
+<w:pPr><w:keepNext/><w:spacing w:before="400" w:after="120"/><w:outlineLvl w:val="0"/></w:pPr><w:rPr><w:b/><w:sz w:val="32"/></w:rPr></w:style>
+<w:style w:type="paragraph" w:styleId="Heading2"><w:name w:val="heading 2"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/>
+<w:pPr><w:keepNext/><w:spacing w:before="240" w:after="80"/><w:outlineLvl w:val="1"/></w:pPr><w:rPr><w:b/><w:sz w:val="24"/></w:rPr></w:style>
+<w:style w:type="paragraph" w:styleId="Caption"><w:name w:val="caption"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/>
+<w:pPr><w:spacing w:after="240"/></w:pPr><w:rPr><w:i/><w:sz w:val="18"/></w:rPr></w:style>
+</w:styles>'''
+document_start_xml = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+ xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"
+ xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"><w:body>'''
+document_end_xml = '''<w:sectPr><w:pgSz w:w="12240" w:h="15840"/><w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440" w:header="720" w:footer="720" w:gutter="0"/></w:sectPr>
+</w:body></w:document>'''
+image_xml = '''<w:p><w:pPr><w:keepNext/></w:pPr><w:r><w:drawing><wp:inline distT="0" distB="0" distL="0" distR="0"><wp:extent cx="{cx}" cy="{cy}"/>
+<wp:docPr id="{n}" name="Chart {n}"/><a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture"><pic:pic>
+<pic:nvPicPr><pic:cNvPr id="{n}" name="chart{n}.png"/><pic:cNvPicPr/></pic:nvPicPr><pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>
+<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm><a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr></pic:pic>
+</a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>'''
+
+# HELPER FUNCTIONS FOR THE REPORT OUTLINE
+# read the report outline: one row per chart with the Section it is in, the Question (as named in the answer file), and optionally the
+# Title of the question, the Group to show (empty for all of the data) and the Other group it is compared with ('Rest' if empty)
+def readReportOutline(outline_file=default_outline_file):
+    df_outline = pd.read_csv(outline_file, sep=',', header=0, dtype=str)
+    for col, default in [('Title', ''), ('Group', ''), ('Other', 'Rest')]:
+        if col not in df_outline.columns:
+            df_outline[col] = default
+        df_outline[col] = df_outline[col].fillna(default)
+    df_outline['Title'] = df_outline['Title'].where(df_outline['Title'] != '', df_outline['Question'])
+    return df_outline
+
+# HELPER FUNCTIONS FOR WRITING DOCX FILES
+# get the size of a png in inches from its header (and its pHYs chunk for the dpi, if it has one)
+def getPngSize(png):
+    width, height = int.from_bytes(png[16:20], 'big'), int.from_bytes(png[20:24], 'big')
+    dpi = default_dpi
+    position = 8
+    while position < len(png):
+        length, kind = int.from_bytes(png[position:position + 4], 'big'), png[position + 4:position + 8]
+        if kind == b'pHYs' and png[position + 16] == 1:
+            # pixels per meter
+            dpi = int.from_bytes(png[position + 8:position + 12], 'big') * 0.0254
+            break
+        if kind == b'IDAT':
+            break
+        position += length + 12
+    return width / dpi, height / dpi
+
+# get the xml of a paragraph with a style
+def getParagraphXml(text, style):
+    return f'<w:p><w:pPr><w:pStyle w:val="{style}"/></w:pPr><w:r><w:t xml:space="preserve">{escape(text)}</w:t></w:r></w:p>'
+
+# get the xml of a paragraph with an image of the relationship rid, scaled down to the page width if it is wider
+def getImageXml(png, n, rid):
+    width, height = getPngSize(png)
+    scale = min(1, page_width_inches / width)
+    return image_xml.format(cx=int(width * scale * emu_per_inch), cy=int(height * scale * emu_per_inch), n=n, rid=rid)
+
+# DRIVER FUNCTIONS FOR WRITING DOCX FILES
+# write a docx file from a list of (kind, content) blocks in order: ('heading1', text), ('heading2', text), ('caption', text) or
+# ('image', png bytes); images are written straight from memory into the file (blocks can also be a generator)
+def writeDocx(blocks, output_file):
+    body, rels = [], []
+    with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr('[Content_Types].xml', content_types_xml)
+        docx.writestr('_rels/.rels', package_rels_xml)
+        docx.writestr('word/styles.xml', styles_xml)
+        for kind, content in blocks:
+            if kind == 'image':
+                n = len(rels) + 1
+                rid = f'rId{n + 1}'
+                # pngs are already compressed
+                docx.writestr(f'word/media/chart{n}.png', content, compress_type=zipfile.ZIP_STORED)
+                rels.append(f'<Relationship Id="{rid}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" Target="media/chart{n}.png"/>')
+                body.append(getImageXml(content, n, rid))
+            else:
+                body.append(getParagraphXml(content, {'heading1': 'Heading1', 'heading2': 'Heading2', 'caption': 'Caption'}[kind]))
+        rels.insert(0, '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>')
+        docx.writestr('word/_rels/document.xml.rels', '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                      '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">' + ''.join(rels) + '</Relationships>')
+        docx.writestr('word/document.xml', document_start_xml + '\n'.join(body) + document_end_xml)
@@ -1,9 +1,24 @@
-import sys, os, pandas as pd, numpy as np, matplotlib.pyplot as plt
+import os, pandas as pd, numpy as np
+from countCube import encodeSurvey, getGroupMasks, buildCountCube, getQuestionItems
+from ingest import concatSurveys
+from schema import compileAnswerKey
+from sliderStats import SliderStats, getSliderStats, getStatsAverages
+from bootstrap import bootstrapIntervals, writeIntervalTable
+from significance import testGroupDifferences, writeSignificanceTable
+from waves import default_wave_dir, getWaveNames, readWave, readQuestionMap, getTrendCounts, getTrendItems
+from htmlReport import writeHtmlReport
+from docxReport import readReportOutline, writeDocx
+from render import ChartTemplate, getFigure, getChartTemplate, saveFigure, saveTemplate, getRenderCacheFile, renderCharts, renderBuffers
+from profiler import profileStage, countEvent
 
 # bar graph color palette
 default_color = 'teal'
 group_comparison_color = 'navajowhite'
 other_color = 'crimson'
+# width of each bar of the comparison bar graphs
+comparison_bar_width = 0.4
+# version of the plotting functions; increase this whenever the look of the graphs changes so that cached graphs are redrawn
+plot_version = 2
 
 # HELPER FUNCTIONS FOR ORGANIZING DATA
 # get the counts for each answer for a given question
@@ -25,244 +40,560 @@ def countAnswers(df, q, answers):
         answer_counts = df_question.value_counts()
     return answer_counts
 
-# make a dataframe with the answers and counts for a given question, replacing index with the respective answer
-def getAnswerCountDf(answer_counts, answers):
-    # sort the answer counts by the index
-    answer_counts = answer_counts.sort_index()
-    # convert the answer count index to a list
-    unique_values = answer_counts.index.tolist()
-    # check the length of the unique values list; if 0, then there are no answers for the question
-    if len(unique_values) == 0:
+# make a dataframe with the answers and counts for a given question, replacing the index (answer codes starting at offset) with the respective answer;
+# answers that were never given get a count of 0
+def getAnswerCountDf(answer_counts, answers, offset=1):
+    # check the length of the answer counts; if 0, then there are no answers for the question
+    if len(answer_counts) == 0:
         return pd.DataFrame({'answer': [], 'count': []})
-    # get the smallest value in the unique values list; for some reason the survey center defined some answers with higher numbers than others, so this combats that
-    smallest_value = int(min(unique_values))
-    # replace the index of each unique value with its corresponding answer
-    for i, value in enumerate(unique_values):
-        unique_values[i] = answers[int(value)-smallest_value]
-    # check if there are any values that are not in the answers
-    if len(unique_values) != len(answers):
-        # add the missing values to the unique values with a count of 0
-        for i in range(len(answers)):
-            if answers[i] not in unique_values:
-                unique_values.append(answers[i])
-                answer_counts = pd.concat([answer_counts, pd.Series([0], index=[i+1])])
-    # create a new dataframe with the answers and counts
-    output_df = pd.DataFrame({'answer': unique_values, 'count': answer_counts.values})
-    return output_df 
+    # line the counts up with the answer codes in a single reindex
+    codes = answer_counts.index.astype(float).astype(int)
+    counts = answer_counts.set_axis(codes).reindex(np.arange(offset, offset + len(answers)), fill_value=0)
+    return pd.DataFrame({'answer': answers, 'count': counts.to_numpy()})
+
+# make a dataframe with the answers and counts for a given item (question or matrix question column) of a group in the count cube;
+# if rest is true, then the counts are for everyone not in the group. If the cube is weighted, the number of respondents who gave each
+# answer is kept in a respondents column, so that charts show the real n instead of the weighted total
+def getCubeCountDf(cube, group, item, answers, rest=False):
+    counts = cube.getRestCounts(group, item) if rest else cube.getCounts(group, item)
+    # if there are no answers for the question, return an empty dataframe like getAnswerCountDf
+    if counts.sum() == 0:
+        return pd.DataFrame({'answer': [], 'count': []})
+    if cube.respondents is not None:
+        respondents = cube.getRestRespondents(group, item) if rest else cube.getRespondents(group, item)
+        return pd.DataFrame({'answer': answers, 'count': counts, 'respondents': respondents})
+    return pd.DataFrame({'answer': answers, 'count': counts})
+
+# get the number of respondents of an answer count dataframe: the sum of its respondents column if its counts are weighted, else of its counts
+def getRespondentCount(df_count):
+    return int(df_count['respondents' if 'respondents' in df_count else 'count'].sum())
 
 # gets the average for each answer for a given question; questions 13 and 14 in this version of the survey
+# (blank sliders are skipped one at a time, so a respondent who left one slider blank still counts towards the others)
 def getAnswerAverage(df):
-    # remove any NAN values
-    df = df.dropna()
-    # get the average for each answer
-    averages = df.mean()
-    # reset the index starting at 1
-    averages = averages.reset_index(drop=True)
-    averages.index = averages.index + 1
-    return averages
+    stats = SliderStats(df.columns, ['All'])
+    stats.add(df.to_numpy(dtype=float), [np.ones(len(df), dtype=bool)])
+    # the index starts at 1
+    return stats.getAverages('All')
+
+# get the slider question averages of all of the data and each group (entries of df_list are row masks or subset dataframes, like in
+# analyzeAndPlotComparisonGraphs), in the form streamSurvey returns them: {group: {question: averages}}; weighted by the weight of every
+# respondent if given
+def getSliderAverages(df_allData, df_answers, df_list, output_list, weights=None):
+    group_names = ['All'] + list(output_list)
+    group_masks = getGroupMasks(df_allData, [np.ones(len(df_allData), dtype=bool)] + list(df_list))
+    return getStatsAverages(getSliderStats(df_allData, compileAnswerKey(df_answers), group_masks, group_names, weights), group_names)
+
+# get the (2 x answer) distances from each percentage down to the lower bound and up to the upper bound of its interval, for matplotlib's yerr;
+# answers without an interval get no error bar
+def getErrorBars(percents, interval):
+    lower, upper = (np.asarray(bound, dtype=float) for bound in interval)
+    percents = np.asarray(percents, dtype=float)
+    return np.nan_to_num(np.vstack([percents - lower, upper - percents])).clip(min=0)
+
+# draw error bars for the percentages of one set of bars, shifted from the answer positions by offset; returns the drawn error bars
+def drawErrorBars(ax, percents, interval, offset):
+    if len(percents) == 0:
+        return
+    return ax.errorbar(np.arange(len(percents)) + offset, percents, yerr=getErrorBars(percents, interval), fmt='none', ecolor='black', capsize=2)
 
 # PLOTTING FUNCTIONS
+# each plotting function draws onto the given matplotlib figure (a new one if none is given), saves it and clears it for the next chart,
+# then returns the saved file; the bar and comparison bar graphs are drawn on a chart template of their answer scale instead (see render.py)
 # plot the bar graph for any percentage based questions
-def plotAverageBarGraph(df, question_number, output_dir):
-    plt.title(f'{question_number}', fontsize = 10)
-    plt.xlabel("Average Percent")
-    plt.barh(df['answer'], df['count'], color = default_color)
-    plt.savefig(f'{output_dir}/{question_number}.png', bbox_inches="tight")
-    plt.clf()
+def plotAverageBarGraph(df, question_number, output_dir, fig=None):
+    fig = fig or getFigure()
+    ax = fig.add_subplot()
+    ax.set_title(f'{question_number}', fontsize = 10)
+    ax.set_xlabel("Average Percent")
+    ax.barh(df['answer'], df['count'], color = default_color)
+    output_file = f'{output_dir}/{question_number}.png'
+    return saveFigure(fig, output_file)
 
-# plot the bar graph; if percent is true, then the counts are converted to percentages
-def plotBarGraph(df, question_number, output_dir, percent):
-    s = int(df['count'].sum())
-    plt.xlabel("Response count")
+# build the bar graph of an answer scale with a horizontal bar for each answer; if percent is true, the bars are percentages
+def buildBarGraph(answers, percent, fig):
+    ax = fig.add_subplot()
+    ax.set_xlabel("Response count")
     if percent:
-        df['count'] = df['count'].apply(lambda x: x/s*100)
-        plt.xlim(0,100)
-        plt.xlabel("Average Percent")
-    plt.title(f'{question_number}, n={s}', fontsize = 10)
-    plt.barh(df['answer'], df['count'], color = default_color)
-    plt.savefig(f'{output_dir}/{question_number}.png', bbox_inches="tight")
-    plt.clf()
-
-
-# plot the bar graph for comparison between two groups
-def plotComparisonBarGraph(df_count, df_other_count, question_number, label1, label2, color1, color2, output_dir):
-    # get the sum of the counts for each dataframe
-    s = int(df_count['count'].sum())
-    s_other = int(df_other_count['count'].sum())
-    # make copies of the dataframes before transforming the counts to percentages
-    df_1 = df_count.copy()
-    df_2 = df_other_count.copy()
-    # get the percentage of each answer for each dataframe
-    df_1['count'] = df_1['count'].apply(lambda x: x/s*100)
-    df_2['count'] = df_2['count'].apply(lambda x: x/s_other*100)
-    plt.ylim(0,100)
-    plt.xticks(rotation=45)
-    plt.title(f'{question_number}, {label1}={s}, {label2}={s_other}', fontsize = 10)
-    plt.ylabel("Percent")
-    bar_width = 0.4
-    plt.bar(df_1['answer'], df_1['count'], color = color1, label=label1, width=-bar_width, align = 'edge')
-    plt.bar(df_2['answer'], df_2['count'], color = color2, label=label2, width=bar_width, align = 'edge')
-    plt.legend()
-    plt.savefig(f'{output_dir}/{label1}_{label2}.png', bbox_inches="tight")
-    plt.clf()
-
-# question 39 is so different that it needs a separate function 
-def plotComparisonBarGraph39(df_count, df_other_count, question_number, label1, label2, color1, color2, answer_order, output_dir):
-    # get the sum of the counts for each dataframe
-    s = int(df_count['count'].sum())
-    s_other = int(df_other_count['count'].sum())
-    # make copies of the dataframes before transforming the counts to percentages
-    df_1 = df_count.copy()
-    df_2 = df_other_count.copy()
-    # get the percentage of each answer for each dataframe
-    df_1['count'] = df_1['count'].apply(lambda x: x/s*100)
-    df_2['count'] = df_2['count'].apply(lambda x: x/s_other*100)
-    # set the index to the answer order (for some reason for a couple categories for question 39 this was not in the correct order, 
-    # so forcing it here)
-    df_1 = df_1.set_index('answer').reindex(answer_order).reset_index() 
-    plt.ylim(0,100)
-    plt.xticks(rotation=45)
-    plt.title(f'{question_number}, {label1}={s}, {label2}={s_other}', fontsize = 10)
-    plt.ylabel("Percent")
-    bar_width = 0.4
-    plt.bar(df_1['answer'], df_1['count'], color = color1, label=label1, width=-bar_width, align = 'edge')
-    plt.bar(df_2['answer'], df_2['count'], color = color2, label=label2, width=bar_width, align = 'edge')
-    plt.legend()
-    plt.savefig(f'{output_dir}/{label1}_{label2}.png', bbox_inches="tight")
-    plt.clf()
+        ax.set_xlim(0,100)
+        ax.set_xlabel("Average Percent")
+    bars = ax.barh(list(answers), np.zeros(len(answers)), color = default_color)
+    return ChartTemplate(fig, ax, [bars])
+
+# plot the bar graph; if percent is true, then the counts are converted to percentages
+# (drawn on the template of its answer scale, so the fig argument of the renderer is not used)
+def plotBarGraph(df, question_number, output_dir, percent, fig=None):
+    answers = tuple(df['answer'])
+    template = getChartTemplate(('bar', answers, percent), lambda fig: buildBarGraph(answers, percent, fig))
+    s = getRespondentCount(df)
+    counts = df['count'].to_numpy(dtype=float)
+    widths = counts/counts.sum()*100 if percent else counts
+    for bar, width in zip(template.bars[0], widths):
+        bar.set_width(width)
+    if not percent:
+        # the count axis follows the data, so the saved area is worked out again
+        template.ax.relim()
+        template.ax.autoscale_view()
+        template.reset()
+    template.ax.set_title(f'{question_number}, n={s}', fontsize = 10)
+    output_file = f'{output_dir}/{question_number}.png'
+    return saveTemplate(template, output_file)
+
+# build the comparison bar graph of an answer scale with two bars for each answer, one on either side of it, and a legend for the two groups
+def buildComparisonBarGraph(answers, fig):
+    ax = fig.add_subplot()
+    ax.set_ylim(0,100)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.set_ylabel("Percent")
+    bars = [ax.bar(list(answers), np.zeros(len(answers)), width=-comparison_bar_width, align = 'edge'),
+            ax.bar(list(answers), np.zeros(len(answers)), width=comparison_bar_width, align = 'edge')]
+    ax.legend(bars, ['', ''])
+    return ChartTemplate(fig, ax, bars)
+
+# draw the comparison of the answer percentages of two groups on the comparison bar graph template of the answer scale, then save it;
+# if intervals (a (lower, upper) pair of percentages per group) are given, they are drawn as error bars over the middle of each bar
+def drawComparisonBarGraph(df_count, df_other_count, title, label1, label2, color1, color2, answers, output_file, intervals=None):
+    template = getChartTemplate(('comparison', tuple(answers)), lambda fig: buildComparisonBarGraph(answers, fig))
+    legend = template.ax.get_legend()
+    for i, (df, label, color) in enumerate([(df_count, label1, color1), (df_other_count, label2, color2)]):
+        percents, _ = getPercents(df, answers)
+        for bar, percent in zip(template.bars[i], percents):
+            bar.set_height(percent)
+            bar.set_facecolor(color)
+        legend.get_texts()[i].set_text(label)
+        legend.legend_handles[i].set_facecolor(color)
+        if intervals is not None and len(answers) > 0:
+            template.extra.append(drawErrorBars(template.ax, percents, intervals[i], comparison_bar_width/2 if i else -comparison_bar_width/2))
+    template.ax.set_title(title, fontsize = 10)
+    return saveTemplate(template, output_file)
+
+# plot the bar graph for comparison between two groups (drawn on the template of its answer scale, so the fig argument of the renderer is not used)
+def plotComparisonBarGraph(df_count, df_other_count, question_number, label1, label2, color1, color2, output_dir, intervals=None, fig=None):
+    # get the number of respondents for each dataframe
+    s = getRespondentCount(df_count)
+    s_other = getRespondentCount(df_other_count)
+    # the answers of the question, from whichever group answered it
+    answers = list(df_count['answer']) if len(df_count) else list(df_other_count['answer'])
+    output_file = f'{output_dir}/{label1}_{label2}.png'
+    return drawComparisonBarGraph(df_count, df_other_count, f'{question_number}, {label1}={s}, {label2}={s_other}', label1, label2, color1, color2,
+                                  answers, output_file, intervals)
+
+# get the percentage of each answer from an answer count dataframe (all 0 if nobody answered), in the order of answers, and its number of respondents
+def getPercents(df_count, answers):
+    if len(df_count) == 0:
+        return np.zeros(len(answers)), 0
+    counts = df_count.set_index('answer')['count'].reindex(answers).fillna(0).to_numpy(dtype=float)
+    return counts / counts.sum() * 100, getRespondentCount(df_count)
+
+# plot one faceted graph for a question with a panel per group; each panel compares the group against all of the data and against the rest
+# of the data (the same information as the <group>_All and <group>_Rest graphs of every group). Panels share the answer and percent axes
+def plotFacetedComparisonGraph(df_counts, df_all_count, df_rest_counts, question_number, label, groups, answers, output_dir, intervals=None, fig=None):
+    fig = fig or getFigure()
+    n_columns = min(len(groups), 3)
+    n_rows = -(-len(groups) // n_columns)
+    fig.set_size_inches(4 * n_columns, 3.2 * n_rows)
+    axes = fig.subplots(n_rows, n_columns, sharex=True, sharey=True, squeeze=False).ravel()
+    fig.suptitle(f'{question_number}', fontsize = 12)
+    all_percents, s_all = getPercents(df_all_count, answers)
+    bar_width = 0.27
+    x = np.arange(len(answers))
+    for i, (ax, group) in enumerate(zip(axes, groups)):
+        percents, s = getPercents(df_counts[i], answers)
+        rest_percents, s_rest = getPercents(df_rest_counts[i], answers)
+        ax.bar(x - bar_width, percents, color = group_comparison_color, label='Group', width=bar_width)
+        ax.bar(x, all_percents, color = default_color, label='All', width=bar_width)
+        ax.bar(x + bar_width, rest_percents, color = other_color, label='Rest', width=bar_width)
+        # if intervals (a (lower, upper) pair of percentages for the group, all of the data and the rest) are given, draw them as error bars
+        if intervals is not None:
+            for offset, bar_percents, interval in zip([-bar_width, 0, bar_width], [percents, all_percents, rest_percents], intervals[i]):
+                drawErrorBars(ax, bar_percents, interval, offset)
+        ax.set_title(f'{group}={s}, All={s_all}, Rest={s_rest}', fontsize = 8)
+        ax.set_ylim(0,100)
+    for ax in axes[len(groups):]:
+        ax.set_visible(False)
+    for ax in axes[::n_columns]:
+        ax.set_ylabel("Percent")
+    for ax in axes:
+        ax.set_xticks(x, answers, rotation=45, ha='right', fontsize = 7)
+        ax.tick_params(labelbottom=True)
+    axes[0].legend(fontsize = 7)
+    fig.tight_layout()
+    output_file = f'{output_dir}/{label}.png'
+    return saveFigure(fig, output_file)
+
+# plot every statement of a matrix question for a group as one diverging stacked bar graph: each statement is a bar of the percentages of
+# its answers, with the disagreeing half of the scale to the left of 0 and the agreeing half to the right (a middle answer is split across 0).
+# The unscaled answers (e.g. I do not know, from the answer file) are left out of the bars and their percentages are given next to the statement;
+# counts is the (statement x answer) count array of the group (e.g. from CountCube.getMatrixCounts); if the counts are weighted, respondents
+# is the number of respondents of each statement to show as its n
+def plotDivergingMatrixGraph(counts, statements, answers, unscaled_answers, title, label, output_dir, respondents=None, fig=None):
+    from matplotlib.colors import LinearSegmentedColormap
+    fig = fig or getFigure()
+    fig.set_size_inches(10, 0.45 * len(statements) + 1.8)
+    ax = fig.add_subplot()
+    counts = np.asarray(counts, dtype=float).reshape(len(statements), len(answers))
+    n = counts.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percents = np.nan_to_num(counts / n[:, None] * 100)
+    n = n if respondents is None else respondents
+    scaled = [i for i, answer in enumerate(answers) if answer not in unscaled_answers]
+    unscaled = [i for i, answer in enumerate(answers) if answer in unscaled_answers]
+    # every bar starts left of 0 by the disagreeing answers and half of the middle answer
+    half = len(scaled) // 2
+    left = -percents[:, scaled[:half]].sum(axis=1) - (percents[:, scaled[half]] / 2 if len(scaled) % 2 else 0)
+    colors = LinearSegmentedColormap.from_list('diverging', [other_color, 'lightgray', default_color])(np.linspace(0, 1, len(scaled)))
+    y = np.arange(len(statements))
+    for i, color in zip(scaled, colors):
+        ax.barh(y, percents[:, i], left=left, color=color, label=answers[i], height=0.7)
+        left = left + percents[:, i]
+    ax.axvline(0, color='black', linewidth=0.8)
+    labels = [f'{statement} (n={s:.0f}' + ''.join(f', {answers[i]} {percents[j, i]:.0f}%' for i in unscaled) + ')' for j, (statement, s) in enumerate(zip(statements, n))]
+    ax.set_yticks(y, labels, fontsize = 8)
+    ax.invert_yaxis()
+    ax.set_xlim(-100, 100)
+    ax.set_xticks(np.arange(-100, 101, 25), [f'{abs(tick)}' for tick in range(-100, 101, 25)])
+    ax.set_xlabel("Percent")
+    ax.set_title(title, fontsize = 10)
+    ax.legend(ncol=len(scaled), loc='upper center', bbox_to_anchor=(0.5, -0.6 / fig.get_size_inches()[1] - 0.05), fontsize = 7, frameon=False)
+    output_file = f'{output_dir}/{label}.png'
+    return saveFigure(fig, output_file)
+
+# plot the contingency table of two questions as a heatmap of the percentage of each row's respondents who gave each other answer,
+# with the count written in every cell; df_table is the (answer x other answer) count table (e.g. from CrossTabs.getTable). Weighted counts
+# (a float table) are labeled as weighted, since they aren't numbers of respondents
+def plotCrossTabHeatmap(df_table, title, label, output_dir, fig=None):
+    fig = fig or getFigure()
+    fig.set_size_inches(max(6, 0.9 * df_table.shape[1] + 3), max(3, 0.45 * df_table.shape[0] + 2))
+    ax = fig.add_subplot()
+    counts = df_table.to_numpy()
+    n = counts.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percents = np.nan_to_num(counts / n[:, None] * 100)
+    image = ax.imshow(percents, cmap='Blues', vmin=0, vmax=100, aspect='auto')
+    for i, j in np.ndindex(counts.shape):
+        ax.text(j, i, f'{counts[i, j]:.0f}', ha='center', va='center', fontsize = 7, color='white' if percents[i, j] > 60 else 'black')
+    ax.set_xticks(np.arange(counts.shape[1]), df_table.columns, rotation=45, ha='right', fontsize = 7)
+    n_label = 'weighted n' if counts.dtype.kind == 'f' else 'n'
+    ax.set_yticks(np.arange(counts.shape[0]), [f'{answer} ({n_label}={s:.0f})' for answer, s in zip(df_table.index, n)], fontsize = 7)
+    ax.set_title(title if counts.dtype.kind != 'f' else f'{title} (weighted counts)', fontsize = 10)
+    fig.colorbar(image, ax=ax, label="Percent of row")
+    output_file = f'{output_dir}/{label}.png'
+    return saveFigure(fig, output_file)
+
+# get the diverging stacked bar graph spec of a matrix question for a group of a count cube, from its (statement x answer) counts
+# (and the number of respondents of each statement if the cube is weighted)
+def getDivergingChart(cube, question, group, label, output_dir):
+    counts, items = cube.getMatrixCounts(question.question)
+    g = cube.groups.index(group)
+    statements = [f'{question.labels[question.getColumnIndex(item)]}' for item in items]
+    args = (counts[g], statements, list(question.scale), question.unscaled, f'{question.question.rstrip("_")}, {group}', label, output_dir)
+    if cube.respondents is not None:
+        args += (cube.getMatrixCounts(question.question, respondents=True)[0][g].sum(axis=1),)
+    return (plotDivergingMatrixGraph, args)
+
+# plot the percentage of each answer of a question for a group across survey waves; df_trend holds the (answer x wave) counts. If any wave
+# is weighted, respondents holds the number of respondents of each wave to show as its n
+def plotTrendGraph(df_trend, question_number, group, output_dir, respondents=None, fig=None):
+    fig = fig or getFigure()
+    ax = fig.add_subplot()
+    # get the number of answers in each wave and the percentage of each answer
+    s = df_trend.sum()
+    df_percent = df_trend / s.replace(0, np.nan) * 100
+    s = s if respondents is None else pd.Series(respondents, index=s.index)
+    ax.set_ylim(0,100)
+    ax.set_title(f'{question_number}, {group}, ' + ', '.join(f'{wave}={int(n)}' for wave, n in s.items()), fontsize = 10)
+    ax.set_ylabel("Percent")
+    for answer, percents in df_percent.iterrows():
+        ax.plot(df_percent.columns, percents, marker='o', label=answer)
+    ax.legend(fontsize=8)
+    output_file = f'{output_dir}/{group}.png'
+    return saveFigure(fig, output_file)
 
 # DRIVER ANALYSIS FUNCTIONS
-# driver function for the analysis for individual questions
-def analyzeAndPlotGraphs(df_data, df_answers, output_dir, percent):
+# driver function for the analysis for individual questions; df_answers is the answer file or its compiled SurveySchema;
+# weights is the weight of every respondent (e.g. from weights.py), or None to count every respondent once
+def analyzeAndPlotGraphs(df_data, df_answers, output_dir, percent, jobs=1, cache=True, weights=None):
+    schema = compileAnswerKey(df_answers)
+    # count every question once for the full data, and average the slider questions (questions 13 and 14 in this version of the survey)
+    with profileStage('count'):
+        cube = buildCountCube(encodeSurvey(df_data, schema), [np.ones(len(df_data), dtype=bool)], ['All'], weights=weights)
+        averages = getStatsAverages(getSliderStats(df_data, schema, [np.ones(len(df_data), dtype=bool)], ['All'], weights), ['All'])['All']
+    plotGraphs(cube, averages, schema, output_dir, percent, jobs, cache)
+
+# plot the graphs for individual questions from the counts of the 'All' group of a count cube and the averages of the slider questions
+def plotGraphs(cube, averages, df_answers, output_dir, percent, jobs=1, cache=True):
+    schema = compileAnswerKey(df_answers)
+    # collect the charts to draw, then render them all at once (skipping any that are unchanged since the last run if cache is true)
+    charts = []
     # loop through the questions and answers
-    for q, a in zip(df_answers['Question'], df_answers['Answer']):
-        # separate a (answers column) into a list by the pipe as delimiter
-        answers = a.split('|')
-        # check if the question is question 13 or 14
-        if q == 'Q13_' or q == 'Q14_':
-            df_question = df_data.filter(regex=q)
-            averages = getAnswerAverage(df_question)
-            df_count = getAnswerCountDf(averages, answers)
+    for question in schema:
+        q = question.question
+        if question.kind == 'slider':
+            df_count = getAnswerCountDf(averages[q], question.labels)
             # reverse the dataframe so the answers are in the correct order (the answers are in reverse order in the data file compared to the original survey)
             df_count = df_count.iloc[::-1]
-            plotAverageBarGraph(df_count, q, output_dir)
-        elif q == 'Q39_':
-            df_question = df_data.filter(regex=q)
-            # hardcoding the list of answers for this question here
-            q39_answers = ['Strongly disagree','Disagree','Neither agree nor disagree','Somewhat agree','Strongly agree','I do not know']
-            # loop through the columns and get the counts for each answer
-            for col in df_question.columns:
-                answer_counts = df_question[col].value_counts()
-                # get the count of the answers
-                df_count = getAnswerCountDf(answer_counts, q39_answers)
-                # get the number after the '_' in the column name
-                col_num = col.split('_')[1]
-                # get the question from the answer file by the column number
-                label = f'Q39_{answers[int(col_num)-1]}'
-                plotBarGraph(df_count, label, output_dir, percent)
+            charts.append((plotAverageBarGraph, (df_count, q, output_dir)))
         else:
-            # count the answers for the given question
-            answer_counts = countAnswers(df_data, q, answers)
-            df_count = getAnswerCountDf(answer_counts, answers)
-            # reverse the dataframe so the answers are in the correct order (the answers are in reverse order in the data file compared to the original survey)
-            df_count = df_count.iloc[::-1]
-            #plotPercentBarGraph(df_count, q, output_dir)
-            plotBarGraph(df_count, q, output_dir, percent)
+            # get the counted answers for each item of the question (each statement of a matrix question)
+            for item, _, label, answers in getQuestionItems(cube, question):
+                df_count = getCubeCountDf(cube, 'All', item, answers)
+                # reverse the dataframe so the answers are in the correct order (the answers are in reverse order in the data file compared to the original survey);
+                # the answers of a matrix question are already in the order of its scale
+                if question.kind != 'matrix':
+                    df_count = df_count.iloc[::-1]
+                #plotPercentBarGraph(df_count, q, output_dir)
+                charts.append((plotBarGraph, (df_count, label, output_dir, percent)))
+            # all of the statements of a matrix question in one graph
+            if question.kind == 'matrix':
+                charts.append(getDivergingChart(cube, question, 'All', q, output_dir))
+    renderCharts(charts, jobs, getRenderCacheFile(output_dir) if cache else None, plot_version, output_dir)
 
-# driver function for the comparison analysis
-def analyzeAndPlotComparisonGraphs(df_allData, df_list, df_answers, question_list, output_list, output_dir):
-    # loop through the questions and answers
-    for df_data, output in zip(df_list, output_list):
-        for q, a in zip(df_answers['Question'], df_answers['Answer']):
-            # separate a (answers column) into a list by the pipe as delimiter
-            answers = a.split('|')
-            if q in question_list:
-                # get the rest of the data that is not in df_data
-                rest_of_data = pd.concat([df_allData, df_data]).drop_duplicates(keep=False)
-                # define the output directory and make it if it doesn't exist
-                out_dir = f'{output_dir}/{q}'
-                os.makedirs(out_dir, exist_ok=True)
-                # count the answers for the given question
-                all_data_counts = countAnswers(df_allData, q, answers)
-                answer_counts = countAnswers(df_data, q, answers)
-                rest_counts = countAnswers(rest_of_data, q, answers)
+# get the extra chart argument with the intervals of a group and the group it is compared to ('All', 'Rest' or another group) for an item;
+# nothing if there are no intervals, so that charts without error bars keep the same arguments (and render cache keys)
+def getChartIntervals(intervals, group, other, item):
+    if intervals is None:
+        return ()
+    other_interval = intervals.getIntervals(group, item, rest=True) if other == 'Rest' else intervals.getIntervals(other, item)
+    return ((intervals.getIntervals(group, item), other_interval),)
+
+# test the (group, other) pairs of a count cube on the compared questions ('compared') or every question of the answer file ('all'),
+# and write the ranked table of tests into the output directory
+def testAndWriteGroupDifferences(cube, df_answers, question_list, pairs, significance, output_dir):
+    schema = compileAnswerKey(df_answers)
+    questions = list(schema) if significance == 'all' else getCompareQuestions(schema, question_list)
+    os.makedirs(output_dir, exist_ok=True)
+    with profileStage('significance'):
+        writeSignificanceTable(testGroupDifferences(cube, questions, pairs), f'{output_dir}/significance_tests.csv')
+
+# get the questions of the answer file to compare; matrix questions are listed without the '_' (e.g. 'Q39' for the Q39_ grid)
+def getCompareQuestions(schema, question_list):
+    return [question for question in schema if question.question in question_list or (question.kind == 'matrix' and question.question.rstrip('_') in question_list)]
+
+# driver function for the comparison analysis; each entry of df_list is a group's boolean row mask or its subset dataframe;
+# if bootstrap is more than 0, that many bootstrap replicates give the percentage confidence intervals drawn as error bars and written to a table;
+# if significance is 'compared' (the questions of question_list) or 'all' (every question), each group is tested against the rest of the data
+# facet, pdf and html choose the layout of the graphs (see plotComparisonGraphs); weights is the weight of every respondent, or None to count
+# every respondent once; returns the count cube so that it can be saved as a survey wave
+def analyzeAndPlotComparisonGraphs(df_allData, df_list, df_answers, question_list, output_list, output_dir, jobs=1, cache=True, bootstrap=0, significance=None, facet=False, pdf=None, html=None, weights=None):
+    schema = compileAnswerKey(df_answers)
+    if significance and weights is not None:
+        raise ValueError('The significance tests need unweighted counts, so they can\'t be run with weights')
+    # count every question for all of the data and each group in a single pass; the rest of each group is All minus the group
+    group_masks = getGroupMasks(df_allData, [np.ones(len(df_allData), dtype=bool)] + list(df_list))
+    group_names = ['All'] + output_list
+    countEvent('rows', len(df_allData))
+    countEvent('groups', len(output_list))
+    with profileStage('encode'):
+        encoded = encodeSurvey(df_allData, schema)
+    with profileStage('count cube'):
+        cube = buildCountCube(encoded, group_masks, group_names, weights=weights)
+    intervals = None
+    if bootstrap > 0:
+        with profileStage('bootstrap'):
+            intervals = bootstrapIntervals(encoded, group_masks, group_names, bootstrap, jobs=jobs, weights=weights)
+            os.makedirs(output_dir, exist_ok=True)
+            writeIntervalTable(cube, intervals, getCompareQuestions(schema, question_list), output_list, f'{output_dir}/bootstrap_intervals.csv')
+    if significance:
+        testAndWriteGroupDifferences(cube, schema, question_list, [(output, 'Rest') for output in output_list], significance, output_dir)
+    plotComparisonGraphs(cube, schema, question_list, output_list, output_dir, jobs, cache, intervals, facet, pdf, html)
+    return cube
+
+# plot the comparison graphs of each group against all of the data and against the rest of the data from a count cube
+# (the cube needs an 'All' group and a group for each entry of output_list); intervals are optional bootstrap intervals for the same groups;
+# if facet is true, each question gets one graph with a panel per group instead of two graphs per group, and if pdf is a file name,
+# every graph is drawn as a page of that pdf in the output directory instead of as its own file; if html is a file name, no graphs are drawn,
+# and the counts are written into that html report in the output directory instead, where the graphs are drawn in the browser
+def plotComparisonGraphs(cube, df_answers, question_list, output_list, output_dir, jobs=1, cache=True, intervals=None, facet=False, pdf=None, html=None):
+    questions = getCompareQuestions(compileAnswerKey(df_answers), question_list)
+    if html:
+        colors = {'group': group_comparison_color, 'other': default_color, 'rest': other_color}
+        writeHtmlReport(cube, questions, output_list, 'All', colors, f'{output_dir}/{html}', 'Group comparison')
+        return
+    if facet:
+        charts = getFacetedComparisonCharts(cube, questions, output_list, output_dir, intervals)
+        renderCharts(charts, jobs, getRenderCacheFile(output_dir) if cache else None, plot_version, output_dir, getPdfFile(output_dir, pdf))
+        return
+    # collect the charts to draw, then render them all at once (skipping any that are unchanged since the last run if cache is true)
+    charts = []
+    # loop through the groups and questions
+    for output in output_list:
+        for question in questions:
+            # loop through the items of the question (each statement of a matrix question) and get the counts for each answer
+            for item, question_label, label, answers in getQuestionItems(cube, question):
+                # define the output directory and make it if it doesn't exist (graphs drawn into a pdf don't need it)
+                out_dir = f'{output_dir}/{label}'
+                if not pdf:
+                    os.makedirs(out_dir, exist_ok=True)
                 # get the dataframes for the counts
-                df_count = getAnswerCountDf(answer_counts, answers)
-                df_all_count = getAnswerCountDf(all_data_counts, answers)
-                df_rest_count = getAnswerCountDf(rest_counts, answers)
+                df_count = getCubeCountDf(cube, output, item, answers)
+                df_all_count = getCubeCountDf(cube, 'All', item, answers)
+                df_rest_count = getCubeCountDf(cube, output, item, answers, rest=True)
                 # plot the bar graphs first against all data, then against the rest of the data
-                plotComparisonBarGraph(df_count, df_all_count, q, output, 'All', group_comparison_color, default_color, out_dir)
-                plotComparisonBarGraph(df_count, df_rest_count, q, output, 'Rest', group_comparison_color, other_color, out_dir)
-            elif q == 'Q39_':
-                # kind of a gross way for how I was able to write this for question 39s many groupings
-                df_question = df_data.filter(regex=q)
-                df_question_all = df_allData.filter(regex=q)
-                df_question_rest = rest_of_data.filter(regex=q)
-                # hardcoding the list of answers for this question here
-                q39_answers = ['Strongly disagree','Disagree','Neutral','Somewhat agree','Strongly agree','I do not know']
-                # loop through the columns and get the counts for each answer
-                for col in df_question.columns:
-                    # count the answers for the given question
-                    all_data_counts = df_question_all[col].value_counts() 
-                    answer_counts = df_question[col].value_counts()
-                    rest_counts = df_question_rest[col].value_counts()
-                    # get the dataframes for the counts
-                    df_count = getAnswerCountDf(answer_counts, q39_answers)
-                    df_all_count = getAnswerCountDf(all_data_counts, q39_answers)
-                    df_rest_count = getAnswerCountDf(rest_counts, q39_answers)
-                    # get the number after the '_' in the column name
-                    col_num = col.split('_')[1]
-                    # get the question from the answer file by the column number
-                    question_label = f'{answers[int(col_num)-1]}'
-                    label = f'Q39_{question_label}'
-                    # define the output directory and make it if it doesn't exist
-                    out_dir = f'{output_dir}/{label}'
+                all_args = (df_count, df_all_count, question_label, output, 'All', group_comparison_color, default_color, out_dir)
+                rest_args = (df_count, df_rest_count, question_label, output, 'Rest', group_comparison_color, other_color, out_dir)
+                charts.append((plotComparisonBarGraph, all_args + getChartIntervals(intervals, output, 'All', item)))
+                charts.append((plotComparisonBarGraph, rest_args + getChartIntervals(intervals, output, 'Rest', item)))
+            # all of the statements of a matrix question for the group in one graph, in the folder of the question
+            if question.kind == 'matrix':
+                out_dir = f'{output_dir}/{question.question}'
+                if not pdf:
                     os.makedirs(out_dir, exist_ok=True)
-                    # plot the bar graphs
-                    plotComparisonBarGraph39(df_count, df_all_count, question_label, output, 'All', group_comparison_color, default_color, q39_answers, out_dir)
-                    plotComparisonBarGraph39(df_count, df_rest_count, question_label, output, 'Rest', group_comparison_color, other_color, q39_answers, out_dir)
-
-# get the perception of female vs male respondents for a given question (basically a copy paste of the above but just for these two groups)
-# ideally, would have liked a way to directly do this for every group, but alas
-def plotFemaleVsMale(df_female, df_male, df_answers, question_list, output_list, output_dir): 
-  # plot the graphs for male vs female
-  for q, a in zip(df_answers['Question'], df_answers['Answer']):
-    # separate a (answers column) into a list by the pipe as delimiter
-    answers = a.split('|')
-    # hardcoded labels for this question
-    label1 = 'Female'
-    label2 = 'Male'
-    if q in question_list:
-        # define the output directory and make it if it doesn't exist
-        out_dir = f'{output_dir}/{q}'
-        os.makedirs(out_dir, exist_ok=True)
-        # count the answers for the given question
-        female_counts = countAnswers(df_female, q, answers)
-        male_counts = countAnswers(df_male, q, answers)
-        # get the dataframes for the counts
-        df_female_count = getAnswerCountDf(female_counts, answers)
-        df_male_count = getAnswerCountDf(male_counts, answers)
-        plotComparisonBarGraph(df_female_count, df_male_count, q, label1, label2, group_comparison_color, default_color, out_dir)
-    elif q == 'Q39_':
-        # kind of a gross way for how I was able to write this for question 39s many groupings
-        df_question_female = df_female.filter(regex=q)
-        df_question_male = df_male.filter(regex=q)
-        # hardcoding the list of answers for this question here
-        q39_answers = ['Strongly disagree','Disagree','Neutral','Somewhat agree','Strongly agree','I do not know']
-        # loop through the columns and get the counts for each answer
-        for col in df_question_female.columns:
-            # count the answers for the given question
-            female_counts = df_question_female[col].value_counts()
-            male_counts = df_question_male[col].value_counts()
+                charts.append(getDivergingChart(cube, question, output, output, out_dir))
+    renderCharts(charts, jobs, getRenderCacheFile(output_dir) if cache else None, plot_version, output_dir, getPdfFile(output_dir, pdf))
+
+# get the faceted comparison graph of every question (and every statement of a matrix question), each with a panel per group
+def getFacetedComparisonCharts(cube, questions, output_list, output_dir, intervals=None):
+    charts = []
+    for question in questions:
+        # one graph per item (each statement of a matrix question), labeled like the per group graphs
+        for item, question_label, label, answers in getQuestionItems(cube, question):
+            df_counts = [getCubeCountDf(cube, output, item, answers) for output in output_list]
+            df_all_count = getCubeCountDf(cube, 'All', item, answers)
+            df_rest_counts = [getCubeCountDf(cube, output, item, answers, rest=True) for output in output_list]
+            args = (df_counts, df_all_count, df_rest_counts, question_label, label, output_list, answers, output_dir)
+            if intervals is not None:
+                # the intervals of each group, all of the data and the rest of the group for every panel
+                args += ([(intervals.getIntervals(output, item), intervals.getIntervals('All', item), intervals.getIntervals(output, item, rest=True)) for output in output_list],)
+            charts.append((plotFacetedComparisonGraph, args))
+    return charts
+
+# get the pdf file in the output directory, or None if graphs are drawn to their own files
+def getPdfFile(output_dir, pdf):
+    return f'{output_dir}/{pdf}' if pdf else None
+
+# get the perception of female vs male respondents for a given question (basically a copy paste of the above but just for these two groups);
+# weights is the weight of every respondent of df_female followed by every respondent of df_male, or None to count every respondent once
+def plotFemaleVsMale(df_female, df_male, df_answers, question_list, output_list, output_dir, jobs=1, cache=True, bootstrap=0, significance=None, pdf=None, html=None, weights=None): 
+  schema = compileAnswerKey(df_answers)
+  if significance and weights is not None:
+    raise ValueError('The significance tests need unweighted counts, so they can\'t be run with weights')
+  # hardcoded labels for this question
+  label1 = 'Female'
+  label2 = 'Male'
+  # count every question for both groups in a single pass
+  df_both = concatSurveys([df_female, df_male])
+  in_female = np.arange(len(df_both)) < len(df_female)
+  countEvent('rows', len(df_both))
+  with profileStage('encode'):
+    encoded = encodeSurvey(df_both, schema)
+  with profileStage('count cube'):
+    cube = buildCountCube(encoded, [in_female, ~in_female], [label1, label2], weights=weights)
+  intervals = None
+  if bootstrap > 0:
+    with profileStage('bootstrap'):
+      intervals = bootstrapIntervals(encoded, [in_female, ~in_female], [label1, label2], bootstrap, jobs=jobs, weights=weights)
+      os.makedirs(output_dir, exist_ok=True)
+      writeIntervalTable(cube, intervals, getCompareQuestions(schema, question_list), [label1, label2], f'{output_dir}/bootstrap_intervals.csv')
+  if significance:
+    testAndWriteGroupDifferences(cube, schema, question_list, [(label1, label2)], significance, output_dir)
+  plotGroupVsGroupGraphs(cube, label1, label2, schema, question_list, output_dir, jobs, cache, intervals, pdf, html)
+
+# plot the comparison graphs of one group against another group of a count cube (e.g. female vs male); intervals are optional bootstrap intervals,
+# and if pdf is a file name, every graph is drawn as a page of that pdf in the output directory instead of as its own file;
+# if html is a file name, the counts are written into that html report instead (see plotComparisonGraphs)
+def plotGroupVsGroupGraphs(cube, label1, label2, df_answers, question_list, output_dir, jobs=1, cache=True, intervals=None, pdf=None, html=None):
+    questions = getCompareQuestions(compileAnswerKey(df_answers), question_list)
+    if html:
+        colors = {'group': group_comparison_color, 'other': default_color, 'rest': other_color}
+        writeHtmlReport(cube, questions, [label1, label2], label2, colors, f'{output_dir}/{html}', f'{label1} vs {label2}')
+        return
+    # collect the charts to draw, then render them all at once (skipping any that are unchanged since the last run if cache is true)
+    charts = []
+    for question in questions:
+        # loop through the items of the question (each statement of a matrix question) and get the counts for each answer
+        for item, question_label, label, answers in getQuestionItems(cube, question):
+            # define the output directory and make it if it doesn't exist (graphs drawn into a pdf don't need it)
+            out_dir = f'{output_dir}/{label}'
+            if not pdf:
+                os.makedirs(out_dir, exist_ok=True)
             # get the dataframes for the counts
-            df_female_count = getAnswerCountDf(female_counts, q39_answers)
-            df_male_count = getAnswerCountDf(male_counts, q39_answers)
-            # get the number after the '_' in the column name
-            col_num = col.split('_')[1]
-            # get the question from the answer file by the column number
-            question_label = f'{answers[int(col_num)-1]}'
-            label = f'Q39_{question_label}'
+            df_count1 = getCubeCountDf(cube, label1, item, answers)
+            df_count2 = getCubeCountDf(cube, label2, item, answers)
+            args = (df_count1, df_count2, question_label, label1, label2, group_comparison_color, default_color, out_dir)
+            charts.append((plotComparisonBarGraph, args + getChartIntervals(intervals, label1, label2, item)))
+        # all of the statements of a matrix question for each group in one graph, in the folder of the question
+        if question.kind == 'matrix':
+            out_dir = f'{output_dir}/{question.question}'
+            if not pdf:
+                os.makedirs(out_dir, exist_ok=True)
+            charts += [getDivergingChart(cube, question, label, label, out_dir) for label in [label1, label2]]
+    renderCharts(charts, jobs, getRenderCacheFile(output_dir) if cache else None, plot_version, output_dir, getPdfFile(output_dir, pdf))
+
+# plot the trend of each question for each group across every wave in the wave store (no survey data is read, only the stored counts);
+# questions and groups that are missing from a wave are left out of that wave
+def plotTrendGraphs(question_list, group_list, output_dir, wave_dir=default_wave_dir, jobs=1, cache=True):
+    waves = [readWave(wave, wave_dir) for wave in getWaveNames(wave_dir)]
+    question_map = readQuestionMap(wave_dir)
+    weighted = any(wave.cube.respondents is not None for wave in waves)
+    # collect the charts to draw, then render them all at once (skipping any that are unchanged since the last run if cache is true)
+    charts = []
+    for item in getTrendItems(waves, question_list, question_map):
+        for group in group_list:
+            df_trend, title = getTrendCounts(waves, item, group, question_map)
+            if df_trend.empty:
+                continue
             # define the output directory and make it if it doesn't exist
-            out_dir = f'{output_dir}/{label}'
+            out_dir = f'{output_dir}/{title}'
             os.makedirs(out_dir, exist_ok=True)
-            plotComparisonBarGraph39(df_female_count, df_male_count, question_label, label1, label2, group_comparison_color, default_color, q39_answers, out_dir)
\ No newline at end of file
+            args = (df_trend, title, group, out_dir)
+            if weighted:
+                args += (getTrendCounts(waves, item, group, question_map, respondents=True)[0].sum().to_numpy(),)
+            charts.append((plotTrendGraph, args))
+    renderCharts(charts, jobs, getRenderCacheFile(output_dir) if cache else None, plot_version, output_dir)
+
+# get the chart specs of one row of a report outline with the caption of each (the n of every group shown); all of the data (group 'All')
+# gets the graph of plotGraphs, and any other group gets the comparison graph against the other group ('Rest' for the rest of the data);
+# every statement of a matrix question gets its own chart
+def getOutlineCharts(cube, averages, question, group, other, percent=False):
+    q = question.question
+    for name in [group] + ([] if group == 'All' or other == 'Rest' else [other]):
+        if name not in cube.groups:
+            raise ValueError(f'Unknown group {name} in report outline for {q}')
+    if question.kind == 'slider':
+        df_count = getAnswerCountDf(averages[group][q], question.labels).iloc[::-1]
+        label = q if group == 'All' else f'{q}, {group}'
+        return [((plotAverageBarGraph, (df_count, label, '')), f'{label}, average percent')]
+    charts = []
+    for item, question_label, label, answers in getQuestionItems(cube, question):
+        df_count = getCubeCountDf(cube, group, item, answers)
+        s = getRespondentCount(df_count)
+        if group == 'All':
+            # the answers of single questions are reversed like in plotGraphs
+            df_count = df_count if question.kind == 'matrix' else df_count.iloc[::-1]
+            charts.append(((plotBarGraph, (df_count, label, '', percent)), f'{label}, n={s}'))
+            continue
+        df_other_count = getCubeCountDf(cube, group, item, answers, rest=True) if other == 'Rest' else getCubeCountDf(cube, other, item, answers)
+        s_other = getRespondentCount(df_other_count)
+        color = other_color if other == 'Rest' else default_color
+        chart = (plotComparisonBarGraph, (df_count, df_other_count, question_label, group, other, group_comparison_color, color, ''))
+        charts.append((chart, f'{question_label}, {group} n={s}, {other} n={s_other}'))
+    return charts
+
+# get the blocks of the report (see writeDocx) for every row of a report outline, with the chart specs to draw for it; a new section or
+# question title starts a heading, and each chart is followed by its numbered caption. Image blocks hold the index of their chart spec
+def getReportBlocks(cube, averages, df_answers, df_outline, percent=False):
+    schema = compileAnswerKey(df_answers)
+    blocks, charts = [], []
+    section, title = None, None
+    for row in df_outline.itertuples(index=False):
+        if row.Question not in schema:
+            raise ValueError(f'Unknown question {row.Question} in report outline')
+        if row.Section != section:
+            section, title = row.Section, None
+            blocks.append(('heading1', section))
+        if row.Title != title:
+            title = row.Title
+            blocks.append(('heading2', title))
+        for chart, caption in getOutlineCharts(cube, averages, schema[row.Question], row.Group or 'All', row.Other, percent):
+            blocks.append(('image', len(charts)))
+            blocks.append(('caption', f'Figure {len(charts) + 1}: {caption}'))
+            charts.append(chart)
+    return blocks, charts
+
+# driver function for the report: draw the charts of every row of the report outline into memory (no graph files are written) and write
+# them with their headings and captions into a docx file; averages are the slider question averages of each group (see getSliderAverages)
+def writeReport(cube, averages, df_answers, outline_file, output_file, percent=False, jobs=1):
+    blocks, charts = getReportBlocks(cube, averages, df_answers, readReportOutline(outline_file), percent)
+    buffers = renderBuffers(charts, jobs)
+    with profileStage('write report'):
+        writeDocx([(kind, buffers[content] if kind == 'image' else content) for kind, content in blocks], output_file)
@@ -0,0 +1,133 @@
+import os, re
+import numpy as np, pandas as pd
+
+# the group file kept next to the answer file; if question numbers change in future surveys, change the definitions in there
+default_group_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'groups.csv')
+# the words that combine groups in a definition, e.g. 'Female AND International AND NOT Faculty'
+group_operators = ['AND', 'OR', 'NOT']
+
+# HELPER CLASSES FOR RESPONDENT GROUPS
+# every group compiled into a packed bitset with one bit per respondent row; combining groups is then a bitwise operation
+class GroupIndex:
+    def __init__(self, n_rows):
+        self.n_rows = n_rows
+        self.bits = {}
+        # the bits of the last byte that are past the final row; these are kept at zero
+        self.valid = np.packbits(np.ones(n_rows, dtype=bool))
+
+    # get the names of the defined groups in the order they were defined
+    def getNames(self):
+        return list(self.bits)
+
+    # get the packed bitset for a group name or for any AND/OR/NOT combination of group names
+    def getBits(self, expression, df=None):
+        return evaluateGroupExpression(parseGroupExpression(expression), self, df)
+
+    # get the boolean row mask for a group name or combination of group names
+    def getMask(self, expression, df=None):
+        return np.unpackbits(self.getBits(expression, df), count=self.n_rows).astype(bool)
+
+    # get the row indices of a group or combination of group names, e.g. for a view of a CompactSurvey
+    def getRows(self, expression, df=None):
+        return np.flatnonzero(self.getMask(expression, df))
+
+    # get the number of respondents in a group or combination of group names
+    def getCount(self, expression, df=None):
+        return int(np.unpackbits(self.getBits(expression, df)).sum())
+
+# HELPER FUNCTIONS FOR PARSING GROUP DEFINITIONS
+# split a definition into parentheses, operators and atoms (group names or 'question == value' / 'question in value|value' comparisons)
+def tokenizeGroupExpression(expression):
+    tokens = re.split(r'(\(|\)|\bAND\b|\bOR\b|\bNOT\b)', expression)
+    return [token.strip() for token in tokens if token.strip()]
+
+# parse a definition into a nested tuple: ('and', a, b), ('or', a, b), ('not', a) or ('atom', text); NOT binds tightest, then AND, then OR
+def parseGroupExpression(expression):
+    tokens = tokenizeGroupExpression(expression)
+    position = 0
+
+    def parseOr():
+        nonlocal position
+        node = parseAnd()
+        while position < len(tokens) and tokens[position] == 'OR':
+            position += 1
+            node = ('or', node, parseAnd())
+        return node
+
+    def parseAnd():
+        nonlocal position
+        node = parseNot()
+        while position < len(tokens) and tokens[position] == 'AND':
+            position += 1
+            node = ('and', node, parseNot())
+        return node
+
+    def parseNot():
+        nonlocal position
+        if position >= len(tokens):
+            raise ValueError(f'Incomplete group definition: {expression}')
+        token = tokens[position]
+        position += 1
+        if token == 'NOT':
+            return ('not', parseNot())
+        if token == '(':
+            node = parseOr()
+            if position >= len(tokens) or tokens[position] != ')':
+                raise ValueError(f'Missing closing parenthesis in group definition: {expression}')
+            position += 1
+            return node
+        if token in group_operators or token == ')':
+            raise ValueError(f'Unexpected {token} in group definition: {expression}')
+        return ('atom', token)
+
+    node = parseOr()
+    if position != len(tokens):
+        raise ValueError(f'Unexpected {tokens[position]} in group definition: {expression}')
+    return node
+
+# convert a value from a definition to a number if it looks like one (the survey codes most answers as numbers)
+def getDefinitionValue(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+# get the row mask for a 'question == value' or 'question in value|value' comparison
+def getComparisonMask(df, atom):
+    if '==' in atom:
+        question, value = [part.strip() for part in atom.split('==', 1)]
+        values = [value]
+    else:
+        question, value = [part.strip() for part in re.split(r'\bin\b', atom, maxsplit=1)]
+        values = value.split('|')
+    if question not in df.columns:
+        raise ValueError(f'Unknown question {question} in group definition: {atom}')
+    return df[question].isin([getDefinitionValue(v.strip()) for v in values]).to_numpy()
+
+# evaluate a parsed definition into a packed bitset; atoms are either defined groups or comparisons against the data
+def evaluateGroupExpression(node, group_index, df=None):
+    kind = node[0]
+    if kind == 'and':
+        return evaluateGroupExpression(node[1], group_index, df) & evaluateGroupExpression(node[2], group_index, df)
+    if kind == 'or':
+        return evaluateGroupExpression(node[1], group_index, df) | evaluateGroupExpression(node[2], group_index, df)
+    if kind == 'not':
+        return ~evaluateGroupExpression(node[1], group_index, df) & group_index.valid
+    atom = node[1]
+    if atom in group_index.bits:
+        return group_index.bits[atom]
+    if df is not None and ('==' in atom or re.search(r'\bin\b', atom)):
+        return np.packbits(getComparisonMask(df, atom))
+    raise ValueError(f'Unknown group {atom}')
+
+# DRIVER FUNCTIONS FOR GROUPS
+# read the group file as a pandas dataframe (one Group name and Definition per row)
+def readGroupFile(group_file=default_group_file):
+    return pd.read_csv(group_file, sep=',', header=0)
+
+# compile every group definition once into a packed bitset over the rows of the data; later definitions can use earlier groups
+def compileGroups(df, df_groups):
+    group_index = GroupIndex(len(df))
+    for group, definition in zip(df_groups['Group'], df_groups['Definition']):
+        group_index.bits[group] = group_index.getBits(definition, df)
+    return group_index
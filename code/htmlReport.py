@@ -0,0 +1,188 @@
+import json
+from countCube import getQuestionItems
+
+# the report page; the counts are written in place of the data marker, and every chart is drawn in the browser (as svg) when it is picked,
+# so the page needs no other files and no network access
+report_template = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>/*TITLE*/</title>
+<style>
+  body { font-family: sans-serif; margin: 20px; color: #222; }
+  .controls label { margin-right: 16px; }
+  .controls select { max-width: 420px; }
+  .charts { display: flex; flex-wrap: wrap; gap: 12px; margin-top: 12px; }
+  .charts svg { border: 1px solid #ddd; }
+  table { border-collapse: collapse; margin-top: 12px; font-size: 12px; }
+  td, th { border: 1px solid #ccc; padding: 2px 8px; text-align: right; }
+  td:first-child, th:first-child { text-align: left; }
+</style>
+</head>
+<body>
+<h2>/*TITLE*/</h2>
+<div class="controls">
+  <label>Question <select id="item"></select></label>
+  <label>Group <select id="group"></select></label>
+  <label>Compared with <select id="other"></select></label>
+</div>
+<div class="charts" id="charts"></div>
+<div id="table"></div>
+<script>
+const data = /*DATA*/;
+const svgNS = 'http://www.w3.org/2000/svg';
+const hasAll = data.groups.includes('All');
+
+// get the counts of a group for an item; with key 'respondents', the number of respondents of a weighted item instead
+function getCounts(item, group, key = 'counts') {
+  return item[key][data.groups.indexOf(group)];
+}
+
+function escapeHtml(text) {
+  return String(text).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+}
+
+// get the counts of the group it is compared with; the rest of a group is everyone in All but the group
+function getOtherCounts(item, group, other, key = 'counts') {
+  if (other !== 'Rest') { return getCounts(item, other, key); }
+  const all = getCounts(item, 'All', key), counts = getCounts(item, group, key);
+  return all.map((count, i) => count - counts[i]);
+}
+
+function getSum(counts) {
+  return counts.reduce((a, b) => a + b, 0);
+}
+
+function getPercents(counts) {
+  const n = getSum(counts);
+  return [counts.map(count => n > 0 ? count / n * 100 : 0), n];
+}
+
+// write a count; weighted counts aren't whole numbers of respondents, so they are rounded to one decimal
+function formatCount(item, count) {
+  return item.respondents ? count.toFixed(1) : count;
+}
+
+function getColor(other) {
+  if (other === 'Rest') { return data.colors.rest; }
+  return data.colors.other;
+}
+
+function addElement(parent, name, attributes, text) {
+  const element = document.createElementNS(svgNS, name);
+  for (const key in attributes) { element.setAttribute(key, attributes[key]); }
+  if (text !== undefined) { element.textContent = text; }
+  parent.appendChild(element);
+  return element;
+}
+
+// draw the comparison bar graph of one group against another for an item, like the png comparison graphs
+// (the n of each group is its number of respondents, also when the percentages are weighted)
+function drawChart(item, group, other, width) {
+  const key = item.respondents ? 'respondents' : 'counts';
+  const [percents] = getPercents(getCounts(item, group)), n = getSum(getCounts(item, group, key));
+  const [otherPercents] = getPercents(getOtherCounts(item, group, other)), nOther = getSum(getOtherCounts(item, group, other, key));
+  const height = 360, left = 48, right = 12, top = 28, bottom = 110;
+  const plotWidth = width - left - right, plotHeight = height - top - bottom;
+  const step = plotWidth / item.answers.length, barWidth = step * 0.4;
+  const svg = addElement(document.createDocumentFragment(), 'svg', {width: width, height: height, 'font-size': 11});
+  addElement(svg, 'text', {x: left + plotWidth / 2, y: 16, 'text-anchor': 'middle', 'font-size': 12},
+             `${item.title}, ${group}=${n}, ${other}=${nOther}`);
+  for (let tick = 0; tick <= 100; tick += 20) {
+    const y = top + plotHeight * (1 - tick / 100);
+    addElement(svg, 'line', {x1: left, x2: left + plotWidth, y1: y, y2: y, stroke: '#eee'});
+    addElement(svg, 'text', {x: left - 6, y: y + 4, 'text-anchor': 'end'}, tick);
+  }
+  addElement(svg, 'text', {transform: `translate(12, ${top + plotHeight / 2}) rotate(-90)`, 'text-anchor': 'middle'}, 'Percent');
+  item.answers.forEach((answer, i) => {
+    const x = left + step * (i + 0.5);
+    [[percents[i], data.colors.group, -barWidth, group], [otherPercents[i], getColor(other), 0, other]].forEach(([percent, color, offset, label]) => {
+      const bar = addElement(svg, 'rect', {x: x + offset, y: top + plotHeight * (1 - percent / 100), width: barWidth,
+                                           height: plotHeight * percent / 100, fill: color});
+      addElement(bar, 'title', {}, `${label}: ${percent.toFixed(1)}%`);
+    });
+    addElement(svg, 'text', {transform: `translate(${x}, ${top + plotHeight + 12}) rotate(-45)`, 'text-anchor': 'end'}, answer);
+  });
+  addElement(svg, 'rect', {x: left, y: top, width: plotWidth, height: plotHeight, fill: 'none', stroke: '#222'});
+  [[group, data.colors.group], [other, getColor(other)]].forEach(([label, color], i) => {
+    addElement(svg, 'rect', {x: left + plotWidth - 110, y: top + 8 + i * 16, width: 12, height: 10, fill: color});
+    addElement(svg, 'text', {x: left + plotWidth - 92, y: top + 17 + i * 16}, label);
+  });
+  return svg;
+}
+
+// write the counts and percentages of the shown chart as a table
+function drawTable(item, group, other) {
+  const counts = getCounts(item, group), otherCounts = getOtherCounts(item, group, other);
+  const [percents] = getPercents(counts), [otherPercents] = getPercents(otherCounts);
+  const rows = item.answers.map((answer, i) => `<tr><td>${escapeHtml(answer)}</td><td>${formatCount(item, counts[i])}</td><td>${percents[i].toFixed(1)}</td>` +
+                                               `<td>${formatCount(item, otherCounts[i])}</td><td>${otherPercents[i].toFixed(1)}</td></tr>`);
+  const weighted = item.respondents ? ' (weighted)' : '';
+  return `<table><tr><th>Answer</th><th>${escapeHtml(group)}${weighted}</th><th>%</th><th>${escapeHtml(other)}${weighted}</th><th>%</th></tr>${rows.join('')}</table>`;
+}
+
+// draw the picked chart; with every group picked, draw a smaller chart for each group instead
+function draw() {
+  const item = data.items[document.getElementById('item').value];
+  const group = document.getElementById('group').value, other = document.getElementById('other').value;
+  const charts = document.getElementById('charts');
+  charts.replaceChildren();
+  document.getElementById('table').innerHTML = '';
+  if (group === '') {
+    data.shown.filter(shown => shown !== other).forEach(shown => charts.appendChild(drawChart(item, shown, other, 420)));
+    return;
+  }
+  charts.appendChild(drawChart(item, group, other, 640));
+  document.getElementById('table').innerHTML = drawTable(item, group, other);
+}
+
+function addOption(select, value, text) {
+  const option = document.createElement('option');
+  option.value = value;
+  option.textContent = text;
+  select.appendChild(option);
+}
+
+data.items.forEach((item, i) => addOption(document.getElementById('item'), i, item.label));
+addOption(document.getElementById('group'), '', '(every group)');
+data.shown.forEach(group => addOption(document.getElementById('group'), group, group));
+(hasAll ? ['All', 'Rest'] : []).concat(data.groups.filter(group => group !== 'All')).forEach(group => addOption(document.getElementById('other'), group, group));
+document.getElementById('group').value = data.shown[0];
+document.getElementById('other').value = data.other;
+['item', 'group', 'other'].forEach(id => document.getElementById(id).addEventListener('change', draw));
+draw();
+</script>
+</body>
+</html>
+'''
+
+# HELPER FUNCTIONS FOR THE HTML REPORT
+# get the items of the questions to report in order (each statement of a matrix question is its own item), with the label shown in the
+# question picker, the chart title and the answers of each (labeled like the folders and titles of the comparison graphs)
+def getReportItems(cube, questions):
+    items = []
+    for question in questions:
+        items += [(item, label, title, list(answers)) for item, title, label, answers in getQuestionItems(cube, question) if item in cube.items]
+    return items
+
+# get the data embedded in the report: the counts of every group for each item (and the number of respondents if the counts are weighted),
+# and the groups that can be picked
+def getReportData(cube, questions, shown_groups, other, colors):
+    items = []
+    for item, label, title, answers in getReportItems(cube, questions):
+        start, stop = cube.items[item]
+        items.append({'label': label, 'title': title, 'answers': answers, 'counts': cube.counts[:, start:stop].tolist()})
+        if cube.respondents is not None:
+            items[-1]['respondents'] = cube.respondents[:, start:stop].tolist()
+    return {'groups': cube.groups, 'shown': list(shown_groups), 'other': other, 'colors': colors, 'items': items}
+
+# DRIVER FUNCTIONS FOR THE HTML REPORT
+# write a single html file with the counts of a count cube for the questions, where a question, a group (of shown_groups) and the group
+# to compare it with ('All', 'Rest' or another group of the cube; other is picked first) are chosen from menus and the comparison graph
+# is drawn in the browser; colors are the 'group', 'other' and 'rest' bar colors
+def writeHtmlReport(cube, questions, shown_groups, other, colors, output_file, title='Survey comparison'):
+    data = json.dumps(getReportData(cube, questions, shown_groups, other, colors), separators=(',', ':'))
+    # a '</' in the data (e.g. in an answer) would end the script early
+    page = report_template.replace('/*DATA*/', data.replace('</', '<\\/')).replace('/*TITLE*/', title)
+    with open(output_file, 'w') as f:
+        f.write(page)
@@ -0,0 +1,177 @@
+import os, json, shutil, hashlib
+import numpy as np, pandas as pd
+
+# sentinel stored in int8 code columns for no answer
+missing_code = -128
+# version of the cache layout; increase this whenever the layout changes so that old caches are rebuilt
+cache_version = 1
+
+# HELPER CLASSES FOR THE COMPACT SURVEY
+# the survey as the compact columns of its cache (int8 codes with missing_code for no answer, category codes for text, the smallest type that
+# fits for other numbers), memory-mapped so a column is only read when it is used; rows is None for every respondent, or the row indices of
+# a group, so a group is a view of the same columns instead of a copy of the data. Columns are decoded to pandas one at a time when asked
+# for, so it can be used wherever the analysis takes a dataframe
+class CompactSurvey:
+    def __init__(self, arrays, entries, n_rows, rows=None):
+        self.arrays = arrays
+        self.entries = entries
+        self.n_rows = n_rows
+        self.rows = rows
+        self.columns = pd.Index(list(entries))
+
+    def __len__(self):
+        return self.n_rows if self.rows is None else len(self.rows)
+
+    # get a column decoded to its original type, or a dataframe of a list of columns (only those columns are decoded)
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return decodeColumn(self.getValues(key), self.entries[key])
+        return pd.DataFrame({col: self[col] for col in key})
+
+    # get the compact values of a column for the rows of the view
+    def getValues(self, col):
+        values = self.arrays[col]
+        return values if self.rows is None else values[self.rows]
+
+    # get the view of some of the rows of this view, given as row indices or a boolean row mask (e.g. from GroupIndex.getRows or getMask)
+    def getView(self, rows):
+        rows = np.asarray(rows)
+        rows = np.flatnonzero(rows) if rows.dtype == bool else rows.astype(np.int64)
+        return CompactSurvey(self.arrays, self.entries, self.n_rows, rows if self.rows is None else self.rows[rows])
+
+    # get the boolean mask of the rows of the view over every respondent of the survey
+    def getRowMask(self):
+        if self.rows is None:
+            return np.ones(self.n_rows, dtype=bool)
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.rows] = True
+        return mask
+
+# HELPER FUNCTIONS FOR THE DATA CACHE
+# get the sha256 of a file, reading it in blocks so large exports don't need to fit in memory
+def getFileHash(file_name, block_size=1 << 20):
+    file_hash = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+# get the cache directory for a data file; it is kept next to the data file as a hidden directory
+def getCacheDir(data_file):
+    directory, name = os.path.split(os.path.abspath(data_file))
+    return os.path.join(directory, f'.{name}.cache')
+
+# get the smallest signed integer type that holds every value between low and high
+def getSmallestIntType(low, high):
+    for int_type in [np.int8, np.int16, np.int32]:
+        if np.iinfo(int_type).min <= low and high <= np.iinfo(int_type).max:
+            return int_type
+    return np.int64
+
+# get the compact array for a column and its entry in the schema
+#   code: whole numbers that fit in an int8 (most answers), with missing_code for no answer
+#   number: any other numeric column, stored in the smallest type that keeps every value
+#   category: text columns (e.g. 'Female'/'Male'), stored as integer codes into a list of categories (-1 for missing)
+def encodeColumn(series):
+    entry = {'name': series.name, 'dtype': str(series.dtype)}
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        values = series.to_numpy(dtype=float)
+        present = values[~np.isnan(values)]
+        is_whole = np.array_equal(present, np.round(present))
+        if is_whole and (len(present) == 0 or (present.min() > missing_code and present.max() <= 127)):
+            entry['kind'] = 'code'
+            return np.where(np.isnan(values), missing_code, values).astype(np.int8), entry
+        entry['kind'] = 'number'
+        if is_whole and len(present) == len(values):
+            return values.astype(getSmallestIntType(present.min(), present.max())), entry
+        return (values.astype(np.float32) if np.array_equal(values.astype(np.float32), values, equal_nan=True) else values), entry
+    categorical = pd.Categorical(series)
+    entry['kind'] = 'category'
+    # keep categories json can hold as they are (text, True/False), anything else as text
+    entry['categories'] = [category if isinstance(category, (str, bool)) else str(category) for category in categorical.categories.tolist()]
+    return categorical.codes.astype(getSmallestIntType(-1, len(categorical.categories))), entry
+
+# turn a (possibly memory-mapped) cached array back into a pandas column with its original type
+def decodeColumn(values, entry):
+    if entry['kind'] == 'code':
+        values = np.where(values == missing_code, np.nan, values)
+    elif entry['kind'] == 'category':
+        categorical = pd.Categorical.from_codes(np.asarray(values), entry['categories'])
+        return pd.Series(categorical, name=entry['name']).astype(entry['dtype'])
+    return pd.Series(values, name=entry['name']).astype(entry['dtype'])
+
+# write every column of the dataframe into the cache directory as its own .npy file, plus a schema.json sidecar
+def writeSurveyCache(df, cache_dir, source_hash):
+    # write into a temporary directory first so that a half written cache is never read
+    tmp_dir = f'{cache_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    schema = {'version': cache_version, 'source_hash': source_hash, 'n_rows': len(df), 'columns': []}
+    for i, col in enumerate(df.columns):
+        values, entry = encodeColumn(df[col])
+        entry['file'] = f'{i}.npy'
+        np.save(os.path.join(tmp_dir, entry['file']), values)
+        schema['columns'].append(entry)
+    with open(os.path.join(tmp_dir, 'schema.json'), 'w') as f:
+        json.dump(schema, f, indent=1)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+
+# read the schema of a cache; None if there is no cache, or if it was made from a different source file or cache layout
+def readCacheSchema(cache_dir, source_hash):
+    schema_file = os.path.join(cache_dir, 'schema.json')
+    if not os.path.exists(schema_file):
+        return None
+    with open(schema_file) as f:
+        schema = json.load(f)
+    if schema.get('version') != cache_version or schema.get('source_hash') != source_hash:
+        return None
+    return schema
+
+# read the cached columns as memory-mapped arrays, keyed by column name
+def readCacheArrays(cache_dir, schema):
+    return {entry['name']: np.load(os.path.join(cache_dir, entry['file']), mmap_mode='r') for entry in schema['columns']}
+
+# rebuild the dataframe from the cache directory
+def readSurveyCache(cache_dir, schema):
+    arrays = readCacheArrays(cache_dir, schema)
+    return pd.DataFrame({entry['name']: decodeColumn(arrays[entry['name']], entry) for entry in schema['columns']})
+
+# read the survey csv file without the free text columns (this only analyzes the multiple choice questions)
+def readSurveyCsv(data_file):
+    df = pd.read_csv(data_file, sep=',', header=0)
+    return df.loc[:, ~df.columns.str.contains('TEXT')]
+
+# stack surveys by row: dataframes are concatenated, and views of the same CompactSurvey become one view of all of their rows (nothing is copied)
+def concatSurveys(surveys):
+    if not all(isinstance(survey, CompactSurvey) for survey in surveys):
+        return pd.concat(surveys, ignore_index=True)
+    if any(survey.arrays is not surveys[0].arrays for survey in surveys):
+        raise ValueError('Only views of the same compact survey can be stacked')
+    rows = [np.arange(survey.n_rows) if survey.rows is None else survey.rows for survey in surveys]
+    return CompactSurvey(surveys[0].arrays, surveys[0].entries, surveys[0].n_rows, np.concatenate(rows))
+
+# DRIVER FUNCTIONS FOR READING THE DATA
+# read the survey data; the csv file is only parsed the first time (or after it changes), later runs read the columnar cache
+def readSurvey(data_file, use_cache=True):
+    if not use_cache:
+        return readSurveyCsv(data_file)
+    cache_dir = getCacheDir(data_file)
+    source_hash = getFileHash(data_file)
+    schema = readCacheSchema(cache_dir, source_hash)
+    if schema is None:
+        df = readSurveyCsv(data_file)
+        writeSurveyCache(df, cache_dir, source_hash)
+        return df
+    return readSurveyCache(cache_dir, schema)
+
+# read the survey data as a CompactSurvey of the memory-mapped cache instead of a dataframe; the csv file is only parsed the first time (or after
+# it changes). The answers stay int8 codes instead of float64 columns, so large or pooled exports take a fraction of the memory
+def readCompactSurvey(data_file):
+    cache_dir = getCacheDir(data_file)
+    source_hash = getFileHash(data_file)
+    schema = readCacheSchema(cache_dir, source_hash)
+    if schema is None:
+        writeSurveyCache(readSurveyCsv(data_file), cache_dir, source_hash)
+        schema = readCacheSchema(cache_dir, source_hash)
+    return CompactSurvey(readCacheArrays(cache_dir, schema), {entry['name']: entry for entry in schema['columns']}, schema['n_rows'])
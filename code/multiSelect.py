@@ -0,0 +1,53 @@
+import numpy as np, pandas as pd
+from countCube import default_chunk_size, weighted_columns
+
+# HELPER FUNCTIONS FOR MULTI-SELECT QUESTIONS
+# get the (group x option) number of respondents of each group who selected each option, from one product of the group masks and the
+# (respondent x option) indicator matrix, and the number of respondents of each group who selected any option (weighted sums with weights)
+def getSelectionTallies(indicators, group_masks, weights=None):
+    membership = np.vstack(group_masks).astype(np.float64)
+    if weights is not None:
+        return membership * weights @ indicators, membership * weights @ indicators.any(axis=1)
+    return np.rint(membership @ indicators).astype(np.int64), np.rint(membership @ indicators.any(axis=1)).astype(np.int64)
+
+# get the (group x option x other option) number of respondents of each group who selected both an option and an other option, where
+# other_indicators is the indicator matrix of the same question (option x option) or of another one; every group's indicators are laid
+# side by side so that each chunk of respondents is a single matrix product; with the weight of every respondent, the counts are weighted sums
+def getCooccurrence(indicators, other_indicators, group_masks, chunk_size=default_chunk_size, weights=None):
+    membership = np.vstack(group_masks)
+    n_groups, n_rows = membership.shape
+    n_options, n_other = indicators.shape[1], other_indicators.shape[1]
+    counts = np.zeros((n_groups * n_options, n_other))
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        # (respondent x group*option): the options of each respondent, once for every group they are in
+        grouped = (membership[:, start:stop].T[:, :, None] & indicators[start:stop, None, :]).reshape(stop - start, n_groups * n_options)
+        if weights is None:
+            counts += grouped.T.astype(np.float32) @ other_indicators[start:stop].astype(np.float32)
+        else:
+            counts += grouped.T.astype(np.float64) @ (other_indicators[start:stop] * weights[start:stop, None])
+    counts = counts.reshape(n_groups, n_options, n_other)
+    return np.rint(counts).astype(np.int64) if weights is None else counts
+
+# DRIVER FUNCTIONS FOR MULTI-SELECT QUESTIONS
+# get the long table of how often every option of a multi-select question was selected together with every option of another question
+# (or of the same question) for each group: Group, Question, Option, Other Question, Other Option, Count (respondents who selected both),
+# N (respondents who selected the option) and Percent (of N who also selected the other option; NaN if N is 0); with weights, the counts are
+# weighted (and labeled as weighted), and Respondents is the number of respondents who selected the option
+def getCooccurrenceTable(encoded, question, other_question, group_masks, group_names, weights=None):
+    indicators = encoded.getIndicators(question.question)
+    other_indicators = indicators if other_question is question else encoded.getIndicators(other_question.question)
+    counts = getCooccurrence(indicators, other_indicators, group_masks, weights=weights)
+    n, _ = getSelectionTallies(indicators, group_masks, weights)
+    n = np.repeat(n[:, :, None], counts.shape[2], axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percents = counts / n * 100
+    shape = counts.shape
+    df_table = pd.DataFrame({'Group': np.repeat(np.array(group_names, dtype=object), shape[1] * shape[2]), 'Question': question.question,
+                             'Option': np.tile(np.repeat(question.labels, shape[2]), shape[0]), 'Other Question': other_question.question,
+                             'Other Option': np.tile(other_question.labels, shape[0] * shape[1]), 'Count': counts.ravel(), 'N': n.ravel(), 'Percent': percents.ravel()})
+    if weights is None:
+        return df_table
+    respondents, _ = getSelectionTallies(indicators, group_masks)
+    df_table.insert(df_table.columns.get_loc('N') + 1, 'Respondents', np.repeat(respondents[:, :, None], shape[2], axis=2).ravel())
+    return df_table.rename(columns=weighted_columns)
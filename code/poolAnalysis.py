@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*-coding:utf-8 -*-
+'''
+@File    :   poolAnalysis.py
+@Author  :   Gilbert Loiseau
+@Version :   1.0
+@Contact :   loiseau@wisc.edu
+@License :   (C)Copyright 2023, Gilbert Loiseau
+@Desc    :   Pooled analysis of the IPiB survey across the exports of several programs, from partial counts
+
+Usage: python3 poolAnalysis.py shard <answer_file> <data_file> [<data_file> ...] [--programs NAME ...] [--shard-dir DIR] [--group-file FILE] [--groups GROUP ...]
+                                     [--chunk-size N] [--jobs N]
+       python3 poolAnalysis.py merge <answer_file> [--shard-dir DIR] [--programs NAME ...] [--save-partial NAME [--pool-dir DIR]] [--jobs N] [--significance] [--save-wave WAVE [--wave-dir DIR]]
+                                     [--facet] [--pdf] [--html] [--no-cache]
+
+This script runs in two steps that only share a directory, so each step can run on any machine that sees it:
+    - shard: reads the Qualtrics export of each program (all in the format of the answer file) in chunks and writes its partial counts,
+      <shard_dir>/<program>.npz, with the counts of every answer and the slider statistics of all of its data and every group
+    - merge: adds up the partial counts of every program in the shard directory (or the given programs) and outputs the comparison graphs
+      of every group and every program of the pooled data, and a table of the pooled counts (counts.csv) and slider statistics (sliders.csv).
+      The graphs and tables are saved in a directory called Pooled within the current working directory
+The raw respondent rows never leave the shard step; only the partial counts are merged.
+
+Notes:
+    - Programs are named after their data file (without the .csv) unless --programs is given.
+    - A pooled group is only kept if every partial has it, so run every shard with the same group file and groups.
+    - The merged counts can be saved as a partial themselves (--save-partial), so the pools of several departments can be pooled again.
+      They are saved into --pool-dir (Pools by default), not the shard directory, so that the next merge of the shard directory doesn't
+      count every program twice; a merge of partials that hold the same program is refused.
+'''
+
+import os, argparse
+from countCube import getCountTable
+from functions import plotComparisonGraphs, testAndWriteGroupDifferences
+from groups import default_group_file, readGroupFile
+from schema import readAnswerKey
+from shards import default_shard_dir, default_pool_dir, getPartialFiles, savePartial, shardSurveys, mergePartials
+from sliderStats import getSliderTable
+from stream import default_chunk_size, getStreamCountCube
+from waves import default_wave_dir, saveWave
+
+# Start main
+if __name__ == '__main__':
+    # read in the command line options
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    shard = subparsers.add_parser('shard') # write the partial counts of each export
+    shard.add_argument('answer_file') # answer file
+    shard.add_argument('data_files', nargs='+') # input data file of each program
+    shard.add_argument('--programs', nargs='+') # name of the program of each data file (defaults to the data file names)
+    shard.add_argument('--shard-dir', default=default_shard_dir) # shared directory the partial counts are written to
+    shard.add_argument('--group-file', default=default_group_file) # csv file with the Group name and Definition of each group of respondents
+    shard.add_argument('--groups', nargs='+') # groups or combinations of groups to count (defaults to every group in the group file)
+    shard.add_argument('--chunk-size', type=int, default=default_chunk_size) # number of respondents per chunk
+    shard.add_argument('--jobs', type=int, default=1) # number of processes used to read the exports
+    merge = subparsers.add_parser('merge') # pool the partial counts and output the graphs and tables
+    merge.add_argument('answer_file') # answer file
+    merge.add_argument('--shard-dir', default=default_shard_dir) # shared directory the partial counts are merged from
+    merge.add_argument('--programs', nargs='+') # programs to pool (defaults to every partial in the shard directory)
+    merge.add_argument('--save-partial') # also save the merged counts as the partial counts of this name, to be pooled again
+    merge.add_argument('--pool-dir', default=default_pool_dir) # directory the merged counts are saved into (not the shard directory)
+    merge.add_argument('--jobs', type=int, default=1) # number of processes used to render the graphs
+    merge.add_argument('--significance', nargs='?', const='compared', choices=['compared', 'all']) # test each group and program for differences from the rest and write a ranked table
+    merge.add_argument('--save-wave') # save the pooled counts of every group and program as this survey wave (e.g. 2023) for trends across waves
+    merge.add_argument('--wave-dir', default=default_wave_dir) # directory of the stored survey waves
+    merge.add_argument('--facet', action='store_true') # draw one graph per question with a panel per group instead of two graphs per group
+    merge.add_argument('--pdf', dest='pdf', action='store_const', const='comparison.pdf') # draw every graph as a page of comparison.pdf in the output directory
+    merge.add_argument('--html', dest='html', action='store_const', const='comparison.html') # write the counts into comparison.html in the output directory instead of drawing the graphs
+    merge.add_argument('--no-cache', dest='cache', action='store_false') # redraw every graph, even ones unchanged since the last run
+    args = parser.parse_args()
+
+    if args.command == 'shard':
+        programs = args.programs or [os.path.splitext(os.path.basename(data_file))[0] for data_file in args.data_files]
+        if len(programs) != len(args.data_files):
+            parser.error('--programs needs one name per data file')
+        groups = args.groups or readGroupFile(args.group_file)['Group'].tolist()
+        for partial_file in shardSurveys(args.data_files, programs, args.answer_file, args.group_file, groups, args.shard_dir, args.chunk_size, args.jobs):
+            print(f'Wrote {partial_file}')
+    else:
+        if args.html and (args.pdf or args.facet):
+            parser.error('--html writes the counts instead of drawing the graphs, so it can\'t be combined with --pdf or --facet')
+        partial_files = getPartialFiles(args.shard_dir, args.programs)
+        if len(partial_files) == 0:
+            parser.error(f'No partial counts in {args.shard_dir}; write them with poolAnalysis.py shard')
+        if args.save_partial and os.path.abspath(args.pool_dir) == os.path.abspath(args.shard_dir):
+            parser.error('--pool-dir must differ from --shard-dir, or the next merge of the shard directory would count every program twice')
+        schema = readAnswerKey(args.answer_file)
+        stream, sources = mergePartials(partial_files)
+        if args.save_partial:
+            print(f'Wrote {savePartial(stream, args.save_partial, args.pool_dir, sources)}')
+        cube = getStreamCountCube(stream, schema)
+        # every pooled group and every program is compared with the rest of the pooled data
+        output_list = stream.group_names[1:]
+
+        # define the output directory and make it if it doesn't exist
+        output_dir = 'Pooled'
+        os.makedirs(output_dir, exist_ok=True)
+        questions = [question for question in schema if question.kind != 'slider']
+        getCountTable(cube, questions, stream.group_names).to_csv(f'{output_dir}/counts.csv', index=False)
+        getSliderTable(stream.sliders, schema).to_csv(f'{output_dir}/sliders.csv', index=False)
+        group_compare_question = ['Q4', 'Q5', 'Q8', 'Q9', 'Q10', 'Q11', 'Q20.0', 'Q21', 'Q30', 'Q56', 'Q39']
+        plotComparisonGraphs(cube, schema, group_compare_question, output_list, output_dir, jobs=args.jobs, cache=args.cache, facet=args.facet, pdf=args.pdf, html=args.html)
+        if args.significance:
+            testAndWriteGroupDifferences(cube, schema, group_compare_question, [(output, 'Rest') for output in output_list], args.significance, output_dir)
+        if args.save_wave:
+            saveWave(cube, schema, args.save_wave, args.wave_dir)
@@ -0,0 +1,142 @@
+import os, json, time, resource, threading
+from contextlib import contextmanager
+
+# the profiler of this run; None unless profiling was started (e.g. with --profile), in which case every call below is a no-op
+active_profiler = None
+# seconds between samples of the resident memory of the process
+sample_interval = 0.005
+# number of slowest charts, questions and groups listed in the summary
+summary_length = 10
+
+# HELPER CLASSES FOR PROFILING
+# the stages, charts and counters of a run
+#   stages: one entry per finished stage with its wall time, cpu time and the peak resident memory of the process during the stage
+#   charts: the output file and render time of every chart that was drawn
+#   counters: named counts (rows, groups, charts drawn and skipped, ...)
+class RunProfiler:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = []
+        self.charts = []
+        self.counters = {}
+        self.depth = 0
+
+# samples the resident memory of the process in a background thread and keeps the peak
+class MemorySampler:
+    def __init__(self):
+        self.peak = getResidentMemory()
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, getResidentMemory())
+            time.sleep(sample_interval)
+
+    # stop sampling and get the peak resident memory in bytes
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        return max(self.peak, getResidentMemory())
+
+# HELPER FUNCTIONS FOR PROFILING
+# get the resident memory of this process in bytes; without /proc (e.g. on macOS) this is the peak so far instead
+def getResidentMemory():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return getPeakMemory(resource.RUSAGE_SELF)
+
+# get the peak resident memory of this process (or of its finished child processes, e.g. render workers) in bytes
+def getPeakMemory(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+# get the question and group of a chart from its output file: comparison graphs are saved as <question>/<group>_<other>.png,
+# and graphs of single questions as <question>.png (group 'All')
+def getChartLabels(output_file, output_dir):
+    parts = os.path.relpath(output_file, output_dir).split(os.sep)
+    stem = os.path.splitext(parts[-1])[0]
+    if len(parts) == 1:
+        return stem, 'All'
+    return parts[0], stem.rsplit('_', 1)[0]
+
+# get the total render time of the charts by a label (question or group), slowest first
+def getSlowestCharts(charts, key):
+    totals = {}
+    for chart in charts:
+        totals[chart[key]] = totals.get(chart[key], 0) + chart['seconds']
+    return sorted(totals.items(), key=lambda item: -item[1])[:summary_length]
+
+# DRIVER FUNCTIONS FOR PROFILING
+# start profiling this run
+def startProfiling():
+    global active_profiler
+    active_profiler = RunProfiler()
+
+# check if this run is being profiled
+def isProfiling():
+    return active_profiler is not None
+
+# time a stage of the run (used as 'with profileStage(name):'); stages can be nested
+@contextmanager
+def profileStage(name):
+    if active_profiler is None:
+        yield
+        return
+    sampler = MemorySampler()
+    start, cpu_start = time.perf_counter(), time.process_time()
+    active_profiler.depth += 1
+    try:
+        yield
+    finally:
+        active_profiler.depth -= 1
+        active_profiler.stages.append({'stage': name, 'depth': active_profiler.depth, 'start': start - active_profiler.start,
+                                       'seconds': time.perf_counter() - start, 'cpu_seconds': time.process_time() - cpu_start,
+                                       'peak_rss_mb': sampler.stop() / 2**20})
+
+# add to a named counter
+def countEvent(name, n=1):
+    if active_profiler is not None:
+        active_profiler.counters[name] = active_profiler.counters.get(name, 0) + n
+
+# record the render time of the charts drawn into an output directory
+def recordCharts(output_files, seconds, output_dir):
+    if active_profiler is None:
+        return
+    for output_file, chart_seconds in zip(output_files, seconds):
+        question, group = getChartLabels(output_file, output_dir)
+        active_profiler.charts.append({'file': output_file, 'question': question, 'group': group, 'seconds': chart_seconds})
+
+# get the report of the run as a dictionary
+def getProfileReport():
+    return {'seconds': time.perf_counter() - active_profiler.start,
+            'peak_rss_mb': getPeakMemory(resource.RUSAGE_SELF) / 2**20,
+            'peak_rss_children_mb': getPeakMemory(resource.RUSAGE_CHILDREN) / 2**20,
+            'stages': active_profiler.stages,
+            'counters': active_profiler.counters,
+            'slowest_questions': getSlowestCharts(active_profiler.charts, 'question'),
+            'slowest_groups': getSlowestCharts(active_profiler.charts, 'group'),
+            'charts': active_profiler.charts}
+
+# get a short text summary of the report
+def getProfileSummary(report):
+    lines = [f'total {report["seconds"]:.2f} s, peak memory {report["peak_rss_mb"]:.0f} MB (render workers {report["peak_rss_children_mb"]:.0f} MB)']
+    # stages are recorded as they finish, so list them by when they started
+    for stage in sorted(report['stages'], key=lambda stage: stage['start']):
+        lines.append(f'{"  " * (stage["depth"] + 1)}{stage["stage"]:<24} {stage["seconds"]:8.2f} s {stage["cpu_seconds"]:8.2f} s cpu {stage["peak_rss_mb"]:8.0f} MB')
+    lines.append('counters: ' + ', '.join(f'{name}={count}' for name, count in report['counters'].items()))
+    for key in ['slowest_questions', 'slowest_groups']:
+        if report[key]:
+            lines.append(f'{key.replace("_", " ")}: ' + ', '.join(f'{label} {seconds:.2f} s' for label, seconds in report[key]))
+    return '\n'.join(lines)
+
+# write the report of the run as json and return the text summary
+def writeProfileReport(report_file):
+    report = getProfileReport()
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=1)
+    return getProfileSummary(report)
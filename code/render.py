@@ -0,0 +1,281 @@
+import io, os, json, time, hashlib
+import numpy as np, pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from profiler import profileStage, countEvent, recordCharts
+# matplotlib is only imported by the functions that draw, so that runs that only count (e.g. surveyAnalysis.py counts) never load it
+
+# the figure reused for every chart drawn in this process; each pool worker gets its own
+process_figure = None
+# the pdf that charts are saved into as pages instead of as their own files, while one is being drawn
+process_pdf = None
+# the in-memory png files that charts are saved into instead of their own files, while charts are drawn for a report
+process_buffers = None
+# the chart templates built in this process by layout; each pool worker builds its own
+process_templates = {}
+
+# HELPER CLASSES FOR RENDERING
+# a chart layout (e.g. the comparison bar graph of one answer scale) built once and reused for every chart with that layout: the figure, axes,
+# ticks, bars and legend are made the first time the layout is needed, and each chart only updates the bar heights, colors, legend labels and title
+#   bars: the bar containers of the chart, in the order the plotting function made them
+#   bbox: the area of the figure that is saved, in inches (the tight bounding box of everything but the title and legend), worked out the first time it is saved
+#   background: the drawn pixels of everything that doesn't change between charts (axes, ticks, labels), so png charts only draw what changed
+#   extra: artists that belong to a single chart (e.g. error bars), removed once that chart is saved
+class ChartTemplate:
+    def __init__(self, fig, ax, bars):
+        self.fig = fig
+        self.ax = ax
+        self.bars = bars
+        self.extra = []
+        self.reset()
+
+    # forget the saved area and background, for charts that change the axes (e.g. a count axis that follows the data)
+    def reset(self):
+        self.bbox = None
+        self.background = None
+
+    # get the artists whose size or place changes between charts (the title, and the legend with its labels), so they are added to the
+    # saved area of every chart instead of to the template's
+    def getSizedArtists(self):
+        return [self.ax.title] + ([self.ax.get_legend()] if self.ax.get_legend() is not None else [])
+
+    # get the artists that change between charts
+    def getChartArtists(self):
+        # the spines are drawn again over the bars, like a full draw would
+        artists = [patch for bars in self.bars for patch in bars] + list(self.ax.spines.values()) + [self.ax.title]
+        if self.ax.get_legend() is not None:
+            artists.append(self.ax.get_legend())
+        return artists + [child for artist in self.extra for child in artist.get_children()]
+
+# HELPER FUNCTIONS FOR RENDERING
+# make a new figure drawn with the Agg backend (no pyplot global state)
+def getFigure():
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    return fig
+
+# get the figure for this process, making it the first time it is needed
+def getProcessFigure():
+    global process_figure
+    if process_figure is None:
+        process_figure = getFigure()
+    return process_figure
+
+# get where a chart is saved: its file, or a new in-memory png file while charts are drawn for a report
+def getSaveTarget(output_file):
+    if process_buffers is None:
+        return output_file
+    process_buffers.append(io.BytesIO())
+    return process_buffers[-1]
+
+# save a drawn chart to its file (or as the next page of the pdf being drawn, or into memory), then clear the figure for the next chart;
+# returns the file the chart belongs to
+def saveFigure(fig, output_file):
+    from matplotlib import rcParams
+    if process_pdf is not None:
+        process_pdf.savefig(fig, bbox_inches="tight")
+    else:
+        fig.savefig(getSaveTarget(output_file), format='png', bbox_inches="tight")
+    fig.clf()
+    # charts that change the size of the figure (e.g. faceted graphs) don't change it for the next chart
+    fig.set_size_inches(rcParams['figure.figsize'])
+    return output_file
+
+# get the template of a chart layout for this process, building it with build(fig) on a new figure the first time the layout is needed
+def getChartTemplate(layout, build):
+    if layout not in process_templates:
+        process_templates[layout] = build(getFigure())
+    return process_templates[layout]
+
+# grow a figure with a single axes so that everything drawn around the axes (bbox, in inches; e.g. rotated answer labels below the axes) is
+# inside the figure, keeping the size of the axes; returns the bbox in the grown figure
+def growFigure(fig, ax, bbox):
+    from matplotlib import rcParams
+    pad = rcParams['savefig.pad_inches']
+    width, height = fig.get_size_inches()
+    left, bottom = max(0, pad - bbox.x0), max(0, pad - bbox.y0)
+    right, top = max(0, bbox.x1 + pad - width), max(0, bbox.y1 + pad - height)
+    if left == bottom == right == top == 0:
+        return bbox
+    position = ax.get_position()
+    fig.set_size_inches(width + left + right, height + bottom + top)
+    ax.set_position([(position.x0 * width + left) / (width + left + right), (position.y0 * height + bottom) / (height + bottom + top),
+                     position.width * width / (width + left + right), position.height * height / (height + bottom + top)])
+    return bbox.translated(left, bottom)
+
+# save a chart drawn on a template to its file (or as the next page of the pdf being drawn, or into memory), then remove the artists of this chart only;
+# instead of the extra layout pass of bbox_inches="tight" for every chart, the saved area is the template's area plus the title and legend of this
+# chart (so it doesn't depend on which chart the process drew first), and png charts are drawn over the saved background of the template instead of from scratch
+def saveTemplate(template, output_file):
+    from matplotlib import rcParams
+    from matplotlib.image import imsave
+    from matplotlib.transforms import Bbox
+    fig = template.fig
+    renderer = fig.canvas.get_renderer()
+    artists = template.getChartArtists()
+    sized = template.getSizedArtists()
+    if template.bbox is None:
+        # leave the title and legend out of the template's area; they are the only artists that change size or place between charts (they
+        # are hidden while it is measured, since the axes always count their title)
+        for artist in sized:
+            artist.set_visible(False)
+        template.bbox = growFigure(fig, template.ax, fig.get_tightbbox(renderer))
+        for artist in sized:
+            artist.set_visible(True)
+        # the axes only place their title while it is shown, so place it again in the grown figure
+        template.ax.get_tightbbox(renderer)
+    sized_bboxes = [artist.get_window_extent(renderer).transformed(fig.dpi_scale_trans.inverted()) for artist in sized]
+    bbox = Bbox.union([template.bbox] + sized_bboxes).padded(rcParams['savefig.pad_inches'])
+    # a title or legend that sticks out of the figure doesn't fit on the background, so that chart is drawn the usual way
+    if process_pdf is not None or any(sized_bbox.x0 < 0 or sized_bbox.y0 < 0 or sized_bbox.x1 > fig.get_figwidth() or sized_bbox.y1 > fig.get_figheight()
+                                      for sized_bbox in sized_bboxes):
+        for artist in artists:
+            artist.set_animated(False)
+        if process_pdf is not None:
+            process_pdf.savefig(fig, bbox_inches=bbox)
+        else:
+            fig.savefig(getSaveTarget(output_file), format='png', bbox_inches=bbox)
+    else:
+        # draw everything that doesn't change once (animated artists are left out of a full draw), then only the artists of this chart
+        for artist in artists:
+            artist.set_animated(True)
+        if template.background is None:
+            fig.canvas.draw()
+            template.background = fig.canvas.copy_from_bbox(fig.bbox)
+        fig.canvas.restore_region(template.background)
+        for artist in artists:
+            fig.draw_artist(artist)
+        # crop the drawn figure to the saved area (pixel rows start at the top of the figure); the padding stops at the edge of the figure
+        pixels = np.asarray(fig.canvas.buffer_rgba())
+        height, width = pixels.shape[:2]
+        x0, x1 = max(0, int(bbox.x0 * fig.dpi)), min(width, int(np.ceil(bbox.x1 * fig.dpi)))
+        y0, y1 = max(0, height - int(np.ceil(bbox.y1 * fig.dpi))), min(height, height - int(bbox.y0 * fig.dpi))
+        imsave(getSaveTarget(output_file), pixels[y0:y1, x0:x1], format='png', dpi=fig.dpi)
+    for artist in template.extra:
+        artist.remove()
+    template.extra = []
+    return output_file
+
+# draw a single chart spec; a spec is a (plotting function, arguments) pair and the function saves the chart and returns the saved file;
+# returns the saved file and the seconds it took to draw
+def renderChart(chart):
+    plot_function, args = chart
+    start = time.perf_counter()
+    output_file = plot_function(*args, fig=getProcessFigure())
+    return output_file, time.perf_counter() - start
+
+# draw a single chart spec into memory instead of its file; returns the png file as bytes
+def renderBuffer(chart):
+    global process_buffers
+    process_buffers = []
+    try:
+        renderChart(chart)
+        return process_buffers[0].getvalue()
+    finally:
+        process_buffers = None
+
+# HELPER FUNCTIONS FOR THE RENDER CACHE
+# get the render cache manifest for an output directory; it is kept next to the output directory, not inside it
+def getRenderCacheFile(output_dir):
+    return f'{os.path.normpath(output_dir)}_render_cache.json'
+
+# convert chart arguments into something json can write in a stable way
+def getJsonValue(value):
+    if isinstance(value, pd.DataFrame):
+        return value.to_dict(orient='split')
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Cannot hash chart argument of type {type(value).__name__}')
+
+# get the hash of everything that goes into a chart: the plotting function and its version, the counts, labels, colors and output location
+def getChartKey(chart, version):
+    plot_function, args = chart
+    content = json.dumps([plot_function.__name__, version, args], default=getJsonValue)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+# read the manifest of chart keys and the files they were saved to; empty if there is no manifest yet
+def readRenderCache(cache_file):
+    if cache_file is None or not os.path.exists(cache_file):
+        return {}
+    with open(cache_file) as f:
+        return json.load(f)
+
+# write the manifest, replacing the old one only once the new one is fully written
+def writeRenderCache(cache, cache_file):
+    with open(f'{cache_file}.tmp', 'w') as f:
+        json.dump(cache, f, indent=0, sort_keys=True)
+    os.replace(f'{cache_file}.tmp', cache_file)
+
+# draw a list of chart specs, spread across a pool of jobs processes if jobs is more than 1;
+# if a cache file is given, charts whose key is in the manifest and whose file still exists are skipped;
+# output_dir is only used to label the charts by question and group when the run is profiled;
+# if a pdf file is given, every chart is drawn as a page of that pdf instead (see renderPdf)
+def renderCharts(charts, jobs=1, cache_file=None, version=0, output_dir=os.curdir, pdf_file=None):
+    if pdf_file is not None:
+        return renderPdf(charts, pdf_file, cache_file, version)
+    cache = readRenderCache(cache_file)
+    keys = [getChartKey(chart, version) for chart in charts] if cache_file else [None] * len(charts)
+    todo = [(key, chart) for key, chart in zip(keys, charts) if key not in cache or not os.path.exists(cache[key])]
+    todo_charts = [chart for _, chart in todo]
+    with profileStage('render'):
+        if jobs <= 1 or len(todo_charts) <= 1:
+            rendered = [renderChart(chart) for chart in todo_charts]
+        else:
+            jobs = min(jobs, len(todo_charts))
+            # send a few batches of charts to each worker so that slow charts don't leave the other workers idle
+            chunksize = max(1, len(todo_charts) // (jobs * 4))
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                rendered = list(executor.map(renderChart, todo_charts, chunksize=chunksize))
+    output_files = [output_file for output_file, _ in rendered]
+    # if this run is being profiled, record the time of each chart and how many were skipped by the cache
+    countEvent('charts drawn', len(todo_charts))
+    countEvent('charts skipped', len(charts) - len(todo_charts))
+    recordCharts(output_files, [seconds for _, seconds in rendered], output_dir)
+    if cache_file is None:
+        return
+    # forget the old keys of any redrawn file, then remember the new ones
+    redrawn = set(output_files)
+    cache = {key: output_file for key, output_file in cache.items() if output_file not in redrawn}
+    cache.update({key: output_file for (key, _), output_file in zip(todo, output_files)})
+    writeRenderCache(cache, cache_file)
+
+# draw a list of chart specs into memory (nothing is written to disk), spread across a pool of jobs processes if jobs is more than 1;
+# returns the png file of each chart as bytes, in order
+def renderBuffers(charts, jobs=1):
+    with profileStage('render'):
+        if jobs <= 1 or len(charts) <= 1:
+            buffers = [renderBuffer(chart) for chart in charts]
+        else:
+            jobs = min(jobs, len(charts))
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                buffers = list(executor.map(renderBuffer, charts, chunksize=max(1, len(charts) // (jobs * 4))))
+    countEvent('charts drawn', len(charts))
+    return buffers
+
+# draw every chart spec as a page of one pdf file, in order; the pdf is one file, so it is drawn in this process and only
+# redrawn if any of its pages changed since the last run
+def renderPdf(charts, pdf_file, cache_file=None, version=0):
+    from matplotlib.backends.backend_pdf import PdfPages
+    global process_pdf
+    cache = readRenderCache(cache_file)
+    key = hashlib.sha256(''.join(getChartKey(chart, version) for chart in charts).encode()).hexdigest() if cache_file else None
+    if key in cache and os.path.exists(cache[key]):
+        countEvent('charts skipped', len(charts))
+        return
+    with profileStage('render'):
+        with PdfPages(pdf_file) as pdf:
+            process_pdf = pdf
+            try:
+                for chart in charts:
+                    renderChart(chart)
+            finally:
+                process_pdf = None
+    countEvent('charts drawn', len(charts))
+    if cache_file is None:
+        return
+    cache = {cached_key: output_file for cached_key, output_file in cache.items() if output_file != pdf_file}
+    cache[key] = pdf_file
+    writeRenderCache(cache, cache_file)
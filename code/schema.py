@@ -0,0 +1,112 @@
+import re
+import numpy as np, pandas as pd
+
+# question types in the answer file:
+#   single: one answer per respondent, coded Offset, Offset+1, ... in the order of the answers
+#   multi: multi-select (checkbox) question, one Qxx_n column per option that is 1 when selected
+#   matrix: grid question, one Qxx_n column per statement (the Answer column) answered on the same Scale
+#   slider: Qxx_n columns of numbers that are averaged instead of counted
+question_types = ['single', 'multi', 'matrix', 'slider']
+# types for answer files without a Type column (questions 13 and 14 are sliders and 39 is a grid in this version of the survey)
+default_slider_questions = ['Q13_', 'Q14_']
+default_matrix_questions = ['Q39_']
+# answers left off the agree/disagree scale of matrix questions (e.g. in diverging graphs) for answer files without an Unscaled column
+default_unscaled_answers = ['I do not know', "I don't know", 'Prefer not to answer', 'Not applicable']
+
+# HELPER CLASSES FOR THE ANSWER KEY
+# one question of the answer file, compiled once
+#   labels: the answers (or the statements of a matrix question, or the options of a multi-select question) in order
+#   scale: the answer labels of a matrix question (the same as labels for every other type)
+#   offset: the code of the first answer; for some reason the survey center defined some answers with higher numbers than others
+#   unscaled: the answers of the scale that aren't on it (e.g. I do not know), which diverging graphs leave off the agree/disagree axis
+#   code_index: maps a raw answer code to the index of its answer label (-1 for codes that are not an answer)
+class QuestionSchema:
+    def __init__(self, question, kind, labels, offset=1, scale=None, unscaled=None):
+        self.question = question
+        self.kind = kind
+        self.labels = np.array(labels, dtype=object)
+        self.scale = np.array(scale if scale is not None else labels, dtype=object)
+        self.offset = offset
+        self.unscaled = list(unscaled or [])
+        self.n_answers = len(self.scale)
+        self.code_index = np.full(offset + self.n_answers, -1, dtype=np.int64)
+        self.code_index[offset:] = np.arange(self.n_answers)
+
+    # get the answer index of every raw answer code (-1 for no answer or a code that is not an answer)
+    def getAnswerIndex(self, values):
+        values = np.asarray(values, dtype=float)
+        valid = (values >= 0) & (values < len(self.code_index)) & (values == np.round(values))
+        return np.where(valid, self.code_index[np.where(valid, values, 0).astype(np.int64)], -1)
+
+    # get the columns of the data that belong to the question (the same columns df.filter(regex=q) would give)
+    def getColumns(self, columns):
+        if self.kind == 'single':
+            return [self.question] if self.question in columns else []
+        return [col for col in columns if re.search(self.question, col)]
+
+    # get the number after the '_' of a multi-select, matrix or slider column, as an index into the labels
+    def getColumnIndex(self, col):
+        return int(col.split('_')[1]) - 1
+
+# every question of the answer file in order, keyed by question
+class SurveySchema:
+    def __init__(self, questions):
+        self.questions = questions
+
+    def __getitem__(self, q):
+        return self.questions[q]
+
+    def __contains__(self, q):
+        return q in self.questions
+
+    def __iter__(self):
+        return iter(self.questions.values())
+
+    # get the questions of a given type, in order
+    def getQuestions(self, kind):
+        return [question for question in self if question.kind == kind]
+
+# HELPER FUNCTIONS FOR COMPILING THE ANSWER KEY
+# get the type of a question from the answer file, or from its name if the answer file has no Type column
+def getQuestionType(q, kind=None):
+    if isinstance(kind, str) and kind:
+        if kind not in question_types:
+            raise ValueError(f'Unknown question type {kind} for {q}; expected one of {", ".join(question_types)}')
+        return kind
+    if q in default_slider_questions:
+        return 'slider'
+    if q in default_matrix_questions:
+        return 'matrix'
+    return 'multi' if '_' in q else 'single'
+
+# get the answers of a question's scale that aren't on it from the answer file's Unscaled column (pipe delimited), or the default ones
+# the scale has if the answer file has no Unscaled column
+def getUnscaledAnswers(q, scale, row):
+    if 'Unscaled' not in row:
+        return [answer for answer in scale if answer in default_unscaled_answers]
+    unscaled = row['Unscaled'].split('|') if isinstance(row['Unscaled'], str) else []
+    unknown = [answer for answer in unscaled if answer not in scale]
+    if unknown:
+        raise ValueError(f'Unscaled answers of {q} that aren\'t answers of its scale: {", ".join(unknown)}')
+    return unscaled
+
+# DRIVER FUNCTIONS FOR THE ANSWER KEY
+# compile the answer file (Question, Answer and optional Type, Offset, Scale and Unscaled columns, with pipe delimited answers) into a SurveySchema
+def compileAnswerKey(df_answers):
+    if isinstance(df_answers, SurveySchema):
+        return df_answers
+    questions = {}
+    for _, row in df_answers.iterrows():
+        q = row['Question']
+        kind = getQuestionType(q, row.get('Type'))
+        offset = int(row['Offset']) if 'Offset' in row and pd.notna(row['Offset']) else 1
+        scale = row['Scale'].split('|') if 'Scale' in row and isinstance(row['Scale'], str) else None
+        if kind == 'matrix' and scale is None:
+            raise ValueError(f'Matrix question {q} needs a Scale in the answer file')
+        labels = row['Answer'].split('|')
+        questions[q] = QuestionSchema(q, kind, labels, offset, scale, getUnscaledAnswers(q, scale or labels, row))
+    return SurveySchema(questions)
+
+# read and compile the answer file
+def readAnswerKey(answer_file):
+    return compileAnswerKey(pd.read_csv(answer_file, sep=',', header=0))
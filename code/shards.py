@@ -0,0 +1,100 @@
+import os, json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from stream import StreamCounts, readStream, default_chunk_size
+from sliderStats import reindexSliderStats
+from groups import readGroupFile
+from ingest import getSmallestIntType
+from schema import readAnswerKey
+
+# the shared directory the partial counts of every export are written to (and merged from)
+default_shard_dir = 'Shards'
+# the directory merged counts are saved into as partials (merge --save-partial); it is kept apart from the shard directory so that a pooled
+# partial is never merged again with the programs it already holds
+default_pool_dir = 'Pools'
+
+# HELPER FUNCTIONS FOR PARTIAL COUNTS
+# get the partial counts file of a program (one export) in the shard directory
+def getPartialFile(program, shard_dir=default_shard_dir):
+    return os.path.join(shard_dir, f'{program}.npz')
+
+# get the partial counts files in the shard directory, in name order (or only the ones of the given programs)
+def getPartialFiles(shard_dir=default_shard_dir, programs=None):
+    if programs:
+        return [getPartialFile(program, shard_dir) for program in programs]
+    return [os.path.join(shard_dir, file_name) for file_name in sorted(os.listdir(shard_dir)) if file_name.endswith('.npz')]
+
+# save the running totals of an export as the partial counts of a program: the raw code histograms of every column and group and the
+# slider statistics, but none of the respondent rows; the answer key is only applied when partials are merged. sources are the programs whose
+# exports the counts hold (just the program itself for a shard, every pooled program for merged counts)
+def savePartial(stream, program, shard_dir=default_shard_dir, sources=None):
+    os.makedirs(shard_dir, exist_ok=True)
+    partial_file = getPartialFile(program, shard_dir)
+    sliders = {f'slider_{name}_{i}': getattr(stats, name) for i, stats in enumerate(stream.sliders.values()) for name in ['n', 'means', 'm2', 'histograms']}
+    header = {'program': program, 'sources': sources or [program], 'columns': stream.columns, 'groups': stream.group_names, 'sliders': stream.slider_columns}
+    # write to a temporary file first, so that a merge running at the same time (maybe on another machine) never reads half a partial
+    with open(f'{partial_file}.tmp', 'wb') as f:
+        np.savez_compressed(f, header=json.dumps(header), histograms=stream.histograms.astype(getSmallestIntType(0, stream.histograms.max(initial=0))), **sliders)
+    os.replace(f'{partial_file}.tmp', partial_file)
+    return partial_file
+
+# read the partial counts of a program; returns the program name, the programs whose exports it holds and its StreamCounts
+def readPartial(partial_file):
+    with np.load(partial_file) as data:
+        header = json.loads(str(data['header']))
+        stream = StreamCounts(header['columns'], header['sliders'], header['groups'])
+        stream.histograms = data['histograms'].astype(np.int64)
+        for i, stats in enumerate(stream.sliders.values()):
+            for name in ['n', 'means', 'm2', 'histograms']:
+                setattr(stats, name, data[f'slider_{name}_{i}'])
+    return header['program'], header.get('sources', [header['program']]), stream
+
+# DRIVER FUNCTIONS FOR PARTIAL COUNTS
+# the shard step: read one export in chunks and save its partial counts for all of its data and every group into the shard directory;
+# takes file names so that it can run in a process pool, or on any machine that sees the shard directory
+def shardSurvey(data_file, answer_file, group_file, group_names, program, shard_dir=default_shard_dir, chunk_size=default_chunk_size):
+    stream = readStream(data_file, readAnswerKey(answer_file), readGroupFile(group_file), group_names, chunk_size)
+    return savePartial(stream, program, shard_dir)
+
+# run the shard step for several exports (each its own program) on a pool of processes; returns the partial counts files
+def shardSurveys(data_files, programs, answer_file, group_file, group_names, shard_dir=default_shard_dir, chunk_size=default_chunk_size, jobs=1):
+    arguments = [(data_file, answer_file, group_file, group_names, program, shard_dir, chunk_size) for data_file, program in zip(data_files, programs)]
+    if jobs <= 1 or len(arguments) <= 1:
+        return [shardSurvey(*argument) for argument in arguments]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(shardSurvey, *zip(*arguments)))
+
+# the merge step: add up the partial counts of any number of programs into pooled running totals; the pooled groups are the groups every
+# partial has (a group missing from one partial would leave its respondents out), followed by one group per program with all of its data.
+# Partials that hold the same program (e.g. a pooled partial and one of the shards it was merged from) can't be merged, since its respondents
+# would be counted twice; returns the pooled running totals and the programs whose exports they hold
+def mergePartials(partial_files):
+    partials = [readPartial(partial_file) for partial_file in partial_files]
+    if len(partials) == 0:
+        raise ValueError('No partial counts to merge')
+    sources = [source for _, partial_sources, _ in partials for source in partial_sources]
+    repeated = sorted({source for source in sources if sources.count(source) > 1})
+    if repeated:
+        raise ValueError(f'More than one partial holds the counts of {", ".join(repeated)}, so they would be counted twice; merge either a pooled partial or the partials it was merged from, not both')
+    partials = [(program, stream) for program, _, stream in partials]
+    programs = [program for program, _ in partials]
+    group_names = [group for group in partials[0][1].group_names if all(group in stream.group_names for _, stream in partials)]
+    if len(set(programs)) < len(programs) or set(programs) & set(group_names):
+        raise ValueError(f'Program names must be unique and differ from the group names: {", ".join(programs)}')
+    # the columns (and slider columns) of every partial in the order they first appear; a column an export doesn't have gets no answers from it
+    columns = list(dict.fromkeys(col for _, stream in partials for col in stream.columns))
+    slider_columns = {}
+    for _, stream in partials:
+        for q, cols in stream.slider_columns.items():
+            slider_columns[q] = list(dict.fromkeys(slider_columns.get(q, []) + cols))
+    merged = StreamCounts(columns, slider_columns, group_names + programs)
+    for i, (program, stream) in enumerate(partials):
+        # the group of the partial each pooled group is taken from: the same group, and the program's own group is all of its data
+        source_groups = group_names + [None] * len(programs)
+        source_groups[len(group_names) + i] = 'All'
+        targets = [g for g, source in enumerate(source_groups) if source is not None]
+        rows = [stream.group_names.index(source_groups[g]) for g in targets]
+        merged.histograms[np.ix_(targets, [columns.index(col) for col in stream.columns])] += stream.histograms[rows]
+        for q, stats in stream.sliders.items():
+            merged.sliders[q].merge(reindexSliderStats(stats, slider_columns[q], merged.group_names, source_groups))
+    return merged, sources
@@ -0,0 +1,140 @@
+import math
+import numpy as np, pandas as pd
+
+# tables with an expected cell count below this are tested with Fisher's exact test when they are 2 x 2
+min_expected_count = 5
+# vectorized complementary error function (numpy has none)
+erfc = np.frompyfunc(math.erfc, 1, 1)
+
+# HELPER FUNCTIONS FOR CONTINGENCY TABLES
+# get the (table x 2 x answer) contingency tables of every item for every (group, other) pair straight from the count cube;
+# other is another group of the cube, or 'Rest' for everyone in 'All' but the group. Items with fewer answers are padded with zero columns
+def getContingencyTables(cube, items, pairs):
+    n_answers = max(cube.items[item][1] - cube.items[item][0] for item in items)
+    # (item x answer) slot index into the cube, with -1 for padding
+    slots = np.full((len(items), n_answers), -1)
+    for i, item in enumerate(items):
+        start, stop = cube.items[item]
+        slots[i, :stop - start] = np.arange(start, stop)
+    counts = np.hstack([cube.counts, np.zeros((len(cube.groups), 1), dtype=cube.counts.dtype)])
+    group_rows, other_rows = [], []
+    for group, other in pairs:
+        group_rows.append(counts[cube.groups.index(group)])
+        other_rows.append(counts[cube.groups.index('All')] - group_rows[-1] if other == 'Rest' else counts[cube.groups.index(other)])
+    # gather every table in one indexing step: (pair x item x 2 x answer), then flatten the pairs and items
+    rows = np.stack([np.stack(group_rows), np.stack(other_rows)], axis=1)
+    tables = rows[:, :, slots].transpose(0, 2, 1, 3)
+    return tables.reshape(-1, 2, n_answers).astype(float)
+
+# HELPER FUNCTIONS FOR THE TESTS
+# get the upper tail probability of the chi-square distribution for whole number degrees of freedom (Abramowitz and Stegun 26.4.4 and 26.4.5)
+def getChiSquareTail(x, df):
+    x, df = np.asarray(x, dtype=float), np.asarray(df)
+    half = x / 2
+    # even degrees of freedom: exp(-x/2) * sum of (x/2)^r / r! for r < df/2
+    term = np.exp(-half)
+    even = np.where(df >= 2, term, 0.0)
+    # odd degrees of freedom: 2 * normal tail(sqrt(x)) + 2 * normal density(sqrt(x)) * sum of x^(r-1/2) / (1*3*...*(2r-1)) for 1 <= r <= (df-1)/2
+    root = np.sqrt(x)
+    odd = np.asarray(erfc(root / np.sqrt(2)), dtype=float)
+    odd_term = np.exp(-half) / np.sqrt(2 * np.pi) * 2
+    for r in range(1, int(df.max(initial=0)) // 2 + 1):
+        term = term * half / r
+        even = even + np.where(df >= 2 * r + 2, term, 0.0)
+        odd_term = odd_term * (root if r == 1 else x / (2 * r - 1))
+        odd = odd + np.where(df >= 2 * r + 1, odd_term, 0.0)
+    return np.where(df % 2 == 0, even, odd).clip(0, 1)
+
+# get the chi-square statistic, degrees of freedom, p-value and smallest expected count of every table;
+# answers nobody in either row gave are left out of the table
+def chiSquareTests(tables):
+    row_totals = tables.sum(axis=2, keepdims=True)
+    column_totals = tables.sum(axis=1, keepdims=True)
+    n = row_totals.sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = row_totals * column_totals / n
+        cells = np.where(expected > 0, (tables - expected) ** 2 / expected, 0)
+    statistic = cells.sum(axis=(1, 2))
+    df = np.maximum((column_totals[:, 0] > 0).sum(axis=1) - 1, 0) * ((row_totals[:, :, 0] > 0).sum(axis=1) - 1).clip(min=0)
+    min_expected = np.where(column_totals > 0, expected, np.inf).min(axis=(1, 2))
+    p = np.where(df > 0, getChiSquareTail(statistic, df), np.nan)
+    return statistic, df, p, min_expected
+
+# get the two-sided p-value of Fisher's exact test for a batch of 2 x 2 tables ([[a, b], [c, d]]) from their hypergeometric distributions
+def fisherExactTests(tables):
+    a, b, c, d = (tables[:, i, j].astype(np.int64) for i, j in [(0, 0), (0, 1), (1, 0), (1, 1)])
+    row1, column1, n = a + b, a + c, a + b + c + d
+    log_factorials = np.concatenate([[0], np.cumsum(np.log(np.arange(1, n.max(initial=0) + 1)))])
+    # every possible top left cell for each table, as a (table x value) grid masked to the values the margins allow
+    x = np.arange(np.minimum(row1, column1).max(initial=0) + 1)[None, :]
+    low, high = np.maximum(0, row1 + column1 - n)[:, None], np.minimum(row1, column1)[:, None]
+    valid = (x >= low) & (x <= high)
+    xs = np.where(valid, x, low)
+    def getLogProbability(k):
+        return (log_factorials[column1[:, None]] - log_factorials[k] - log_factorials[column1[:, None] - k]
+                + log_factorials[(n - column1)[:, None]] - log_factorials[row1[:, None] - k] - log_factorials[(n - column1 - row1)[:, None] + k]
+                - log_factorials[n[:, None]] + log_factorials[row1[:, None]] + log_factorials[(n - row1)[:, None]])
+    log_p = getLogProbability(xs)
+    observed = getLogProbability(a[:, None])
+    # sum the probabilities of every table at most as likely as the observed one (with a little slack for rounding)
+    return np.where(valid & (log_p <= observed + 1e-7), np.exp(log_p), 0).sum(axis=1).clip(0, 1)
+
+# get the Benjamini-Hochberg false discovery rate adjusted p-values (q-values); NaN p-values are left out and stay NaN
+def adjustFalseDiscoveryRate(p):
+    p = np.asarray(p, dtype=float)
+    q = np.full(len(p), np.nan)
+    tested = np.nonzero(~np.isnan(p))[0]
+    order = tested[np.argsort(p[tested])]
+    ranked = p[order] * len(order) / np.arange(1, len(order) + 1)
+    q[order] = np.minimum.accumulate(ranked[::-1])[::-1].clip(max=1)
+    return q
+
+# get the items of the questions to test; multi-select questions are left out because the cube only counts selections, not
+# the respondents who saw the question and didn't select an option, so their tables don't follow a chi-square distribution
+def getTestItems(cube, questions):
+    items = []
+    for question in questions:
+        if question.kind == 'matrix':
+            items += cube.getMatrixItems(question.question)
+        elif question.kind == 'single':
+            items.append(question.question)
+    return items
+
+# DRIVER FUNCTIONS FOR SIGNIFICANCE TESTING
+# test every item of the questions for every (group, other) pair of the count cube in one batch: a chi-square test of the (2 x answer) table,
+# or Fisher's exact test if it is a 2 x 2 table with a small expected count; returns one table ranked by p-value, with Cramer's V as the
+# size of the difference and the false discovery rate adjusted q-value across every test
+def testGroupDifferences(cube, questions, pairs):
+    items = getTestItems(cube, questions)
+    if len(items) == 0 or len(pairs) == 0:
+        return pd.DataFrame(columns=['Group', 'Other', 'Question', 'Test', 'Statistic', 'DF', 'N', 'N Other', 'Cramers V', 'P', 'Q'])
+    tables = getContingencyTables(cube, items, pairs)
+    statistic, df, p, min_expected = chiSquareTests(tables)
+    # Fisher's exact test for the 2 x 2 tables with small expected counts (the answers nobody gave are dropped first)
+    fisher = (df == 1) & (min_expected < min_expected_count)
+    if fisher.any():
+        small = tables[fisher]
+        order = np.argsort(small.sum(axis=1) == 0, axis=1, kind='stable')[:, :2]
+        p[fisher] = fisherExactTests(np.take_along_axis(small, order[:, None, :], axis=2))
+    n = tables.sum(axis=2)
+    # Cramer's V divides by the smaller of (rows - 1) and (answers - 1) of the table without its empty rows and answers
+    k = np.minimum((n > 0).sum(axis=1), (tables.sum(axis=1) > 0).sum(axis=1)) - 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cramers_v = np.sqrt(statistic / n.sum(axis=1) / np.maximum(k, 1))
+    df_tests = pd.DataFrame({
+        'Group': np.repeat([group for group, _ in pairs], len(items)),
+        'Other': np.repeat([other for _, other in pairs], len(items)),
+        'Question': np.tile(items, len(pairs)),
+        'Test': np.where(fisher, 'fisher', 'chi-square'),
+        'Statistic': statistic,
+        'DF': df,
+        'N': n[:, 0].astype(int),
+        'N Other': n[:, 1].astype(int),
+        'Cramers V': np.where(df > 0, cramers_v, np.nan),
+        'P': p,
+        'Q': adjustFalseDiscoveryRate(p)})
+    return df_tests.sort_values(['P', 'Group', 'Question'], na_position='last', kind='stable').reset_index(drop=True)
+
+# write the ranked table of tests into a csv file
+def writeSignificanceTable(df_tests, output_file):
+    df_tests.to_csv(output_file, index=False)
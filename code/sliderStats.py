@@ -0,0 +1,139 @@
+import numpy as np, pandas as pd
+from countCube import weighted_columns
+
+# slider answers are percentages from 0 to 100; the quantile sketch keeps one bin per whole percent, so the quantiles of whole number
+# answers are exact (answers in between are rounded to the nearest bin, and answers outside the range go into the end bins)
+slider_range = (0, 100)
+n_slider_bins = 101
+# the quantiles reported for every slider: the quartiles
+slider_quantiles = [0.25, 0.5, 0.75]
+
+# HELPER CLASSES FOR SLIDER STATISTICS
+# one-pass accumulators of every column of a slider question for every group; they never keep the answers themselves, so the accumulators
+# of chunks, shards or waves can be merged into the accumulators of all of them:
+#   n: (group x column) number of answers; blanks are skipped column by column, so a respondent who left one slider blank still counts for the rest
+#   means/m2: (group x column) mean of the answers and sum of their squared differences from it (for the variance)
+#   histograms: (group x column x bin) number of answers in each bin of the quantile sketch
+#   respondents: (group x column) number of respondents who answered when n is weighted, so that the real n can be shown (None when it isn't)
+class SliderStats:
+    def __init__(self, columns, group_names):
+        self.columns = list(columns)
+        self.group_names = list(group_names)
+        self.n = np.zeros((len(self.group_names), len(self.columns)), dtype=np.int64)
+        self.means = np.zeros(self.n.shape)
+        self.m2 = np.zeros(self.n.shape)
+        self.histograms = np.zeros(self.n.shape + (n_slider_bins,), dtype=np.int64)
+        self.respondents = None
+
+    # add the answers of a (row x column) block of respondents; group_masks has one boolean row mask per group. With the weight of every
+    # respondent, n and the histograms are sums of weights and the means and variances are weighted
+    def add(self, block, group_masks, weights=None):
+        block = np.asarray(block, dtype=float)
+        membership = np.vstack(group_masks).astype(float)
+        answered = ~np.isnan(block)
+        if weights is not None:
+            self.respondents = (0 if self.respondents is None else self.respondents) + np.rint(membership @ answered).astype(np.int64)
+            membership = membership * weights
+        values = np.where(answered, block, 0)
+        # the count, mean and m2 of the block for every group from three matrix products, merged into the running totals
+        n = membership @ answered
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(n > 0, (membership @ values) / n, 0)
+        m2 = np.maximum(membership @ (values * values) - n * means * means, 0)
+        self.mergeMoments(n.astype(np.int64) if weights is None else n, means, m2)
+        # bin every answer and count the bins of every group and column in one bincount, like buildCountCube
+        bins = getSliderBins(values)
+        group_idx, row_idx = np.nonzero(membership)
+        flat = (group_idx[:, None] * len(self.columns) + np.arange(len(self.columns))) * n_slider_bins + bins[row_idx]
+        bin_weights = None if weights is None else np.broadcast_to(membership[group_idx, row_idx][:, None], flat.shape)[answered[row_idx]]
+        self.histograms = self.histograms + np.bincount(flat[answered[row_idx]], bin_weights, minlength=self.histograms.size).reshape(self.histograms.shape)
+
+    # merge the count, mean and m2 of other answers into the running totals (Chan et al.'s pairwise update, so no answer is revisited)
+    def mergeMoments(self, n, means, m2):
+        total = self.n + n
+        delta = means - self.means
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.means = np.where(total > 0, self.means + delta * n / total, 0)
+            self.m2 = np.where(total > 0, self.m2 + m2 + delta * delta * self.n * n / total, 0)
+        self.n = total
+
+    # merge the accumulators of the same question and groups from another chunk, shard or wave into these
+    def merge(self, other):
+        if other.columns != self.columns or other.group_names != self.group_names:
+            raise ValueError('Slider statistics can only be merged for the same columns and groups')
+        self.mergeMoments(other.n, other.means, other.m2)
+        self.histograms = self.histograms + other.histograms
+        if other.respondents is not None:
+            self.respondents = (0 if self.respondents is None else self.respondents) + other.respondents
+
+    # get the (group x column) sample variances (NaN with fewer than two answers)
+    def getVariances(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.n > 1, self.m2 / (self.n - 1), np.nan)
+
+    # get the (group x column) quantile q of the answers from the sketch, interpolated between answers like pandas' quantile (NaN with no answers)
+    def getQuantiles(self, q):
+        cumulative = self.histograms.cumsum(axis=-1)
+        position = q * np.maximum(self.n - 1, 0)
+        centers = np.linspace(*slider_range, n_slider_bins)
+        # the value of the k-th smallest answer is the center of the first bin with more than k answers up to it
+        lower = centers[np.minimum((cumulative <= np.floor(position)[..., None]).sum(axis=-1), n_slider_bins - 1)]
+        upper = centers[np.minimum((cumulative <= np.ceil(position)[..., None]).sum(axis=-1), n_slider_bins - 1)]
+        return np.where(self.n > 0, lower + (upper - lower) * (position - np.floor(position)), np.nan)
+
+    # get the averages of each column for a group, in the same form as getAnswerAverage (index starting at 1; NaN for columns without answers)
+    def getAverages(self, group):
+        g = self.group_names.index(group)
+        return pd.Series(np.where(self.n[g] > 0, self.means[g], np.nan), index=range(1, len(self.columns) + 1))
+
+# HELPER FUNCTIONS FOR SLIDER STATISTICS
+# get the quantile sketch bin of every answer
+def getSliderBins(values):
+    low, high = slider_range
+    return np.clip(np.rint((values - low) * (n_slider_bins - 1) / (high - low)), 0, n_slider_bins - 1).astype(np.int64)
+
+# get slider statistics for other columns and groups from the statistics of one shard, so that they can be merged with statistics that have
+# more columns or groups; source_groups names the group of stats each group is taken from (groups with None, and columns stats doesn't have, are left empty)
+def reindexSliderStats(stats, columns, group_names, source_groups):
+    reindexed = SliderStats(columns, group_names)
+    targets = [g for g, source in enumerate(source_groups) if source is not None]
+    rows = [stats.group_names.index(source_groups[g]) for g in targets]
+    index = np.ix_(targets, [reindexed.columns.index(col) for col in stats.columns])
+    for name in ['n', 'means', 'm2', 'histograms']:
+        getattr(reindexed, name)[index] = getattr(stats, name)[rows]
+    return reindexed
+
+# DRIVER FUNCTIONS FOR SLIDER STATISTICS
+# get the slider statistics of every slider question of the schema for each group, weighted by the weight of every respondent if given:
+# {question: SliderStats}
+def getSliderStats(df, schema, group_masks, group_names, weights=None):
+    sliders = {}
+    for question in schema.getQuestions('slider'):
+        columns = question.getColumns(df.columns)
+        sliders[question.question] = SliderStats(columns, group_names)
+        sliders[question.question].add(df[columns].to_numpy(dtype=float), group_masks, weights)
+    return sliders
+
+# get the averages of every slider question for each group from their statistics, in the form streamSurvey returns them: {group: {question: averages}}
+def getStatsAverages(sliders, group_names):
+    return {group: {q: stats.getAverages(group) for q, stats in sliders.items()} for group in group_names}
+
+# get a long table of the distribution of every slider for each group: the number of answers, mean, standard deviation and quartiles;
+# sliders are labeled with their answer from the answer file. Weighted statistics have a Weighted N (the sum of the weights) and Respondents
+# (the number of respondents who answered) instead of N
+def getSliderTable(sliders, schema):
+    tables = []
+    for q, stats in sliders.items():
+        question = schema[q]
+        labels = [question.labels[question.getColumnIndex(col)] if question.getColumnIndex(col) < len(question.labels) else col for col in stats.columns]
+        q1, median, q3 = [stats.getQuantiles(quantile) for quantile in slider_quantiles]
+        means = np.where(stats.n > 0, stats.means, np.nan)
+        for g, group in enumerate(stats.group_names):
+            df_table = pd.DataFrame({'Group': group, 'Question': q, 'Answer': labels, 'N': stats.n[g], 'Mean': means[g],
+                                     'SD': np.sqrt(stats.getVariances()[g]), 'Q1': q1[g], 'Median': median[g], 'Q3': q3[g], 'IQR': q3[g] - q1[g]})
+            if stats.respondents is not None:
+                df_table.insert(df_table.columns.get_loc('N') + 1, 'Respondents', stats.respondents[g])
+            tables.append(df_table)
+    columns = ['Group', 'Question', 'Answer', 'N', 'Mean', 'SD', 'Q1', 'Median', 'Q3', 'IQR']
+    df_tables = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=columns)
+    return df_tables.rename(columns=weighted_columns) if any(stats.respondents is not None for stats in sliders.values()) else df_tables
@@ -0,0 +1,106 @@
+import numpy as np, pandas as pd
+from countCube import CountCube
+from schema import compileAnswerKey
+from groups import compileGroups
+from sliderStats import SliderStats, getStatsAverages
+
+# number of respondents read from the csv file at once; peak memory depends on this, not on the size of the export
+default_chunk_size = 50000
+# answers are counted by their raw whole number code, 0 up to (but not including) this
+n_raw_codes = 128
+
+# HELPER CLASSES FOR STREAMING
+# running totals for every group over the chunks read so far:
+#   histograms: (group x column x raw code) counts for every counted column
+#   sliders: per slider question, the SliderStats of every group (count, mean, variance and quantile sketch of each slider)
+class StreamCounts:
+    def __init__(self, columns, slider_columns, group_names):
+        self.columns = columns
+        self.slider_columns = slider_columns
+        self.group_names = group_names
+        self.histograms = np.zeros((len(group_names), len(columns), n_raw_codes), dtype=np.int64)
+        self.sliders = {q: SliderStats(cols, group_names) for q, cols in slider_columns.items()}
+
+# HELPER FUNCTIONS FOR STREAMING
+# get every counted column and the columns of each slider question from the header of the data file
+def getStreamColumns(columns, schema):
+    counted, sliders = [], {}
+    for question in schema:
+        if question.kind == 'slider':
+            sliders[question.question] = question.getColumns(columns)
+        else:
+            counted += [col for col in question.getColumns(columns) if col not in counted]
+    return counted, sliders
+
+# add the answers of one chunk of respondents to the running totals; group_masks has one boolean row mask per group
+def accumulateChunk(stream, chunk, group_masks):
+    membership = np.vstack(group_masks)
+    n_columns = len(stream.columns)
+    # count the raw codes of every counted column for every group in one bincount, like buildCountCube
+    raw = chunk[stream.columns].to_numpy(dtype=float)
+    valid = (raw >= 0) & (raw < n_raw_codes) & (raw == np.round(raw))
+    codes = np.where(valid, raw, 0).astype(np.int64) + np.arange(n_columns) * n_raw_codes
+    group_idx, row_idx = np.nonzero(membership)
+    flat = group_idx[:, None] * (n_columns * n_raw_codes) + codes[row_idx]
+    stream.histograms += np.bincount(flat[valid[row_idx]], minlength=stream.histograms.size).reshape(stream.histograms.shape)
+    # add the slider answers to the slider statistics (blank sliders are skipped one at a time)
+    for q, cols in stream.slider_columns.items():
+        stream.sliders[q].add(chunk[cols].to_numpy(dtype=float), group_masks)
+
+# turn the raw code histograms into a count cube with the same items and answer slots as buildCountCube(encodeSurvey(...))
+def getStreamCountCube(stream, schema):
+    column_index = {col: i for i, col in enumerate(stream.columns)}
+    pieces, items, n_slots = [], {}, 0
+    for question in schema:
+        if question.kind == 'slider':
+            continue
+        question_columns = [column_index[col] for col in question.getColumns(stream.columns)]
+        if question.kind == 'matrix':
+            # each statement is its own item; all statements share the same answer scale
+            for col in question_columns:
+                pieces.append(getAnswerCounts(stream.histograms[:, col], question))
+                items[stream.columns[col]] = (n_slots, n_slots + question.n_answers)
+                n_slots += question.n_answers
+            continue
+        if question.kind == 'multi':
+            # a selected checkbox (code 1) counts towards the option numbered after the '_'
+            counts = np.zeros((len(stream.group_names), question.n_answers), dtype=np.int64)
+            for col in question_columns:
+                option = question.getColumnIndex(stream.columns[col])
+                if option < question.n_answers:
+                    counts[:, option] += stream.histograms[:, col, 1]
+        else:
+            counts = getAnswerCounts(stream.histograms[:, question_columns[0]], question)
+        pieces.append(counts)
+        items[question.question] = (n_slots, n_slots + question.n_answers)
+        n_slots += question.n_answers
+    counts = np.hstack(pieces) if pieces else np.zeros((len(stream.group_names), 0), dtype=np.int64)
+    return CountCube(counts, stream.group_names, items)
+
+# get the (group x answer) counts of a question from its (group x raw code) histogram using the question's code offset
+def getAnswerCounts(histogram, question):
+    counts = histogram[:, question.offset:question.offset + question.n_answers]
+    # pad with zeros if the codes of the histogram stop before the last answer
+    return np.pad(counts, ((0, 0), (0, question.n_answers - counts.shape[1])))
+
+# DRIVER FUNCTIONS FOR STREAMING
+# read the data file in chunks and add every chunk to the running totals of all of the data and every group, without holding the whole
+# export in memory; returns the StreamCounts (groups 'All' followed by group_names)
+def readStream(data_file, df_answers, df_groups, group_names, chunk_size=default_chunk_size):
+    columns = pd.read_csv(data_file, sep=',', header=0, nrows=0).columns
+    columns = [col for col in columns if 'TEXT' not in col]
+    schema = compileAnswerKey(df_answers)
+    counted, sliders = getStreamColumns(columns, schema)
+    stream = StreamCounts(counted, sliders, ['All'] + list(group_names))
+    # only read the columns that are not free text
+    for chunk in pd.read_csv(data_file, sep=',', header=0, chunksize=chunk_size, usecols=lambda col: 'TEXT' not in col):
+        group_index = compileGroups(chunk, df_groups)
+        group_masks = [np.ones(len(chunk), dtype=bool)] + [group_index.getMask(group, chunk) for group in group_names]
+        accumulateChunk(stream, chunk, group_masks)
+    return stream
+
+# read the data file in chunks and count every question for all of the data and every group;
+# returns the count cube (groups 'All' followed by group_names) and the slider question averages of every group
+def streamSurvey(data_file, df_answers, df_groups, group_names, chunk_size=default_chunk_size):
+    stream = readStream(data_file, df_answers, df_groups, group_names, chunk_size)
+    return getStreamCountCube(stream, compileAnswerKey(df_answers)), getStatsAverages(stream.sliders, stream.group_names)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*-coding:utf-8 -*-
+'''
+@File    :   surveyAnalysis.py
+@Author  :   Gilbert Loiseau
+@Version :   1.0
+@Contact :   loiseau@wisc.edu
+@License :   (C)Copyright 2023, Gilbert Loiseau
+@Desc    :   Command line for counting, comparing and plotting the IPiB survey by question and group
+
+Usage: python3 surveyAnalysis.py counts <data_file> <answer_file> [--questions Q ...] [--groups GROUP ...] [--format csv|json|parquet] [--output FILE]
+       python3 surveyAnalysis.py compare <data_file> <answer_file> [--questions Q ...] [--groups GROUP ...] [--other Rest|All|GROUP] [--significance]
+                                 [--format csv|json|parquet] [--output FILE]
+       python3 surveyAnalysis.py sliders <data_file> <answer_file> [--questions Q ...] [--groups GROUP ...] [--format csv|json|parquet] [--output FILE]
+       python3 surveyAnalysis.py cooccur <data_file> <answer_file> --questions Q [Q] [--groups GROUP ...] [--format csv|json|parquet] [--output FILE]
+       python3 surveyAnalysis.py crosstab <data_file> <answer_file> --questions Q Q [--groups GROUP ...] [--heatmap DIR [--jobs N]] [--no-cache] [--format csv|json|parquet] [--output FILE]
+       python3 surveyAnalysis.py plot <data_file> <answer_file> [--questions Q ...] [--groups GROUP ...] [--output-dir DIR] [--jobs N] [--facet] [--pdf] [--html] [--no-cache]
+       (every subcommand also takes [--group-file FILE] [--weights FILE] [--stream [--chunk-size N]], except cooccur and crosstab, which need the
+       whole data file; --weights needs it too)
+
+This script takes in a csv file with the survey data and a csv file with the questions and answers, and runs one analysis:
+    - counts: a table of the count and percentage of every answer of each question for all of the data and each group
+    - compare: a table comparing every answer of each question between each group and another group (the rest of the data by default),
+      or with --significance, the table of tests of each group against the other group
+    - sliders: a table of the distribution of every slider question (13 and 14) for all of the data and each group: the number of answers,
+      mean, standard deviation and quartiles of each slider
+    - cooccur: a table of how often each option of a multi-select question was selected together with each other option of it, or with each
+      option of a second multi-select question (e.g. the reasons for harassment in Q27 with who it was from in Q28), for all of the data and each group
+    - crosstab: a table of the contingency table of two single choice (or matrix) questions for all of the data and each group (e.g. Q30
+      experienced harassment by Q56), with the count of every pair of answers and the percentage of each answer of the first question that gave
+      each answer of the second; with --heatmap, each table is also drawn as a heatmap in that directory
+    - plot: the comparison graphs of each group against all of the data and the rest of the data, saved in the output directory
+Tables are written as csv, json (one record per row) or parquet to the output file, or as csv or json to the screen if there is none.
+
+Notes:
+    - Only the questions given with --questions are read and counted (every counted question by default), so reruns of one question are fast;
+      matrix questions can be given with or without the '_' (e.g. Q39). Slider questions are only read by the sliders subcommand.
+    - cooccur, like crosstab, puts the first question given in the rows of the table (the percents are of the respondents who chose each row option).
+    - crosstab counts every pair of single choice questions at once the first time and caches them next to the data file, so any later pair
+      (with the same answer file and groups) is read from the cache without reading the data file.
+    - With --weights, every respondent is weighted to the population margins of that csv file (Question, Answer and Population of each answer
+      of a single choice question, e.g. the number of people in each role of Q58) by raking, and every count, percentage and average is weighted.
+      The weighted columns are labeled as weighted (e.g. Weighted Count, Weighted N), and counts, compare, sliders and cooccur also write the
+      number of Respondents next to them.
+      compare --significance can't be combined with it, because the tests need the counts of respondents.
+    - matplotlib is only loaded by the plot subcommand and crosstab --heatmap.
+'''
+
+import os, sys, argparse
+import numpy as np
+from countCube import encodeSurvey, getGroupMasks, buildCountCube, getCountTable, getComparisonTable, getQuestionItems
+from crossTabs import crosstab_types, getCrossTabs, getCrossTabTable
+from multiSelect import getCooccurrenceTable
+from functions import plotComparisonGraphs, plotCrossTabHeatmap, plot_version
+from groups import default_group_file, readGroupFile, compileGroups
+from ingest import readCompactSurvey
+from schema import SurveySchema, readAnswerKey
+from significance import testGroupDifferences
+from sliderStats import getSliderStats, getSliderTable
+from stream import default_chunk_size, streamSurvey, readStream
+from weights import readMarginFile, getSurveyWeights
+from render import renderCharts
+
+# table formats and the file extensions that pick them
+table_formats = {'csv': '.csv', 'json': '.json', 'parquet': '.parquet'}
+
+# HELPER FUNCTIONS FOR THE COMMAND LINE
+# get the questions to count (or the slider questions, if sliders is true) from the --questions names (every one if there are none);
+# names that match no question are returned too
+def getQuestions(schema, question_list, sliders=False):
+    if not question_list:
+        return [question for question in schema if (question.kind == 'slider') == sliders], []
+    names = [q.rstrip('_') for q in question_list]
+    questions = [question for question in schema if question.question.rstrip('_') in names and (question.kind == 'slider') == sliders]
+    unknown = [q for q, name in zip(question_list, names) if not any(question.question.rstrip('_') == name for question in questions)]
+    return questions, unknown
+
+# read the whole data file and get the row masks of all of the data and each group, and the weight of every respondent if there is a margin file
+def readSurveyGroups(args, groups):
+    df_data = readCompactSurvey(args.data_file)
+    group_index = compileGroups(df_data, readGroupFile(args.group_file))
+    weights = getSurveyWeights(df_data, readAnswerKey(args.answer_file), readMarginFile(args.weights)) if args.weights else None
+    return df_data, getGroupMasks(df_data, [np.ones(len(df_data), dtype=bool)] + [group_index.getMask(group, df_data) for group in groups]), weights
+
+# count the questions for all of the data and each group, reading only the columns of the questions; returns the count cube
+def countSurvey(args, questions, groups):
+    schema = SurveySchema({question.question: question for question in questions})
+    if args.stream:
+        cube, _ = streamSurvey(args.data_file, schema, readGroupFile(args.group_file), groups, args.chunk_size)
+        return cube
+    df_data, group_masks, weights = readSurveyGroups(args, groups)
+    return buildCountCube(encodeSurvey(df_data, schema), group_masks, ['All'] + groups, weights=weights)
+
+# get the slider statistics of the slider questions for all of the data and each group: {question: SliderStats}
+def getSurveySliders(args, questions, groups):
+    schema = SurveySchema({question.question: question for question in questions})
+    if args.stream:
+        return readStream(args.data_file, schema, readGroupFile(args.group_file), groups, args.chunk_size).sliders
+    df_data, group_masks, weights = readSurveyGroups(args, groups)
+    return getSliderStats(df_data, schema, group_masks, ['All'] + groups, weights)
+
+# get the co-occurrence table of one multi-select question with itself, or of the first question with the second, for all of the data and each group
+def getSurveyCooccurrence(args, questions, groups):
+    df_data, group_masks, weights = readSurveyGroups(args, groups)
+    encoded = encodeSurvey(df_data, SurveySchema({question.question: question for question in questions}))
+    return getCooccurrenceTable(encoded, questions[0], questions[-1], group_masks, ['All'] + groups, weights)
+
+# write a table in the chosen format (or the one of the output file's extension) to the output file, or to the screen if there is none
+def writeTable(df_table, output_file, table_format):
+    table_format = table_format or next((name for name, extension in table_formats.items() if output_file and output_file.endswith(extension)), 'csv')
+    if table_format == 'parquet':
+        df_table.to_parquet(output_file, index=False)
+    elif table_format == 'json':
+        text = df_table.to_json(output_file, orient='records', indent=1)
+        if output_file is None:
+            print(text)
+    else:
+        df_table.to_csv(output_file or sys.stdout, index=False)
+
+# Start main
+if __name__ == '__main__':
+    # read in the command line options; every subcommand takes the data file, the answer file and the question and group filters
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('data_file') # input data file
+    common.add_argument('answer_file') # answer file
+    common.add_argument('--questions', nargs='+') # questions to count (defaults to every counted question in the answer file)
+    common.add_argument('--groups', nargs='+') # groups or combinations of groups to count (defaults to every group in the group file)
+    common.add_argument('--group-file', default=default_group_file) # csv file with the Group name and Definition of each group of respondents
+    common.add_argument('--stream', action='store_true') # read the data file in chunks instead of all at once (for exports too big for memory)
+    common.add_argument('--chunk-size', type=int, default=default_chunk_size) # number of respondents per chunk when streaming
+    common.add_argument('--weights') # csv file with the population margins (Question, Answer, Population) to weight the respondents to
+    tables = argparse.ArgumentParser(add_help=False)
+    tables.add_argument('--format', choices=list(table_formats)) # format of the table (defaults to the extension of the output file, or csv)
+    tables.add_argument('--output') # file to write the table to (defaults to the screen; parquet needs a file)
+    subparsers.add_parser('counts', parents=[common, tables]) # count every answer for all of the data and each group
+    subparsers.add_parser('sliders', parents=[common, tables]) # the distribution of every slider for all of the data and each group
+    subparsers.add_parser('cooccur', parents=[common, tables]) # how often the options of one or two multi-select questions are selected together
+    crosstab = subparsers.add_parser('crosstab', parents=[common, tables]) # the contingency table of two questions
+    crosstab.add_argument('--heatmap') # directory to draw a heatmap of each contingency table in
+    crosstab.add_argument('--jobs', type=int, default=1) # number of processes used to draw the heatmaps
+    crosstab.add_argument('--no-cache', dest='cache', action='store_false') # count every pair of questions again instead of reading the cached cross-tabs
+    compare = subparsers.add_parser('compare', parents=[common, tables]) # compare every answer between each group and another group
+    compare.add_argument('--other', default='Rest') # group to compare each group with: Rest (the rest of the data), All or another group
+    compare.add_argument('--significance', action='store_true') # write the tests of each group against the other group instead of the answers
+    plot = subparsers.add_parser('plot', parents=[common]) # draw the comparison graphs of each group
+    plot.add_argument('--output-dir', default='Questions') # directory the graphs are saved in
+    plot.add_argument('--jobs', type=int, default=1) # number of processes used to render the graphs
+    plot.add_argument('--facet', action='store_true') # draw one graph per question with a panel per group instead of two graphs per group
+    plot.add_argument('--pdf', dest='pdf', action='store_const', const='comparison.pdf') # draw every graph as a page of comparison.pdf in the output directory
+    plot.add_argument('--html', dest='html', action='store_const', const='comparison.html') # write the counts into comparison.html in the output directory instead of drawing the graphs
+    plot.add_argument('--no-cache', dest='cache', action='store_false') # redraw every graph, even ones unchanged since the last run
+    args = parser.parse_args()
+    if getattr(args, 'format', None) == 'parquet' and not args.output:
+        parser.error('--format parquet needs an --output file')
+    if args.weights and args.stream:
+        parser.error('--weights rakes every respondent to the margins, so it needs the whole data file (not --stream)')
+    if args.weights and getattr(args, 'significance', False):
+        parser.error('--significance tests counts of respondents; weighted counts would make its p-values look more certain than they are, so it can\'t be combined with --weights')
+
+    schema = readAnswerKey(args.answer_file)
+    questions, unknown = getQuestions(schema, args.questions, sliders=args.command == 'sliders')
+    if unknown:
+        parser.error(f'unknown questions: {" ".join(unknown)}' if args.command == 'sliders' else f'unknown or uncounted questions: {" ".join(unknown)}')
+    if args.command == 'crosstab':
+        if args.stream:
+            parser.error('crosstab needs the answers of every respondent, so it needs the whole data file (not --stream)')
+        if len(questions) != 2 or any(question.kind not in crosstab_types for question in questions):
+            parser.error('crosstab needs --questions with two single choice or matrix questions (e.g. Q30 Q56)')
+    if args.command == 'cooccur':
+        if args.stream:
+            parser.error('cooccur needs the selections of every respondent, so it needs the whole data file (not --stream)')
+        if not 1 <= len(questions) <= 2 or any(question.kind != 'multi' for question in questions):
+            parser.error('cooccur needs --questions with one or two multi-select questions (e.g. Q27 Q28)')
+    if args.command in ['crosstab', 'cooccur']:
+        # the first question given is the rows of the table
+        questions.sort(key=lambda question: [q.rstrip('_') for q in args.questions].index(question.question.rstrip('_')))
+    groups = args.groups or readGroupFile(args.group_file)['Group'].tolist()
+    # the group every group is compared with is counted too
+    if args.command == 'compare' and args.other not in ['All', 'Rest'] + groups:
+        groups = groups + [args.other]
+    if args.command == 'sliders':
+        writeTable(getSliderTable(getSurveySliders(args, questions, groups), schema), args.output, args.format)
+        sys.exit(0)
+    if args.command == 'crosstab':
+        crosstabs = getCrossTabs(args.data_file, schema, readGroupFile(args.group_file), groups, args.cache, readMarginFile(args.weights) if args.weights else None)
+        items, other_items = [[item for item, _, _, _ in getQuestionItems(crosstabs, question)] for question in questions]
+        writeTable(getCrossTabTable(crosstabs, items, other_items, ['All'] + groups), args.output, args.format)
+        if args.heatmap:
+            os.makedirs(args.heatmap, exist_ok=True)
+            charts = [(plotCrossTabHeatmap, (crosstabs.getTable(item, other_item, group), f'{item} by {other_item}, {group}', f'{item}_{other_item}_{group}', args.heatmap))
+                      for group in ['All'] + groups for item in items for other_item in other_items]
+            renderCharts(charts, args.jobs, None, plot_version, args.heatmap)
+        sys.exit(0)
+    if args.command == 'cooccur':
+        writeTable(getSurveyCooccurrence(args, questions, groups), args.output, args.format)
+        sys.exit(0)
+    cube = countSurvey(args, questions, groups)
+
+    if args.command == 'counts':
+        writeTable(getCountTable(cube, questions, ['All'] + groups), args.output, args.format)
+    elif args.command == 'compare':
+        pairs = [(group, args.other) for group in groups if group != args.other]
+        df_table = testGroupDifferences(cube, questions, pairs) if args.significance else getComparisonTable(cube, questions, pairs)
+        writeTable(df_table, args.output, args.format)
+    else:
+        os.makedirs(args.output_dir, exist_ok=True)
+        plotComparisonGraphs(cube, SurveySchema({question.question: question for question in questions}), [question.question for question in questions],
+                             groups, args.output_dir, args.jobs, args.cache, facet=args.facet, pdf=args.pdf, html=args.html)
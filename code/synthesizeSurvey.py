@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*-coding:utf-8 -*-
+'''
+@File    :   synthesizeSurvey.py
+@Author  :   Gilbert Loiseau
+@Version :   1.0
+@Contact :   loiseau@wisc.edu
+@License :   (C)Copyright 2023, Gilbert Loiseau
+@Desc    :   Synthetic survey exports with the same layout as the real one, for benchmarking
+
+Usage: python3 synthesizeSurvey.py <data_file> <answer_file> <output_file> --rows N [--seed N] [--chunk-size N]
+
+This script takes in the real survey csv file (as the template for the column layout) and the answer file, and writes a
+synthetic export with the same columns and N respondents. Every column is sampled from the answer distribution of the real
+data, so group sizes and missing answers look like production data:
+    - single choice and matrix questions: the answer codes of the answer file, weighted by how often each was given (every
+      answer keeps a small chance, so answers nobody gave in the template still show up in large exports)
+    - multi-select (Qxx_n) columns: selected (1) or not (empty) at the real selection rate
+    - sliders and every other column: the values of the real column, at their real frequencies
+    - free text (TEXT columns, and text columns with many different answers): placeholder text at the real answer rate
+'''
+
+import argparse
+import numpy as np, pandas as pd
+from schema import readAnswerKey
+
+# text columns with more different answers than this are free text, not categories (e.g. Female/Male)
+max_categories = 20
+# chance given to every answer of the answer file on top of the real counts
+answer_smoothing = 0.5
+# placeholder for free text answers; the real free text is never copied
+placeholder_text = 'Lorem ipsum dolor sit amet'
+# number of respondents generated and written at once
+default_chunk_size = 50000
+
+# HELPER CLASSES FOR SYNTHETIC DATA
+# the values of one column and the probability of each (NaN for no answer)
+class ColumnModel:
+    def __init__(self, name, values, probabilities):
+        self.name = name
+        self.values = np.array(values, dtype=object)
+        self.probabilities = np.asarray(probabilities, dtype=float) / np.sum(probabilities)
+
+    # draw the column for n respondents
+    def sample(self, rng, n):
+        return self.values[rng.choice(len(self.values), size=n, p=self.probabilities)]
+
+# HELPER FUNCTIONS FOR SYNTHETIC DATA
+# get the model of a column from its real values, making sure every answer code in codes can be drawn
+def getColumnModel(series, codes=None):
+    counts = series.value_counts(dropna=False)
+    values, weights = list(counts.index), counts.to_numpy(dtype=float)
+    if codes is not None:
+        missing = [code for code in codes if code not in counts.index]
+        values += missing
+        weights = np.concatenate([weights, np.zeros(len(missing))]) + answer_smoothing * np.isin(values, codes)
+    return ColumnModel(series.name, values, weights)
+
+# get the model of a free text column: the placeholder text at the real answer rate
+def getTextModel(series):
+    answered = series.notna().sum()
+    return ColumnModel(series.name, [placeholder_text, np.nan], [answered, len(series) - answered])
+
+# get the model of every column of the template export, using the answer file for the answer codes of each question
+def getSurveyModels(df_template, schema):
+    question_codes = {}
+    for question in schema:
+        if question.kind in ['single', 'matrix']:
+            codes = list(range(question.offset, question.offset + question.n_answers))
+            for col in question.getColumns(df_template.columns):
+                if 'TEXT' not in col:
+                    question_codes[col] = codes
+    models = []
+    for col in df_template.columns:
+        series = df_template[col]
+        is_text = not pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+        if 'TEXT' in col or (is_text and series.nunique() > max_categories):
+            models.append(getTextModel(series))
+        else:
+            models.append(getColumnModel(series, question_codes.get(col)))
+    return models
+
+# DRIVER FUNCTIONS FOR SYNTHETIC DATA
+# write a synthetic export with n_rows respondents in chunks, so exports of millions of respondents don't need to fit in memory
+def writeSyntheticSurvey(df_template, df_answers, output_file, n_rows, seed=0, chunk_size=default_chunk_size):
+    models = getSurveyModels(df_template, readAnswerKey(df_answers) if isinstance(df_answers, str) else df_answers)
+    rng = np.random.default_rng(seed)
+    for start in range(0, max(n_rows, 1), chunk_size):
+        n = min(chunk_size, n_rows - start)
+        chunk = pd.DataFrame({model.name: model.sample(rng, n) for model in models})
+        # keep whole numbers written without a decimal point, like the real export
+        for col in chunk.columns:
+            if pd.api.types.is_integer_dtype(df_template[col]):
+                chunk[col] = chunk[col].astype(df_template[col].dtype)
+        chunk.to_csv(output_file, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+# Start main
+if __name__ == '__main__':
+    # read in the command line options
+    parser = argparse.ArgumentParser()
+    parser.add_argument('data_file') # real survey data file, used as the template for the columns and answer distributions
+    parser.add_argument('answer_file') # answer file
+    parser.add_argument('output_file') # synthetic csv file to write
+    parser.add_argument('--rows', type=int, required=True) # number of respondents to generate
+    parser.add_argument('--seed', type=int, default=0) # random seed, so the same export can be made again
+    parser.add_argument('--chunk-size', type=int, default=default_chunk_size) # number of respondents generated and written at once
+    args = parser.parse_args()
+
+    df_template = pd.read_csv(args.data_file, sep=',', header=0)
+    writeSyntheticSurvey(df_template, readAnswerKey(args.answer_file), args.output_file, args.rows, args.seed, args.chunk_size)
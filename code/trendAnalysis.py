@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*-coding:utf-8 -*-
+'''
+@File    :   trendAnalysis.py
+@Author  :   Gilbert Loiseau
+@Version :   1.0
+@Contact :   loiseau@wisc.edu
+@License :   (C)Copyright 2023, Gilbert Loiseau
+@Desc    :   Year over year trends of the IPiB survey from the stored survey waves
+
+Usage: python3 trendAnalysis.py [--wave-dir DIR] [--questions Q ...] [--groups GROUP ...] [--jobs N] [--no-cache]
+
+This script reads the counts of every survey wave saved with comparisonAnalysis.py --save-wave and
+outputs a line plot for each question and group with the percentage of each answer across the waves.
+The line plots are saved in a directory called Trends within the current working directory.
+
+Notes:
+    - No survey data is read here; adding a wave only needs one run of comparisonAnalysis.py --save-wave on its data file.
+    - If a question was renumbered (or its answers reworded) in a later survey, add a row to question_map.csv in the wave
+      directory with the Wave, the Question in that wave and the Canonical question name to use across waves, plus optional
+      Answers as old=new pairs separated by '|' (e.g. 2024,Q21.0,Q20.0,Very often=Very Often). Questions ending in '_'
+      rename all of their columns (e.g. 2024,Q40_,Q39_).
+'''
+
+import os, argparse
+from functions import plotTrendGraphs
+from waves import default_wave_dir, getWaveNames, readWave
+
+# Start main
+if __name__ == '__main__':
+    # read in the command line options
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--wave-dir', default=default_wave_dir) # directory of the stored survey waves
+    parser.add_argument('--questions', nargs='+', default=['Q4', 'Q5', 'Q8', 'Q9', 'Q10', 'Q11', 'Q20.0', 'Q21', 'Q30', 'Q56', 'Q39']) # questions to plot
+    parser.add_argument('--groups', nargs='+') # groups to plot (defaults to All and every group of the latest wave)
+    parser.add_argument('--jobs', type=int, default=1) # number of processes used to render the graphs
+    parser.add_argument('--no-cache', dest='cache', action='store_false') # redraw every graph, even ones unchanged since the last run
+    args = parser.parse_args()
+
+    waves = getWaveNames(args.wave_dir)
+    if len(waves) == 0:
+        parser.error(f'No survey waves in {args.wave_dir}; save one with comparisonAnalysis.py --save-wave')
+
+    # define the output directory and make it if it doesn't exist
+    output_dir = 'Trends'
+    os.makedirs(output_dir, exist_ok=True)
+
+    # plot every question for every group across the waves
+    group_list = args.groups or readWave(waves[-1], args.wave_dir).cube.groups
+    plotTrendGraphs(args.questions, group_list, output_dir, args.wave_dir, jobs=args.jobs, cache=args.cache)
@@ -0,0 +1,128 @@
+import os, json
+import numpy as np, pandas as pd
+from countCube import CountCube
+from schema import compileAnswerKey
+from ingest import getSmallestIntType
+
+# the wave store kept next to the answer file: one compressed count cube per survey wave
+default_wave_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'waves')
+# the question map kept in the wave store; renames the questions (and answers) of a wave to the names used across waves
+question_map_file = 'question_map.csv'
+
+# HELPER CLASSES FOR THE WAVE STORE
+# the stored count cube of one wave, with the answer labels and chart title of every item so that no answer file is needed to plot it
+class Wave:
+    def __init__(self, name, cube, labels, titles):
+        self.name = name
+        self.cube = cube
+        self.labels = labels
+        self.titles = titles
+
+# HELPER FUNCTIONS FOR THE WAVE STORE
+# get the answer labels and chart title of every item of the cube from the answer file (matrix statements are titled like the comparison graphs)
+def getItemLabels(cube, schema):
+    labels, titles = {}, {}
+    for question in schema:
+        if question.kind == 'slider':
+            continue
+        if question.kind == 'matrix':
+            for col in cube.getMatrixItems(question.question):
+                labels[col] = question.scale.tolist()
+                titles[col] = f'{question.question}{question.labels[question.getColumnIndex(col)]}'
+        elif question.question in cube.items:
+            labels[question.question] = question.labels.tolist()
+            titles[question.question] = question.question
+    return labels, titles
+
+# get the file of a wave in the store
+def getWaveFile(wave, wave_dir=default_wave_dir):
+    return os.path.join(wave_dir, f'{wave}.npz')
+
+# get the names of every stored wave in order (wave names such as years or dates sort in time order)
+def getWaveNames(wave_dir=default_wave_dir):
+    if not os.path.isdir(wave_dir):
+        return []
+    return sorted(file_name[:-4] for file_name in os.listdir(wave_dir) if file_name.endswith('.npz'))
+
+# read the question map of the store (Wave, Question, Canonical and optional Answers columns) into {wave: {question: (canonical, answer renames)}};
+# Answers holds pipe delimited old=new pairs for answers that were reworded. Empty if there is no question map yet
+def readQuestionMap(wave_dir=default_wave_dir):
+    map_file = os.path.join(wave_dir, question_map_file)
+    if not os.path.exists(map_file):
+        return {}
+    question_map = {}
+    for _, row in pd.read_csv(map_file, sep=',', header=0, dtype=str).iterrows():
+        answers = row.get('Answers')
+        renames = dict(pair.split('=', 1) for pair in answers.split('|')) if isinstance(answers, str) and answers else {}
+        question_map.setdefault(row['Wave'], {})[row['Question']] = (row['Canonical'], renames)
+    return question_map
+
+# get the name used across waves for an item of a wave, and the answer renames for it; questions ending in '_' rename every item they prefix
+# (e.g. Q39_ -> Q40_ renames Q39_1 to Q40_1)
+def getCanonicalItem(item, wave_map):
+    if item in wave_map:
+        return wave_map[item]
+    for question, (canonical, renames) in wave_map.items():
+        if question.endswith('_') and item.startswith(question):
+            return canonical + item[len(question):], renames
+    return item, {}
+
+# DRIVER FUNCTIONS FOR THE WAVE STORE
+# save the count cube of a wave (e.g. from analyzeAndPlotComparisonGraphs or streamSurvey) into the store, replacing the wave if it was saved before
+def saveWave(cube, df_answers, wave, wave_dir=default_wave_dir):
+    labels, titles = getItemLabels(cube, compileAnswerKey(df_answers))
+    items = list(cube.items)
+    os.makedirs(wave_dir, exist_ok=True)
+    wave_file = getWaveFile(wave, wave_dir)
+    # weighted counts are kept as they are; whole counts in the smallest type that holds them
+    counts = cube.counts if cube.counts.dtype.kind == 'f' else cube.counts.astype(getSmallestIntType(0, cube.counts.max(initial=0)))
+    # a weighted wave also keeps its number of respondents
+    respondents = {} if cube.respondents is None else {'respondents': cube.respondents.astype(getSmallestIntType(0, cube.respondents.max(initial=0)))}
+    # write to a temporary file first so that a half written wave is never read
+    with open(f'{wave_file}.tmp', 'wb') as f:
+        np.savez_compressed(f, counts=counts, groups=np.array(cube.groups),
+                            items=np.array(items), ranges=np.array([cube.items[item] for item in items], dtype=np.int64).reshape(-1, 2),
+                            labels=json.dumps({'labels': labels, 'titles': titles}), **respondents)
+    os.replace(f'{wave_file}.tmp', wave_file)
+
+# read a stored wave
+def readWave(wave, wave_dir=default_wave_dir):
+    with np.load(getWaveFile(wave, wave_dir)) as data:
+        items = {item: tuple(int(i) for i in item_range) for item, item_range in zip(data['items'].tolist(), data['ranges'])}
+        counts = data['counts']
+        respondents = data['respondents'].astype(np.int64) if 'respondents' in data else None
+        cube = CountCube(counts if counts.dtype.kind == 'f' else counts.astype(np.int64), data['groups'].tolist(), items, respondents)
+        labels = json.loads(str(data['labels']))
+    return Wave(wave, cube, labels['labels'], labels['titles'])
+
+# get the counts of each answer of a question (by its name across waves) for a group in every stored wave that has both;
+# returns an (answer x wave) dataframe of counts, with answers in the order they first appear, and the chart title of the question.
+# With respondents, the numbers of respondents instead of the (possibly weighted) counts
+def getTrendCounts(waves, item, group, question_map, respondents=False):
+    columns, title = {}, item
+    for wave in waves:
+        wave_map = question_map.get(wave.name, {})
+        for wave_item in wave.cube.items:
+            canonical, renames = getCanonicalItem(wave_item, wave_map)
+            if canonical != item or group not in wave.cube.groups or wave_item not in wave.labels:
+                continue
+            answers = [renames.get(answer, answer) for answer in wave.labels[wave_item]]
+            counts = wave.cube.getRespondents(group, wave_item) if respondents else wave.cube.getCounts(group, wave_item)
+            columns[wave.name] = pd.Series(counts, index=answers)
+            title = wave.titles[wave_item]
+    if len(columns) == 0:
+        return pd.DataFrame(), title
+    # answers that were not asked in a wave are left empty (NaN), not counted as 0
+    answers = list(dict.fromkeys(answer for counts in columns.values() for answer in counts.index))
+    return pd.DataFrame(columns).reindex(answers), title
+
+# get the names across waves of every stored item that belongs to one of the questions (matrix questions match all of their statements)
+def getTrendItems(waves, question_list, question_map):
+    items = []
+    for wave in waves:
+        wave_map = question_map.get(wave.name, {})
+        for wave_item in wave.cube.items:
+            canonical, _ = getCanonicalItem(wave_item, wave_map)
+            if canonical not in items and any(canonical == q or canonical == f'{q}_' or canonical.startswith(f'{q.rstrip("_")}_') for q in question_list):
+                items.append(canonical)
+    return items
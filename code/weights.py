@@ -0,0 +1,67 @@
+import numpy as np, pandas as pd
+from countCube import encodeSurvey
+from schema import SurveySchema, compileAnswerKey
+
+# raking stops once every share of every raked question is within this of its target share, or after max_rake_iterations passes
+rake_tolerance = 1e-6
+max_rake_iterations = 100
+
+# HELPER FUNCTIONS FOR WEIGHTS
+# read the margin file as a pandas dataframe: one row per Question and Answer (a label from the answer file) with the Population of that
+# answer, as a count or a share (e.g. the number of students, staff and faculty in each role of Q58); only single choice questions can be raked
+def readMarginFile(margin_file):
+    return pd.read_csv(margin_file, sep=',', header=0)
+
+# get the margins of the raked questions from the margin file: (column of the encoded codes, target share of each answer) for each question
+def getMargins(encoded, schema, df_margins):
+    margins = []
+    for q, df_question in df_margins.groupby('Question', sort=False):
+        if q not in schema or schema[q].kind != 'single' or q not in encoded.columns:
+            raise ValueError(f'Margins can only be given for single choice questions in the data: {q}')
+        labels = list(schema[q].labels)
+        unknown = [answer for answer in df_question['Answer'] if answer not in labels]
+        if unknown:
+            raise ValueError(f'Unknown answers for {q} in the margin file: {", ".join(unknown)}')
+        targets = np.zeros(len(labels))
+        targets[[labels.index(answer) for answer in df_question['Answer']]] = df_question['Population'].to_numpy(dtype=float)
+        column = encoded.columns.index(q)
+        # an answer of the population that no respondent gave can't be weighted up to its share
+        answers = encoded.codes[:, column]
+        missing = [labels[i] for i in np.nonzero((targets > 0) & (np.bincount(answers[answers >= 0], minlength=len(labels)) == 0))[0]]
+        if missing:
+            raise ValueError(f'No respondent answered {", ".join(missing)} to {q}, so its margin can\'t be met')
+        margins.append((column, targets / targets.sum()))
+    return margins
+
+# rake the weight of every respondent to the margins by iterative proportional fitting: each pass scales the weights of the respondents who
+# gave each answer of a raked question so that the answer has its target share, from one weighted bincount per question. Respondents who
+# didn't answer a raked question keep their weight for it. The weights are scaled to average 1, so weighted counts stay on the scale of the
+# number of respondents
+def rakeWeights(codes, margins, tolerance=rake_tolerance, max_iterations=max_rake_iterations):
+    weights = np.ones(codes.shape[0])
+    # the respondents who answered each raked question and their answers, found once instead of every pass
+    answered = []
+    for column, targets in margins:
+        rows = np.flatnonzero(codes[:, column] >= 0)
+        answered.append((rows, codes[rows, column].astype(np.int64), targets))
+    for _ in range(max_iterations):
+        error = 0
+        for rows, answers, targets in answered:
+            totals = np.bincount(answers, weights[rows], minlength=len(targets))
+            shares = totals / totals.sum()
+            error = max(error, np.abs(shares - targets).max())
+            with np.errstate(invalid='ignore', divide='ignore'):
+                factors = np.where(totals > 0, targets / shares, 0)
+            weights[rows] *= factors[answers]
+        if error < tolerance:
+            break
+    return weights * len(weights) / weights.sum()
+
+# DRIVER FUNCTIONS FOR WEIGHTS
+# get the weight of every respondent of the data (a dataframe or CompactSurvey), raked to the population margins of the margin file;
+# only the raked questions are encoded
+def getSurveyWeights(df, df_answers, df_margins):
+    schema = compileAnswerKey(df_answers)
+    raked = SurveySchema({q: schema[q] for q in df_margins['Question'].unique() if q in schema})
+    encoded = encodeSurvey(df, raked)
+    return rakeWeights(encoded.codes, getMargins(encoded, schema, df_margins))